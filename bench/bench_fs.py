@@ -0,0 +1,219 @@
+"""
+Benchmark of the fs backends and the non-AI stages of the analysis.
+
+Generates synthetic repositories (deep and wide trees, large binaries, nested archives), packages each one as a
+directory, zip, tar, tar.gz and a local bare git repository, and measures for every backend:
+
+- open: `open_target` time (for git, the partial clone)
+- ls / cat: latency percentiles in milliseconds, `ls` over every folder during a full walk, `cat` over a sample of files
+- walk: time to list every file through `ls`, one folder at a time; bulk_walk: the same with the backend's `walk`
+- read_many: time to read every text file with `read_many`
+- static / scan: time of the static manifest analysis and of the hardcoded address scan
+- peak_rss_mb: peak resident memory of the process that did all of the above
+
+Every backend runs in a fresh process so peak memory is its own. Results are written as JSON.
+
+    python -m bench.bench_fs --sizes 1000 50000 250000 --output results.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+import zipfile
+
+from bench.bench_scan import HIT_LINES, HIT_RATE, LINES
+
+BACKENDS = ['dir', 'zip', 'tar', 'tar.gz', 'git']
+SHAPES = ['wide', 'deep']
+CAT_SAMPLE = 200
+BINARY_SIZE = 8 * 1024 * 1024
+DEEP_LEVELS = 12
+WIDE_FOLDERS = 20
+MANIFESTS = {
+    'requirements.txt': 'flask==3.0.0\ngunicorn\n',
+    'package.json': '{"name": "bench", "scripts": {"start": "node server.js"}, "dependencies": {"express": "^4"}}\n',
+    'Dockerfile': 'FROM python:3.11-slim\nEXPOSE 8000\nCMD ["gunicorn", "app:app"]\n',
+}
+
+
+def _folder(i: int, shape: str) -> str:
+    if shape == 'deep':
+        return '/'.join(f'level{j}_{(i >> j) & 1}' for j in range(DEEP_LEVELS))
+    return f'pkg{i % WIDE_FOLDERS}'
+
+
+def _write(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def generate(root: str, files: int, shape: str, binaries: int = 2, seed: int = 0) -> str:
+    """Write a synthetic repository of `files` text files (plus manifests, binaries and nested archives) to `root`."""
+    rng = random.Random(seed)
+    for name, content in MANIFESTS.items():
+        _write(os.path.join(root, name), content.encode())
+    for i in range(files):
+        text = ''.join(rng.choice(HIT_LINES if rng.random() < HIT_RATE else LINES) for _ in range(rng.randint(5, 40)))
+        _write(os.path.join(root, _folder(i, shape), f'file{i}.txt'), text.encode())
+    for i in range(binaries):
+        _write(os.path.join(root, 'assets', f'blob{i}.bin'), rng.randbytes(BINARY_SIZE))
+    nested = os.path.join(root, 'assets', 'vendor.zip')
+    with zipfile.ZipFile(nested, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for i in range(100):
+            zf.writestr(f'vendor/lib{i}/index.js', LINES[1] * 20)
+        with open(os.path.join(root, 'requirements.txt'), 'rb') as f:
+            zf.writestr('vendor/requirements.txt', f.read())
+    with tarfile.open(os.path.join(root, 'assets', 'vendor.tar.gz'), 'w:gz') as tf:
+        tf.add(nested, 'vendor.zip')
+    return root
+
+
+def package(root: str, out: str, backend: str) -> str:
+    """Package the repository at `root` for `backend`, returns the target to open."""
+    name = os.path.basename(root)
+    if backend == 'dir':
+        return root
+    if backend == 'zip':
+        return shutil.make_archive(os.path.join(out, name), 'zip', os.path.dirname(root), name)
+    if backend in ('tar', 'tar.gz'):
+        path = os.path.join(out, f'{name}.{backend}')
+        with tarfile.open(path, 'w:gz' if backend == 'tar.gz' else 'w') as tf:
+            tf.add(root, name)
+        return path
+    if backend == 'git':
+        work = os.path.join(out, name + '-work')
+        bare = os.path.join(out, name + '.git')
+        git = ['git', '-c', 'user.name=bench', '-c', 'user.email=bench@example.com', '-C', work]
+        shutil.copytree(root, work)
+        subprocess.run(git + ['init', '-q'], check=True)
+        subprocess.run(git + ['add', '.'], check=True)
+        subprocess.run(git + ['commit', '-qm', 'bench'], check=True)
+        subprocess.run(['git', 'clone', '-q', '--bare', work, bare], check=True)
+        subprocess.run(['git', '-C', bare, 'config', 'uploadpack.allowFilter', 'true'], check=True)
+        shutil.rmtree(work)
+        return 'file://' + bare
+    raise ValueError(f'Unknown backend {backend}')
+
+
+def percentiles(samples: list) -> dict:
+    if not samples:
+        return {}
+    samples = sorted(samples)
+
+    def pick(p):
+        return samples[min(len(samples) - 1, int(p / 100 * len(samples)))]
+
+    return {'count': len(samples), 'p50': round(pick(50) * 1000, 3), 'p90': round(pick(90) * 1000, 3),
+            'p99': round(pick(99) * 1000, 3), 'max': round(samples[-1] * 1000, 3)}
+
+
+def measure(target: str, seed: int = 0) -> dict:
+    """Open `target` and time its backend, meant to run in a fresh process."""
+    import resource
+    from deployflow.core.analysis import scan
+    from deployflow.core.analysis.fs import open_target, walk
+    from deployflow.core.analysis.static import static_analysis
+
+    cwd = tempfile.mkdtemp()  # the git backend clones into the working directory
+    os.chdir(cwd)
+    try:
+        start = time.perf_counter()
+        source = open_target(target)
+        ls, cat = source.ls, source.cat
+        result = {'open': round(time.perf_counter() - start, 3)}
+        try:
+            ls_times = []
+
+            def timed_ls(subdir=None):
+                start = time.perf_counter()
+                items = ls(subdir)
+                ls_times.append(time.perf_counter() - start)
+                return items
+
+            start = time.perf_counter()
+            paths = list(walk(timed_ls))
+            result['walk'] = round(time.perf_counter() - start, 3)
+            result['files'] = len(paths)
+            result['ls'] = percentiles(ls_times)
+            start = time.perf_counter()
+            assert len(list(source.walk())) == len(paths)
+            result['bulk_walk'] = round(time.perf_counter() - start, 3)
+
+            cat_times = []
+            texts = [path for path in paths if path.endswith('.txt')]
+            for path in random.Random(seed).sample(texts, min(CAT_SAMPLE, len(texts))):
+                start = time.perf_counter()
+                cat(path)
+                cat_times.append(time.perf_counter() - start)
+            result['cat'] = percentiles(cat_times)
+            start = time.perf_counter()
+            for _ in source.read_many(texts):
+                pass
+            result['read_many'] = round(time.perf_counter() - start, 3)
+
+            start = time.perf_counter()
+            static_analysis(ls, cat)
+            result['static'] = round(time.perf_counter() - start, 3)
+            start = time.perf_counter()
+            result['hits'] = len(scan.scan(source))
+            result['scan'] = round(time.perf_counter() - start, 3)
+        finally:
+            source.close()
+    finally:
+        shutil.rmtree(cwd, ignore_errors=True)
+    # children of the scan's process pool are not included
+    result['peak_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000], help='number of text files per repository')
+    parser.add_argument('--shapes', nargs='+', default=SHAPES, choices=SHAPES)
+    parser.add_argument('--backends', nargs='+', default=BACKENDS, choices=BACKENDS)
+    parser.add_argument('--binaries', type=int, default=2, help=f'{BINARY_SIZE >> 20} MiB binaries per repository')
+    parser.add_argument('--output', help='write the JSON results to this file instead of stdout')
+    parser.add_argument('--measure', metavar='TARGET', help=argparse.SUPPRESS)  # one backend, in a fresh process
+    args = parser.parse_args()
+    if args.measure:
+        print(json.dumps(measure(args.measure)))
+        return
+
+    results = {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+               'cat_sample': CAT_SAMPLE, 'runs': []}
+    tmp = tempfile.mkdtemp()
+    try:
+        for size in args.sizes:
+            for shape in args.shapes:
+                root = generate(os.path.join(tmp, f'repo-{shape}-{size}'), size, shape, args.binaries)
+                for backend in args.backends:
+                    start = time.perf_counter()
+                    target = package(root, tmp, backend)
+                    packaging = round(time.perf_counter() - start, 3)
+                    child = subprocess.run([sys.executable, '-m', 'bench.bench_fs', '--measure', target],
+                                           capture_output=True, text=True, check=True)
+                    run = json.loads(child.stdout.splitlines()[-1])
+                    results['runs'].append({'size': size, 'shape': shape, 'backend': backend, 'package': packaging,
+                                            **run})
+                    print(f'{size} {shape} {backend}: {json.dumps(run)}', file=sys.stderr)
+                shutil.rmtree(root)
+    finally:
+        shutil.rmtree(tmp)
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Benchmark of the hardcoded address scanner.
+
+Generates a synthetic repository and times `scan.scan` on it as a directory (memory-mapped worker processes) and as a
+zip file (read through the backend).
+
+    python -m bench.bench_scan --files 100000
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from deployflow.core.analysis import scan
+from deployflow.core.analysis.fs import open_target
+
+LINES = [
+    "def handler(request):\n    return render(request, 'index.html', {'items': items[:10]})\n",
+    "const x = require('./util');\nmodule.exports = function () { return x(1, 2.5); };\n",
+    "body { margin: 0; padding: 0 1.5em; font-family: sans-serif; color: #333; }\n",
+    "# Documentation\n\nInstall version 1.2.3 and run the tests before sending a pull request.\n",
+]
+HIT_LINES = [
+    "See https://example.com/docs for details.\n",
+    "fetch('http://localhost:5000/api/items').then(r => r.json());\n",
+    "DATABASE_HOST = '10.0.0.12:5432'\n",
+]
+HIT_RATE = 0.01
+
+
+def generate(root: str, files: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    for i in range(files):
+        folder = os.path.join(root, f"pkg{i % 97}", f"mod{i % 13}")
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, f"file{i}.txt"), "w") as f:
+            f.write("".join(rng.choice(HIT_LINES if rng.random() < HIT_RATE else LINES)
+                            for _ in range(rng.randint(5, 40))))
+    return root
+
+
+def bench(target: str, workers: int = None) -> dict:
+    start = time.perf_counter()
+    with open_target(target) as source:
+        hits = scan.scan(source, workers)
+    return {"seconds": round(time.perf_counter() - start, 3), "hits": len(hits)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=100_000)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--zip", action="store_true", help="also benchmark the zip backend")
+    args = parser.parse_args()
+    tmp = tempfile.mkdtemp()
+    try:
+        root = generate(os.path.join(tmp, "repo"), args.files)
+        results = {"files": args.files, "workers": args.workers or os.cpu_count(),
+                   "dir": bench(root, args.workers)}
+        if args.zip:
+            archive = shutil.make_archive(os.path.join(tmp, "repo"), "zip", root)
+            results["zip"] = bench(archive, args.workers)
+        print(json.dumps(results, indent=2))
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,4 +2,10 @@ __version__ = "0.0.1"
 __author__ = "Yun"
 __email__ = "yun@yun.ng"
 
-from .cli import app
+
+def __getattr__(name):
+    # the CLI (typer) is only imported when asked for, importing a submodule stays cheap
+    if name == 'app':
+        from .cli import app
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
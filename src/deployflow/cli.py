@@ -1,15 +1,16 @@
-import logging
-from datetime import datetime
+import os
+import time
 
 import typer
 from typing import Optional
 
-from deployflow.core import colors
-from deployflow.logger import logger
+from deployflow.core import colors, console, trace
 
+# plain help: rich formatting alone costs more than everything else --help imports, see test/test_startup.py.
+# Everything else is imported by the command that needs it.
 app = typer.Typer(help="""
 AI AutoDeployment System
-""", rich_markup_mode="rich", add_completion=True)
+""", rich_markup_mode=None, add_completion=True)
 
 
 @app.callback(invoke_without_command=True, no_args_is_help=True)
@@ -17,6 +18,10 @@ def default():
     pass
 
 
+evidence_app = typer.Typer(help="Stored analysis runs: list, show, diff and prune", no_args_is_help=True)
+app.add_typer(evidence_app, name="evidence", rich_help_panel="Evidence store")
+
+
 @app.command(rich_help_panel="AI assisted deployment")
 def deploy(
         command: str = typer.Argument(
@@ -31,13 +36,59 @@ def deploy(
         evidence_file: Optional[str] = typer.Option(
             None,
             "--evidence-file", '-e',
-            help="Path to AI analysis evidence file"
+            help="Path to AI analysis evidence file, or the id of a stored analysis run"
         ),
         analyze: bool = typer.Option(
             False,
             "--analyze-only",
             help="Only analyze and repository, do not deploy"
         ),
+        no_cache: bool = typer.Option(
+            False,
+            "--no-cache",
+            help="Analyze and generate the deployment files from scratch instead of reusing cached results"
+        ),
+        cassette: Optional[str] = typer.Option(
+            None,
+            "--cassette",
+            help="Record AI responses to / replay them from this file"
+        ),
+        cassette_mode: str = typer.Option(
+            "replay",
+            "--cassette-mode",
+            help="Cassette mode: record, replay or passthrough"
+        ),
+        cassette_fallback: bool = typer.Option(
+            False,
+            "--cassette-fallback",
+            help="Replay requests missing from the cassette with the response recorded at the same position"
+        ),
+        batch: Optional[str] = typer.Option(
+            None,
+            "--batch",
+            help="Deploy every job of this manifest (YAML or JSON) concurrently, see README"
+        ),
+        workers: Optional[int] = typer.Option(
+            None,
+            "--workers",
+            help="Batch jobs running at once, overrides the manifest"
+        ),
+        policy_file: Optional[str] = typer.Option(
+            None,
+            "--policy",
+            help="Approval policy file: allowed and denied commands, answers to the analysis, deployment directory"
+        ),
+        non_interactive: bool = typer.Option(
+            False,
+            "--non-interactive",
+            help="Never prompt, use the defaults of questions and fail at once on anything the policy does not allow "
+                 "or answer"
+        ),
+        trace_file: Optional[str] = typer.Option(
+            None,
+            "--trace",
+            help="Write a timing trace of the run to this file (Chrome trace JSON and JSON lines) and print a summary"
+        ),
         # dry_run: bool = typer.Option(
         #     False,
         #     "--dry-run",
@@ -48,45 +99,155 @@ def deploy(
         ),
 ):
     if verbose:
+        import logging
+        from deployflow.logger import logger
         logger.setLevel(logging.DEBUG)
         logger.debug("Verbose mode enabled")
+    if cassette:
+        from deployflow.core.ai import use_cassette
+        use_cassette(cassette, cassette_mode, cassette_fallback)
+    if policy_file:
+        from deployflow.core.policy import use_policy
+        use_policy(policy_file)
+    if non_interactive:
+        console.set_interactive(False)
+    if batch:
+        from deployflow.core.batch import run_batch
+        with trace.run(trace_file):
+            results = run_batch(batch, not no_cache, workers)
+        if not all(result.ok for result in results):
+            raise typer.Exit(1)
+        return
     if not command:
-        command = input("What would you like to do?: ")
+        command = console.ask("What would you like to do?: ")
         if not command:
             typer.echo("No command specified, exiting")
             raise typer.Exit()
     if not repo:
-        repo = input("Enter repository path/URL/file path/folder path (.): ") or "."
-    _deploy_app(command, repo, analyze, evidence_file)
+        repo = console.ask("Enter repository path/URL/file path/folder path (.): ", ".")
+    _deploy_app(command, repo, analyze, evidence_file, not no_cache, trace_file)
+
 
+def _deploy_app(command: str, repo: str, analyze: bool, evidence_file: str = None, use_cache: bool = True,
+                trace_file: str = None):
+    with trace.run(trace_file):
+        _run_app(command, repo, analyze, evidence_file, use_cache)
 
-def _deploy_app(command: str, repo: str, analyze: bool, evidence_file: str = None):
+
+def _run_app(command: str, repo: str, analyze: bool, evidence_file: str = None, use_cache: bool = True):
+    from deployflow.core.utils import fatal
+    from deployflow.logger import logger
     # Implementation placeholder
     logger.debug(f"Would deploy {repo} with command: {command}")
     if analyze:
         logger.debug("Analyze only mode enabled - no deployment made")
-    if evidence_file:
+    from deployflow.core.analysis.store import EvidenceStore, revision
+    store, run_id = EvidenceStore(), None
+    if evidence_file and evidence_file.lstrip('#').isdigit() and not os.path.exists(evidence_file):
+        run = store.run(int(evidence_file.lstrip('#')))
+        if not run:
+            fatal(f"No stored analysis run {evidence_file}, see `deployflow evidence list`")
+        print(colors.BOLD + f"Using the evidence of run {run}" + colors.ENDC)
+        evidences, run_id = run.evidences, run.id
+    elif evidence_file:
         logger.debug(f"Using evidence file {evidence_file}")
         print(colors.BOLD + f"Using evidence file {evidence_file}" + colors.ENDC)
         with open(evidence_file, "r") as f:
             import json
             evidences = json.load(f)
     else:
-        from deployflow.core.analysis.analyze import analyze_repository
-        evidences = analyze_repository(repo, command)
-        if not evidences["target"]:
-            evidences["target"] = input("Enter deployment target (aws): ") or 'aws'
-        evidences['target'] = evidences['target'].lower()
-        logger.debug(f"analysis complete")
-        print(colors.BOLD + "Analysis complete" + colors.ENDC)
-        evidence_file = "evidences_" + ''.join(c for c in (repo + str(datetime.now())) if c.isalnum()) + ".json"
-        with open(evidence_file, "w") as f:
-            import json
-            print(f'\t{colors.YELLOW}AI Analysis results saved to {evidence_file}{colors.ENDC}')
-            f.write(json.dumps(evidences, indent=2))
+        with trace.span('revision', 'phase', target=repo):
+            current = revision(repo)
+        run = store.get(repo, current, command) if use_cache else None
+        if run:
+            print(colors.BOLD + f"Repository unchanged since run #{run.id}, reusing its evidence" + colors.ENDC)
+            evidences, run_id = run.evidences, run.id
+        else:
+            from deployflow.core.analysis.analyze import analyze_repository
+            from deployflow.core.policy import get_policy
+            start = time.perf_counter()
+            with trace.span('analysis', 'phase', target=repo):
+                evidences = analyze_repository(repo, command, use_cache)
+            duration = time.perf_counter() - start
+            evidences["target"] = evidences["target"] or get_policy().target
+            if not evidences["target"]:
+                with trace.span('deployment target', 'user'):
+                    evidences["target"] = console.ask("Enter deployment target (aws): ", 'aws')
+            evidences['target'] = evidences['target'].lower()
+            logger.debug(f"analysis complete")
+            print(colors.BOLD + "Analysis complete" + colors.ENDC)
+            run_id = store.put(repo, current, command, evidences, duration)
+            print(f'\t{colors.YELLOW}AI Analysis results saved as run #{run_id} (deployflow evidence list)'
+                  f'{colors.ENDC}')
     from deployflow.core.deployment.ai_deployer import deploy_target
-    deploy_target(repo, command, evidences)
+    deployed = False
+    try:
+        with trace.span('deployment', 'phase', target=repo):
+            deployed = deploy_target(repo, command, evidences, reuse=use_cache)
+    finally:
+        if run_id:
+            store.set_status(run_id, 'deployed' if deployed else 'failed')
+
+
+@evidence_app.command("list")
+def evidence_list(
+        repo: Optional[str] = typer.Option(None, "--repo", "-r", help="Only the runs of this repository"),
+        limit: int = typer.Option(50, "--limit", "-n", help="Number of runs to list, latest first"),
+):
+    """List stored analysis runs."""
+    from deployflow.core.analysis.store import EvidenceStore
+    runs = EvidenceStore().runs(repo, limit)
+    if not runs:
+        typer.echo("No stored analysis runs")
+    for run in runs:
+        typer.echo(str(run))
+
+
+@evidence_app.command("show")
+def evidence_show(run_id: int = typer.Argument(..., help="Run id, see `deployflow evidence list`")):
+    """Print the evidence of a run as JSON (usable with --evidence-file)."""
+    import json
+    from deployflow.core.analysis.store import EvidenceStore
+    run = EvidenceStore().run(run_id)
+    if not run:
+        typer.echo(f"No stored analysis run {run_id}")
+        raise typer.Exit(1)
+    typer.echo(json.dumps(run.evidences, indent=2))
+
 
+@evidence_app.command("diff")
+def evidence_diff(
+        old: int = typer.Argument(..., help="Run id"),
+        new: int = typer.Argument(..., help="Run id"),
+):
+    """Show what the evidence of run NEW adds, removes and changes compared to run OLD."""
+    from deployflow.core.analysis.store import EvidenceStore, diff
+    store = EvidenceStore()
+    runs = [store.run(old), store.run(new)]
+    for run_id, run in zip((old, new), runs):
+        if not run:
+            typer.echo(f"No stored analysis run {run_id}")
+            raise typer.Exit(1)
+    typer.echo(f"--- {runs[0]}\n+++ {runs[1]}")
+    lines = diff(runs[0].evidences, runs[1].evidences)
+    for line in lines:
+        color = {'+': colors.GREEN, '-': colors.RED}.get(line[0], colors.YELLOW)
+        typer.echo(color + line + colors.ENDC)
+    if not lines:
+        typer.echo("Same evidence")
+
+
+@evidence_app.command("prune")
+def evidence_prune(
+        keep: Optional[int] = typer.Option(None, "--keep", help="Runs to keep per repository and task, latest first"),
+        older_than: Optional[float] = typer.Option(None, "--older-than", help="Delete runs older than this many days"),
+):
+    """Delete stored analysis runs."""
+    from deployflow.core.analysis.store import EvidenceStore
+    if keep is None and older_than is None:
+        typer.echo("Pass --keep and/or --older-than")
+        raise typer.Exit(1)
+    typer.echo(f"Deleted {EvidenceStore().prune(keep, older_than)} runs")
 
 if __name__ == "__main__":
     app()
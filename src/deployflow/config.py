@@ -1,14 +1,22 @@
-import configparser
 import os
 from datetime import datetime
 from pathlib import Path
 
 INI_PATH = os.path.join(Path.home(), '.deployflow.ini')
 
-config = configparser.ConfigParser()
-config.read(INI_PATH)
+config = None  # read on first use, so that importing the package never touches the file
+
+
+def _load():
+    global config
+    if config is None:
+        import configparser
+        config = configparser.ConfigParser()
+        config.read(INI_PATH)
+    return config
 
 def save():
+    _load()
     if 'misc' not in config:
         config['misc'] = {}
     config['misc']['last_saved'] = str(datetime.now())
@@ -16,11 +24,11 @@ def save():
         config.write(f)
 
 def get_val(section, key, default=None):
-    return config.get(section, key, fallback=default)
+    return _load().get(section, key, fallback=default)
 
 def set_val(section, key, value):
+    _load()
     if section not in config:
         config[section] = {}
     config[section][key] = value
     save()
-
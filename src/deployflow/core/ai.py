@@ -1,9 +1,244 @@
+"""
+Chat client shared by the analysis and the deployment.
+
+`get_ai` returns an `AIClient` wrapping a single `AsyncOpenAI` client that runs on a background event loop, so every
+call, from any thread, reuses the same pooled connections. Calls are limited to `max_concurrency` at a time, time out
+after `timeout` seconds, and are retried with jittered exponential backoff on rate limits, server errors, timeouts and
+dropped connections. Responses are always streamed, `on_token` receives the text as it arrives.
+
+Settings are read from the `[ai]` section of the config file.
+
+`use_cassette` puts a `Cassette` in front of the client, it records request/response pairs to a file and replays them,
+so analysis and deployment runs can be repeated offline and deterministically.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from typing import Callable, Dict, List
+
 from deployflow import config
+from deployflow.core import console, trace
+from deployflow.logger import logger
+
+MODEL = "deepseek-chat"
+MAX_CONCURRENCY = 4
+TIMEOUT = 120  # seconds per attempt, streaming included
+MAX_RETRIES = 4
+BACKOFF = 1.0  # seconds, the upper bound of the jittered delay doubles on every retry
+MAX_BACKOFF = 30.0
 
 _client = None
+_cassette = None
+_max_concurrency = None
+
+
+class AIClient:
+    def __init__(self, api_key: str, endpoint: str, max_concurrency: int = None, timeout: float = None,
+                 max_retries: int = None, backoff: float = BACKOFF):
+        from openai import AsyncOpenAI
+        self.max_concurrency = max_concurrency or int(config.get_val('ai', 'max_concurrency', MAX_CONCURRENCY))
+        self.timeout = timeout or float(config.get_val('ai', 'timeout', TIMEOUT))
+        self.max_retries = int(config.get_val('ai', 'max_retries', MAX_RETRIES)) if max_retries is None \
+            else max_retries
+        self.backoff = backoff
+        self._semaphore = None  # created on the client loop
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name='deployflow-ai', daemon=True).start()
+        # retries are ours, so a stream that already delivered tokens is never silently restarted
+        self._client = AsyncOpenAI(api_key=api_key, base_url=endpoint, max_retries=0, timeout=self.timeout)
+
+    async def _stream(self, messages, model, on_token, received, stats, kwargs) -> str:
+        start = time.perf_counter()
+        stream = await self._client.chat.completions.create(model=model, messages=messages, stream=True,
+                                                            stream_options={'include_usage': True}, **kwargs)
+        try:
+            async for chunk in stream:
+                if getattr(chunk, 'usage', None):
+                    logger.debug(chunk.usage)
+                    stats['prompt_tokens'] = chunk.usage.prompt_tokens
+                    stats['completion_tokens'] = chunk.usage.completion_tokens
+                if chunk.choices and chunk.choices[0].delta.content:
+                    text = chunk.choices[0].delta.content
+                    if not received:
+                        stats['first_token_ms'] = round((time.perf_counter() - start) * 1000)
+                    received.append(text)
+                    if on_token:
+                        on_token(text)
+        finally:
+            await stream.close()
+        return ''.join(received)
+
+    async def _complete(self, messages, model, on_token, kwargs) -> str:
+        from openai import APIConnectionError, InternalServerError, RateLimitError
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            attempt = 0
+            while True:
+                received = []
+                try:
+                    with trace.span('chat', 'llm', model=model, attempt=attempt) as stats:
+                        return await asyncio.wait_for(
+                            self._stream(messages, model, on_token, received, stats, kwargs), self.timeout)
+                except (RateLimitError, InternalServerError, APIConnectionError, asyncio.TimeoutError) as e:
+                    if received or attempt >= self.max_retries:
+                        raise
+                    delay = random.uniform(0, min(self.backoff * 2 ** attempt, MAX_BACKOFF))
+                    retry_after = getattr(getattr(e, 'response', None), 'headers', {}).get('retry-after')
+                    if retry_after and retry_after.isdigit():
+                        delay = max(delay, min(float(retry_after), MAX_BACKOFF))
+                    attempt += 1
+                    logger.debug(f"ai call failed ({type(e).__name__}), retry {attempt} in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+
+    async def acomplete(self, messages: List[Dict[str, str]], on_token: Callable[[str], None] = None,
+                        model: str = MODEL, **kwargs) -> str:
+        """
+        Stream a chat completion and return its text, awaitable from any event loop.
+
+        Args:
+            messages (list): Chat messages.
+            on_token (callable): Called with every piece of text as it arrives, from the client's event loop thread.
+            model (str): Model name.
+            **kwargs: Passed to `chat.completions.create`, e.g. max_tokens or response_format.
+        """
+        future = asyncio.run_coroutine_threadsafe(self._complete(messages, model, on_token, kwargs), self._loop)
+        return await asyncio.wrap_future(future)
+
+    def complete(self, messages: List[Dict[str, str]], on_token: Callable[[str], None] = None, model: str = MODEL,
+                 **kwargs) -> str:
+        """Blocking version of `acomplete`, safe to call from several threads at once."""
+        return asyncio.run_coroutine_threadsafe(self._complete(messages, model, on_token, kwargs), self._loop).result()
+
+
+class CassetteMiss(LookupError):
+    pass
+
+
+class Cassette:
+    """
+    Record/replay layer with the interface of `AIClient`.
+
+    Interactions are keyed by a hash of the model and the normalized messages. Modes:
+
+    - record: every call goes to the AI and its response is stored, replacing a previous one for the same request.
+    - replay: every call is answered from the cassette, the AI is never contacted. A request that was not recorded
+      raises `CassetteMiss`, so a changed prompt never replays a stale response.
+    - passthrough: every call goes to the AI, nothing is stored.
+
+    Prompts of the deployment include command output, which is rarely identical twice. With `fallback`, a request that
+    was not recorded is answered with the interaction recorded at the same position of the run instead, with a
+    warning.
+
+    Args:
+        path (str): Cassette file (JSON).
+        mode (str): record, replay or passthrough.
+        client (callable): Returns the client to forward calls to, only called when a call needs it.
+        fallback (bool): Replay unrecorded requests by position.
+    """
+
+    MODES = ('record', 'replay', 'passthrough')
+
+    def __init__(self, path: str, mode: str = 'replay', client: Callable[[], AIClient] = None,
+                 fallback: bool = False):
+        if mode not in self.MODES:
+            raise ValueError(f"Invalid cassette mode {mode!r}, expected one of {', '.join(self.MODES)}")
+        self.path = path
+        self.mode = mode
+        self.fallback = fallback
+        self._client = client
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._interactions, self._order = {}, []
+        if mode != 'passthrough' and os.path.exists(path):
+            with open(path, 'r', encoding='utf8') as f:
+                data = json.load(f)
+            self._interactions, self._order = data['interactions'], data['order']
+        if mode == 'record':
+            self._order = []  # the order of this run replaces the recorded one
+
+    @staticmethod
+    def key(model: str, messages: List[Dict[str, str]]) -> str:
+        normalized = [{'role': message['role'],
+                       'content': '\n'.join(line.rstrip() for line in message['content'].strip().splitlines())}
+                      for message in messages]
+        return hashlib.sha256(json.dumps([model, normalized]).encode('utf8')).hexdigest()
+
+    def _replay(self, key: str, position: int) -> str:
+        if key in self._interactions:
+            return self._interactions[key]['response']
+        if self.fallback and position < len(self._order):
+            logger.warning(f"cassette has no recording of request {key}, replaying call {position} of the run")
+            return self._interactions[self._order[position]]['response']
+        raise CassetteMiss(f"No recorded response for request {key} (call {position} of the run) in {self.path}")
+
+    def _record(self, key: str, model: str, messages, response: str):
+        with self._lock:
+            self._interactions[key] = {'model': model, 'messages': messages, 'response': response}
+            self._order.append(key)
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path + '.tmp', 'w', encoding='utf8') as f:
+                json.dump({'order': self._order, 'interactions': self._interactions}, f, indent=1)
+            os.replace(self.path + '.tmp', self.path)
+
+    def _next_position(self) -> int:
+        with self._lock:
+            self._calls += 1
+            return self._calls - 1
+
+    def complete(self, messages: List[Dict[str, str]], on_token: Callable[[str], None] = None, model: str = MODEL,
+                 **kwargs) -> str:
+        key, position = self.key(model, messages), self._next_position()
+        if self.mode == 'replay':
+            response = self._replay(key, position)
+            if on_token:
+                on_token(response)
+            return response
+        response = self._client().complete(messages, on_token=on_token, model=model, **kwargs)
+        if self.mode == 'record':
+            self._record(key, model, messages, response)
+        return response
+
+    async def acomplete(self, messages: List[Dict[str, str]], on_token: Callable[[str], None] = None,
+                        model: str = MODEL, **kwargs) -> str:
+        key, position = self.key(model, messages), self._next_position()
+        if self.mode == 'replay':
+            response = self._replay(key, position)
+            if on_token:
+                on_token(response)
+            return response
+        response = await self._client().acomplete(messages, on_token=on_token, model=model, **kwargs)
+        if self.mode == 'record':
+            self._record(key, model, messages, response)
+        return response
+
+
+def use_cassette(path: str, mode: str = 'replay', fallback: bool = False):
+    """Route every `get_ai` call through a cassette, pass None to stop."""
+    global _cassette
+    _cassette = Cassette(path, mode, _get_client, fallback) if path else None
+
+
+def limit(max_concurrency: int):
+    """Limit the AI calls running at once across the whole process, e.g. over every job of a batch."""
+    global _max_concurrency
+    _max_concurrency = max_concurrency
+    if _client:
+        _client.max_concurrency = max_concurrency
+        _client._semaphore = None  # recreated with the new limit by the next call
+
+
+def get_ai() -> AIClient | Cassette:
+    if _cassette:
+        return _cassette
+    return _get_client()
 
 
-def get_ai():
+def _get_client() -> AIClient:
     global _client
     if _client:
         return _client
@@ -11,14 +246,13 @@ def get_ai():
     endpoint = config.get_val("ai", "endpoint")
     if not api_key:
         print("AI Services require an API key.")
-        endpoint = input("Enter the AI API endpoint: (https://api.deepseek.com) ")
-        api_key = input("Enter the API key: ")
+        endpoint = console.ask("Enter the AI API endpoint: (https://api.deepseek.com) ")
+        api_key = console.ask("Enter the API key: ")
         if not endpoint: endpoint = "https://api.deepseek.com"
         if not api_key:
             raise ValueError("API key is required.")
         config.set_val("ai", "api_key", api_key)
         config.set_val("ai", "endpoint", endpoint)
 
-    from openai import OpenAI
-    _client = OpenAI(api_key=api_key, base_url=endpoint)
+    _client = AIClient(api_key, endpoint, max_concurrency=_max_concurrency)
     return _client
@@ -6,12 +6,20 @@ This module provides an AI-based analysis tool to extract deployment details fro
 This module does not write to the repository or execute any commands.
 """
 import json
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List
-from deployflow.core import colors
+from deployflow.core import colors, console, trace
 from deployflow.core.ai import get_ai
+from deployflow.core.analysis.budget import PromptBuilder
+from deployflow.core.analysis.evidence import apply_patch
 from deployflow.core.analysis.prompts import SYSTEM_PROMPT, INSTRUCTIONS
+from deployflow.core.policy import get_policy
 from deployflow.logger import logger
 
+READ_WORKERS = 8
+IMPORTANT_FILES = ['README', 'README.md', 'README.txt', 'Dockerfile']
+READ_INTRO = "Analyze the following directories and file contents for deployment evidence:"
+
 
 def _prompt_system(task):
     task = f"""
@@ -26,122 +34,166 @@ User specified task:
 """.strip()
 
 
-def _prompt_file_list(evidences, files, extra_files=None):
-    if extra_files is None:
-        extra_files = []
-    extra_files_p = ""
-    for name, content in extra_files:
-        extra_files_p += f"=== file: {name}\n{content}\n===\n"
+def _read_targets(ls: callable, cat: callable, targets: List[str]) -> tuple[dict, list]:
+    """
+    Read a batch of files and folders (ending with /) concurrently.
+
+    The important files of every listed folder are read along with the batch. Errors are returned in place of the
+    content so the AI can correct its request.
+
+    Returns:
+        tuple: Folder listings, and (name, content or exception) of every file read.
+    """
+
+    def call(fn, path):
+        try:
+            return fn(path)
+        except (OSError, KeyError, UnicodeDecodeError) as e:
+            return e
+
+    folders = [target for target in targets if not target or target.endswith('/')]
+    paths = [target for target in targets if target and not target.endswith('/')]
+    with ThreadPoolExecutor(READ_WORKERS) as pool:
+        contents = pool.map(call, [cat] * len(paths), paths)
+        listings = dict(zip(folders, pool.map(call, [ls] * len(folders), folders)))
+        important = [listing for listing in listings.values() if not isinstance(listing, Exception)]
+        important = [path for listing in important for path in listing
+                     if path.rsplit('/', 1)[-1] in IMPORTANT_FILES and path not in paths]
+        contents = list(zip(paths, contents)) + list(zip(important, pool.map(call, [cat] * len(important), important)))
+    return listings, contents
+
+
+def _prompt_recheck(changed_dirs):
+    dirs_p = f"\n=== folders with changed contents\n{json.dumps(changed_dirs)}" if changed_dirs else ""
     return f"""
-Analyze the following directory for deployment evidence:
-=== checked folders
-{'\n'.join(f'{key}: {json.dumps(value)}' for key, value in files.items())}
-===
-{extra_files_p}Current Evidence:
-{json.dumps(evidences, indent=2)}
-
-{INSTRUCTIONS}
+The repository was analyzed before, the evidence below is the result of that analysis.
+Only the following files and folders changed since then, re-check them and update the evidence:{dirs_p}
 """.strip()
 
 
-def _prompt_file_content(evidences, filename, file, files):
+def _prompt_rejected(rejected):
     return f"""
-Analyze file contents for deployment evidence:
-=== checked folders
-{'\n'.join(f'{key}: {json.dumps(value)}' for key, value in files.items())}
-=== file: {filename}
-{file}
-===
-Current Evidence
-{json.dumps(evidences, indent=2)}
-
-{INSTRUCTIONS}
+=== Your last patch had invalid operations, they were skipped:
+{chr(10).join(rejected)}
 """.strip()
 
 
-def _prompt_ans(evidences, question, answer):
+def _prompt_ans(question, answer):
     return f"""
 === You asked
 "{question}"
 === User response
 "{answer}"
-===
-Current Evidence
-{json.dumps(evidences, indent=2)}
-
-{INSTRUCTIONS}
 """.strip()
 
 
-def ai_analysis(evidences: Dict[str, List[str]], ls: callable, cat: callable, task: str) -> \
-        Dict[str, List[str]]:
+def ai_analysis(evidences: Dict[str, List[str]], ls: callable, cat: callable, task: str, steps: list = None,
+                changed: tuple[dict, list] = None) -> Dict[str, List[str]]:
+    """
+    Run the AI analysis loop.
+
+    Args:
+        evidences (dict): Evidence to start from.
+        ls (callable): Lists a directory of the target.
+        cat (callable): Reads a file of the target.
+        task (str): The task provided by the user.
+        steps (list): If given, every step is appended as a dict of mode, targets, summary, estimated prompt tokens and
+            evidence before/after.
+        changed (tuple): Changed files and folders of a previous analysis of `evidences`, only those are re-checked.
+
+    Returns:
+        Dict[str, List[str]]: A dictionary of evidences.
+    """
     client = get_ai()
-    mode = "read_dir"
-    target = ""
+    mode = "recheck" if changed else "read"
+    targets = [""]
     question = ""
     print(colors.BOLD + "Starting AI Analysis" + colors.ENDC)
+    system = _prompt_system(task)
+    builder = PromptBuilder(system)
+    total_tokens = 0
     files = dict()
+    rejected = []
+    evidences, _ = apply_patch(evidences, [])  # fills in missing fields
     while True:
-        if mode == "read_dir":
-            target_files = ls(target)
-            files[target if target else '/'] = target_files
+        before = evidences
+        if mode == "recheck":
+            changed_files, changed_dirs = changed
+            for folder in evidences.get("checked_folders", []):
+                if folder not in changed_dirs and folder.strip('/') not in changed_dirs:
+                    files[folder] = ls('' if folder == '/' else folder)
+            print(f"\t{colors.YELLOW}ai is re-checking changed files {list(changed_files)} "
+                  f"and folders {changed_dirs}{colors.ENDC}")
+            intro, contents = _prompt_recheck(changed_dirs), list(changed_files.items())
+        elif mode == "read":
+            with trace.span('read batch', 'phase', targets=targets):
+                listings, contents = _read_targets(ls, cat, targets)
+            for folder, listing in listings.items():
+                if isinstance(listing, Exception):
+                    contents.append((folder, listing))
+                else:
+                    files[folder if folder else '/'] = listing
+                    print(f"\t{colors.YELLOW}ai is reading directory {folder if folder else '/'} -> {listing}"
+                          f"{colors.ENDC}")
             evidences["checked_folders"] = list(files.keys())
-            print(
-                f"\t{colors.YELLOW}ai is reading directory {target if target else '/'} -> {target_files}{colors.ENDC}")
-            important_files = [(name, cat(name)) for name in ['README', 'README.md', 'README.txt', 'Dockerfile'] if
-                               name in target_files]
-            messages = [
-                {"role": "system", "content": _prompt_system(task)},
-                {"role": "user", "content": _prompt_file_list(evidences, files, important_files)},
-            ]
-        elif mode == "read_file":
-            target_content = cat(target)
-            print(f"\t{colors.YELLOW}ai is reading file {target} -> {len(target_content)} bytes{colors.ENDC}")
-            messages = [
-                {"role": "system", "content": _prompt_system(task)},
-                {"role": "user", "content": _prompt_file_content(evidences, target, target_content, files)},
-            ]
+            for name, content in contents:
+                size = f"{len(content)} bytes" if not isinstance(content, Exception) else content
+                print(f"\t{colors.YELLOW}ai is reading file {name} -> {size}{colors.ENDC}")
+            intro = READ_INTRO
         elif mode == "ask":
             logger.debug(f"ai is asking a question: {question}")
-            answer = input('AI: ' + question + ' ')
-            messages = [
-                {"role": "system", "content": _prompt_system(task)},
-                {"role": "user", "content": _prompt_ans(evidences, question, answer)},
-            ]
+            answer = get_policy().answer(question)
+            if answer is None:
+                with trace.span('answer question', 'user'):
+                    answer = console.ask('AI: ' + question + ' ')
+            else:
+                print(f"\t{colors.YELLOW}AI: {question} -> {answer} (policy){colors.ENDC}")
+            intro, contents = _prompt_ans(question, answer), []
         else:
             raise ValueError(f"Invalid mode: {mode}")
-        response = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=messages,
-            max_tokens=750,
-            stream=False,
-            response_format={
-                'type': 'json_object'
-            }
-        )
-        response_text = response.choices[0].message.content
+        if rejected:
+            intro = _prompt_rejected(rejected) + '\n' + intro
+        prompt, tokens = builder.build(intro, files, evidences, INSTRUCTIONS, contents)
+        total_tokens += tokens
+        print(f"\t{colors.YELLOW}prompt ~{tokens} tokens (budget {builder.budget}, ~{total_tokens} so far)"
+              f"{colors.ENDC}")
+        messages = [
+            {"role": "system", "content": system},
+            {"role": "user", "content": prompt},
+        ]
+        response_text = client.complete(messages, max_tokens=750, response_format={'type': 'json_object'})
         if not response_text:
             logger.error("ai response is empty")
             raise ValueError("AI response is empty")
         if response_text.startswith('```json') and response_text.endswith('```'):
             logger.debug("ai response is JSON but wrapped in markdown, unwrapping")
             response_text = response_text[7:-3].strip()
-        logger.debug(response.usage)
         try:
             ai_evidences = json.loads(response_text)
         except json.JSONDecodeError as e:
             logger.error(f"ai response is not valid JSON: {response_text}")
             raise e
-        evidences = ai_evidences["evidences"]
+        if "patch" in ai_evidences:
+            evidences, rejected = apply_patch(evidences, ai_evidences["patch"])
+            for error in rejected:
+                logger.debug(f"ai patch operation rejected: {error}")
+        else:
+            evidences, rejected = apply_patch(ai_evidences["evidences"], [])  # full evidence echo
         next_task = ai_evidences["next_task"]
+        if steps is not None:
+            steps.append({"mode": mode, "targets": targets, "summary": ai_evidences["summary"], "tokens": tokens,
+                          "before": before, "after": evidences})
         # logger.debug(json.dumps(evidences, indent=2))
         print(colors.BLUE + ai_evidences["summary"] + colors.ENDC)
-        if next_task["mode"] == "read_file":
-            mode = "read_file"
-            target = next_task["target"]
+        if next_task["mode"] == "read":
+            mode = "read"
+            targets = list(dict.fromkeys(next_task["targets"]))
+        elif next_task["mode"] == "read_file":
+            mode = "read"
+            targets = [next_task["target"]]
         elif next_task["mode"] == "read_dir":
-            mode = "read_dir"
-            target = next_task["target"]
+            mode = "read"
+            targets = [next_task["target"].rstrip('/') + '/' if next_task["target"].strip('/') else ""]
         elif next_task["mode"] == "ask":
             mode = "ask"
             question = next_task["question"]
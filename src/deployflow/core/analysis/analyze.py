@@ -1,24 +1,110 @@
 from typing import Dict, List
 
+from deployflow.core import colors, trace
 from deployflow.core.analysis.ai_analyzer import ai_analysis
-from deployflow.core.analysis.fs import init_target
+from deployflow.core.analysis.cache import AnalysisCache, ReadRecorder, changes, facts, retract, run_key
+from deployflow.core.analysis import scan
+from deployflow.core.analysis.fs import Target, open_target
+from deployflow.core.analysis.static import static_analysis
+from deployflow.logger import logger
 
 
-def analyze_repository(target: str, task: str = "") -> Dict[str, List[str] | str]:
+def analyze_repository(target: str, task: str = "", use_cache: bool = True) -> Dict[str, List[str] | str]:
     """
     Analyze a repository to extract deployment details.
 
-    Might include other analysis tools in the future, right now it only uses AI.
+    A static analysis of the well-known manifests and a scan of every file for hardcoded addresses seed the evidence,
+    the AI then confirms it and fills the gaps.
 
     Args:
         target (str): Path to the repository (zip, Git repo, or directory).
         task (str): The task provided by the user.
+        use_cache (bool): Reuse the results of previous analyses of the same content.
 
     Returns:
         Dict[str, List[str]]: A dictionary of evidences.
     """
-    evidences = {}
-    ls, cat, close = init_target(target)
-    evidences = ai_analysis(evidences, ls, cat, task)
-    close()
+    source = open_target(target)
+    try:
+        if not use_cache:
+            ls, cat = trace.traced(source.ls, 'ls'), trace.traced(source.cat, 'cat')
+            return ai_analysis(_seed(ls, cat, _scan(source)), ls, cat, task)
+        return _cached_analysis(AnalysisCache(), target, source, task)
+    finally:
+        source.close()
+
+
+def _scan(source: Target) -> List[scan.Hit]:
+    with trace.span('scan', 'phase') as args:
+        hits = scan.scan(source)
+        args['hits'] = len(hits)
+    return hits
+
+
+def _seed(ls: callable, cat: callable, hits: List[scan.Hit]) -> Dict[str, List[str] | str]:
+    with trace.span('static analysis', 'phase'):
+        evidences = static_analysis(ls, cat)
+    evidences['update_commands'] += scan.update_commands(hits, evidences['ports'])
+    evidences['notes'] += scan.notes(hits)
+    return evidences
+
+
+def _cached_analysis(cache: AnalysisCache, target: str, source: Target, task: str) -> Dict[str, List[str] | str]:
+    key = run_key(target, task)
+    record = cache.get(key)
+    tree = source.tree_digest()
+    if record and tree and record.get('tree') == tree:
+        # same git tree: nothing to scan or re-read
+        logger.debug(f"analysis cache hit {key}, tree {tree}")
+        print(colors.BOLD + "Repository unchanged since the last analysis, reusing cached evidence" + colors.ENDC)
+        return record['evidences']
+    hits = _scan(source)
+    recorder = ReadRecorder(trace.traced(source.ls, 'ls'), trace.traced(source.cat, 'cat'))
+    hardcoded = {'files': scan.file_digests(hits), 'commands': [], 'notes': scan.notes(hits)}
+    evidences, changed, file_facts = None, None, {}
+    if record:
+        changed_files, changed_dirs = changes(record, recorder.ls, recorder.cat, source.digest)
+        old = record['scan']
+        for path in set(old['files']) | set(hardcoded['files']):
+            if old['files'].get(path) != hardcoded['files'].get(path) and path not in changed_files:
+                try:
+                    changed_files[path] = recorder.cat(path)
+                except (OSError, UnicodeDecodeError):
+                    changed_files[path] = None
+        for path, digest in record['files'].items():
+            if path not in changed_files:
+                recorder.files.setdefault(path, digest)  # matched by blob id, not read
+        if not changed_files and not changed_dirs:
+            logger.debug(f"analysis cache hit {key}")
+            if tree:
+                cache.put(key, {**record, 'tree': tree})
+            print(colors.BOLD + "Repository unchanged since the last analysis, reusing cached evidence" + colors.ENDC)
+            return record['evidences']
+        logger.debug(f"analysis cache stale {key}: {list(changed_files)} {changed_dirs}")
+        evidences = record['evidences']
+        for path in changed_files:
+            evidences = retract(evidences, record['facts'].get(path, {}))
+        evidences = retract(evidences, {'update_commands': old['commands'], 'notes': old['notes']})
+        hardcoded['commands'] = scan.update_commands(hits, evidences.get('ports') or [])
+        evidences['update_commands'] = evidences.get('update_commands', []) + hardcoded['commands']
+        evidences['notes'] = evidences.get('notes', []) + hardcoded['notes']
+        file_facts = {path: value for path, value in record['facts'].items() if path not in changed_files}
+        changed = changed_files, changed_dirs
+
+    if evidences is None:
+        evidences = _seed(recorder.ls, recorder.cat, hits)
+        hardcoded['commands'] = scan.update_commands(hits, evidences['ports'])
+    steps = []
+    evidences = ai_analysis(evidences, recorder.ls, recorder.cat, task, steps, changed)
+    for step in steps:
+        if step['mode'] == 'read':
+            # facts of a batch cannot be told apart, every file of it owns all of them
+            for path in step['targets']:
+                if path and not path.endswith('/'):
+                    file_facts[path] = facts(step['before'], step['after'])
+        elif step['mode'] == 'recheck':
+            for path in changed[0]:
+                file_facts[path] = facts(step['before'], step['after'])
+    cache.put(key, {'evidences': evidences, 'files': recorder.files, 'dirs': recorder.dirs, 'facts': file_facts,
+                    'scan': hardcoded, 'tree': tree})
     return evidences
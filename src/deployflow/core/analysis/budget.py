@@ -0,0 +1,151 @@
+"""
+Token-budgeted prompt assembly for the AI analysis loop.
+
+Every analysis turn is a single stateless prompt. `PromptBuilder` keeps track of what earlier turns already showed the
+model: folder listings are sent in full once and afterwards only as a compact history line, file contents are only
+sent on the turn they are read and are cut head/middle/tail to fit the budget, and the evidence is sent as compact JSON.
+
+Token counts are estimates (about 4 characters per token), no tokenizer is needed.
+"""
+import json
+from typing import Dict, List, Optional, Tuple
+
+from deployflow import config
+
+PROMPT_BUDGET = 8000  # tokens per prompt, system prompt included
+MIN_FILE_TOKENS = 200  # a file never gets less than this, even when the budget is exhausted
+FOLDERS_SHARE = 4  # folder listings may use 1/4 of the budget
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _take(lines: List[Tuple[int, str]], limit: int) -> List[Tuple[int, str]]:
+    taken, size = [], 0
+    for number, line in lines:
+        if size + len(line) + 1 > limit:
+            if not taken:
+                taken.append((number, line[:max(limit - 4, 0)] + ' ...'))  # a single huge line, e.g. minified js
+            break
+        taken.append((number, line))
+        size += len(line) + 1
+    return taken
+
+
+def truncate(content: str, max_tokens: int) -> str:
+    """
+    Cut `content` to about `max_tokens`, keeping the head, a sample of the middle and the tail.
+
+    Omitted parts are replaced by a marker with their line numbers, so the AI knows where the kept lines are.
+    """
+    if estimate_tokens(content) <= max_tokens:
+        return content
+    limit = max_tokens * CHARS_PER_TOKEN
+    lines = list(enumerate(content.splitlines(), 1))
+    head = _take(lines, limit // 2)
+    tail = _take(lines[::-1], limit // 4)[::-1]
+    tail = [line for line in tail if line[0] > head[-1][0]]
+    rest = lines[head[-1][0]:tail[0][0] - 1 if tail else len(lines)]
+    middle = _take(rest[len(rest) // 2:], limit // 4) if rest else []
+    kept, out, last = head + middle + tail, [], 0
+    for number, line in kept:
+        if number > last + 1:
+            out.append(f'[... lines {last + 1}-{number - 1} omitted ...]')
+        out.append(line)
+        last = number
+    if last < len(lines):
+        out.append(f'[... lines {last + 1}-{len(lines)} omitted ...]')
+    return '\n'.join(out) + f'\n[{len(lines)} lines, {len(content)} characters in total]'
+
+
+def _share(sizes: List[int], budget: int) -> List[int]:
+    """Split `budget` over items of `sizes`: small items get what they need, large ones split the rest evenly."""
+    shares = [0] * len(sizes)
+    left = len(sizes)
+    for i in sorted(range(len(sizes)), key=sizes.__getitem__):
+        shares[i] = max(min(sizes[i], budget // left), MIN_FILE_TOKENS)
+        budget = max(budget - shares[i], 0)
+        left -= 1
+    return shares
+
+
+class PromptBuilder:
+    """
+    Assembles the user prompts of one analysis run within a token budget.
+
+    Args:
+        system (str): The system prompt sent along every prompt, it counts against the budget.
+        budget (int): Tokens per prompt, defaults to the `analysis.prompt_budget` config value.
+    """
+
+    def __init__(self, system: str, budget: int = None):
+        self.system = system
+        self.budget = budget or int(config.get_val('analysis', 'prompt_budget', PROMPT_BUDGET))
+        self._listed = set()
+
+    def _folders(self, files: Dict[str, List[str]], budget: int) -> str:
+        new = [folder for folder in files if folder not in self._listed]
+        history = [folder for folder in files if folder in self._listed]
+        self._listed.update(new)
+
+        def relative(folder, path):
+            return path[len(folder):] if folder != '/' and path.startswith(folder) else path
+
+        listings = [f'{folder}: {json.dumps(files[folder])}' for folder in new]
+        compact = [f'{folder} {" ".join(relative(folder, path) for path in files[folder])}' for folder in history]
+        # over budget: collapse the oldest history lines to entry counts, then shorten the new listings
+        for i in range(len(compact)):
+            if estimate_tokens('\n'.join(listings + compact)) <= budget:
+                break
+            compact[i] = f'{history[i]} ({len(files[history[i]])} entries)'
+        for i, folder in enumerate(new):
+            if estimate_tokens('\n'.join(listings + compact)) <= budget:
+                break
+            keep = max(budget * CHARS_PER_TOKEN // max(len(new), 1) // 40, 10)
+            if len(files[folder]) > keep:
+                listings[i] = f'{folder}: {json.dumps(files[folder][:keep])} (and {len(files[folder]) - keep} more)'
+        sections = ''
+        if compact:
+            sections += '=== previously listed folders (entries relative to the folder)\n' + '\n'.join(compact) + '\n'
+        return sections + '=== checked folders\n' + '\n'.join(listings) + '\n===\n'
+
+    def build(self, intro: str, files: Dict[str, List[str]], evidences: dict, instructions: str,
+              contents: List[Tuple[str, Optional[str] | Exception]] = ()) -> Tuple[str, int]:
+        """
+        Build a user prompt.
+
+        Args:
+            intro (str): What the AI is asked to do this turn.
+            files (dict): Every folder listed so far, mapped to its entries.
+            evidences (dict): Current evidence.
+            instructions (str): Instructions closing the prompt.
+            contents (list): (name, content) of files read this turn, content is None for a deleted file and an
+                exception for a file that could not be read.
+
+        Returns:
+            tuple: The prompt and the estimated tokens of the whole request.
+        """
+        evidence_p = json.dumps(evidences, separators=(',', ':'))
+        fixed = estimate_tokens(self.system) + estimate_tokens(intro + evidence_p + instructions) + 16
+        folders_p = self._folders(files, max((self.budget - fixed) // FOLDERS_SHARE, MIN_FILE_TOKENS))
+        left = self.budget - fixed - estimate_tokens(folders_p)
+        texts = [content for _, content in contents if isinstance(content, str)]
+        shares = iter(_share([estimate_tokens(text) for text in texts], left - 20 * len(contents)))
+        contents_p = ''
+        for name, content in contents:
+            if content is None:
+                contents_p += f'=== file deleted: {name}\n'
+            elif isinstance(content, Exception):
+                contents_p += f'=== could not read {name}: {content}\n'
+            else:
+                contents_p += f'=== file: {name}\n{truncate(content, next(shares))}\n===\n'
+        prompt = f"""
+{intro}
+{folders_p}{contents_p}Current Evidence:
+{evidence_p}
+
+{instructions}
+""".strip()
+        return prompt, estimate_tokens(self.system) + estimate_tokens(prompt)
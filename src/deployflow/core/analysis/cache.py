@@ -0,0 +1,178 @@
+"""
+Persistent, content-addressed cache for analysis results.
+
+Files are identified by their git blob id (`content_hash`), which is the object id for git targets and a hash of the
+file bytes for directories and archives. A cached run stores the final evidence together with the hash of every file and
+directory listing the analysis read, and the facts each file contributed, so an unchanged target can be answered
+without any AI calls and a changed one only needs its changed files re-read. Git targets know the blob id of every file
+from their tree, so an unchanged git tree is answered without reading any file, and only files whose blob id changed
+are read.
+
+Entries are JSON files under `~/.deployflow/cache`, evicted least recently used first once the cache grows past its
+size limit.
+"""
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from deployflow import config
+
+CACHE_DIR = os.path.join(Path.home(), '.deployflow', 'cache')
+MAX_BYTES = 64 * 1024 * 1024
+
+
+def content_hash(data: bytes) -> str:
+    """Git blob id of `data`."""
+    return hashlib.sha1(b'blob %d\0' % len(data) + data).hexdigest()
+
+
+def run_key(target: str, task: str) -> str:
+    if not target.startswith(('http', 'git@', 'file://')):
+        target = os.path.abspath(target)
+    return hashlib.sha256(json.dumps(['run', target, task]).encode()).hexdigest()
+
+
+class AnalysisCache:
+    def __init__(self, root: str = None, max_bytes: int = None):
+        self.root = root or config.get_val('cache', 'dir', CACHE_DIR)
+        self.max_bytes = max_bytes or int(config.get_val('cache', 'max_bytes', MAX_BYTES))
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key + '.json')
+
+    def get(self, key: str) -> Optional[dict]:
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf8') as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            return None
+        try:
+            os.utime(path)  # mtime doubles as the LRU clock
+        except FileNotFoundError:  # evicted by another analysis meanwhile
+            pass
+        return value
+
+    def put(self, key: str, value: dict):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=key + '.', suffix='.tmp', dir=os.path.dirname(path))
+        try:
+            with open(fd, 'w', encoding='utf8') as f:
+                json.dump(value, f)
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries past the size limit, other analyses may be using the cache."""
+        entries = []
+        for folder, _, names in os.walk(self.root):
+            for name in names:
+                if not name.endswith('.json'):  # e.g. the .tmp file of a put in progress
+                    continue
+                path = os.path.join(folder, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:  # evicted by another analysis
+                pass
+            total -= size
+
+
+class ReadRecorder:
+    """
+    Wraps `ls` and `cat` of a target and records the content hash of everything read through them.
+    """
+
+    def __init__(self, ls: Callable[[str | None], list[str]], cat: Callable[[str], str]):
+        self._ls = ls
+        self._cat = cat
+        self.files: Dict[str, str] = {}
+        self.dirs: Dict[str, str] = {}
+
+    def ls(self, subdir: str = None) -> list[str]:
+        items = self._ls(subdir)
+        self.dirs[subdir or ''] = _listing_hash(items)
+        return items
+
+    def cat(self, file_path: str) -> str:
+        content = self._cat(file_path)
+        self.files[file_path] = content_hash(content.encode('utf8'))
+        return content
+
+
+def _listing_hash(items: List[str]) -> str:
+    return content_hash('\n'.join(sorted(items)).encode('utf8'))
+
+
+def changes(record: dict, ls: Callable[[str | None], list[str]], cat: Callable[[str], str],
+            digest_of: Callable[[str], Optional[str]] = None) -> tuple[Dict[str, Optional[str]], List[str]]:
+    """
+    Compare a cached run against the target.
+
+    Args:
+        digest_of: Content hash of a file without reading it (the blob id of git targets), None when unknown. Files
+            whose hash matches the record are not read.
+
+    Returns:
+        tuple: Changed files mapped to their new content (None if deleted), and directories whose listing changed.
+    """
+    changed_files = {}
+    for path, digest in record['files'].items():
+        try:
+            if digest_of and digest_of(path) == digest:
+                continue
+            content = cat(path)
+        except (OSError, KeyError, UnicodeDecodeError):
+            changed_files[path] = None
+            continue
+        if content_hash(content.encode('utf8')) != digest:
+            changed_files[path] = content
+    changed_dirs = []
+    for path, digest in record['dirs'].items():
+        try:
+            if _listing_hash(ls(path)) != digest:
+                changed_dirs.append(path)
+        except (OSError, KeyError):
+            changed_dirs.append(path)
+    return changed_files, changed_dirs
+
+
+def facts(before: dict, after: dict) -> dict:
+    """Evidence a single analysis step contributed: new list items and changed scalar fields."""
+    contributed = {}
+    for key, value in after.items():
+        old = before.get(key)
+        if isinstance(value, list):
+            old = old if isinstance(old, list) else []
+            added = [item for item in value if item not in old]
+            if added:
+                contributed[key] = added
+        elif value != old:
+            contributed[key] = value
+    return contributed
+
+
+def retract(evidences: dict, contributed: dict) -> dict:
+    """Remove facts contributed by a file from the evidence, the inverse of `facts`."""
+    evidences = dict(evidences)
+    for key, value in contributed.items():
+        if isinstance(value, list) and isinstance(evidences.get(key), list):
+            evidences[key] = [item for item in evidences[key] if item not in value]
+        elif evidences.get(key) == value:
+            evidences[key] = ''
+    return evidences
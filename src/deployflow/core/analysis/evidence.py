@@ -0,0 +1,119 @@
+"""
+Evidence schema and the merge engine for the evidence patches returned by the AI.
+
+Instead of echoing the whole evidence every turn, the AI returns the operations of that turn:
+
+    {"op": "add", "field": "ports", "value": 5000}
+    {"op": "remove", "field": "notes", "value": ["outdated note"]}
+    {"op": "set", "field": "target", "value": "aws"}
+
+`apply_patch` validates every operation against the schema and applies the valid ones. Invalid operations are skipped
+and returned as errors, so they can be reported back to the AI instead of failing the analysis.
+"""
+import json
+from typing import Dict, List
+
+LIST_FIELDS = ['frameworks', 'platform', 'config_files', 'ports', 'build_commands', 'update_commands',
+               'deployment_commands', 'notes', 'checked_paths', 'checked_folders']
+SCALAR_FIELDS = ['target', 'region', 'instance_type']
+
+
+def empty_evidence() -> Dict[str, List[str] | str]:
+    evidences = {key: [] for key in LIST_FIELDS}
+    evidences.update({key: '' for key in SCALAR_FIELDS})
+    return evidences
+
+
+def _is_item(value) -> bool:
+    return isinstance(value, (str, int, float)) and not isinstance(value, bool)
+
+
+def _coerce(field: str, value) -> tuple[List[str] | str, str | None]:
+    """A value of the base evidence in the type of its field, and what was wrong with it, if anything."""
+    if field in SCALAR_FIELDS:
+        if value is None or isinstance(value, str):
+            return value or '', None
+        if _is_item(value):
+            return str(value), f'{field} must be a string, kept as {json.dumps(str(value))}'
+        return '', f'{field} must be a string, cleared'
+    if value is None:
+        return [], None
+    if _is_item(value):
+        return [value], f'{field} must be a list, kept as {json.dumps([value])}'
+    if not isinstance(value, list):
+        return [], f'{field} must be a list, cleared'
+    items = [item for item in value if _is_item(item)]
+    if len(items) != len(value):
+        return items, f'{field} items must be strings or numbers, dropped the others'
+    return list(value), None
+
+
+def _apply(evidences: dict, operation: dict) -> str | None:
+    if not isinstance(operation, dict):
+        return 'not an object'
+    op, field, value = operation.get('op'), operation.get('field'), operation.get('value')
+    if op not in ('add', 'remove', 'set'):
+        return f'unknown op {op!r}, expected add, remove or set'
+    if field not in LIST_FIELDS and field not in SCALAR_FIELDS:
+        return f'unknown field {field!r}'
+    if 'value' not in operation:
+        return 'missing value'
+    if field in SCALAR_FIELDS:
+        if op != 'set':
+            return f'{field} is not a list, use set'
+        if not isinstance(value, str):
+            return f'{field} must be a string'
+        evidences[field] = value
+        return None
+    items = value if isinstance(value, list) else [value]
+    if not all(_is_item(item) for item in items):
+        return f'{field} items must be strings or numbers'
+    if op == 'set':
+        if not isinstance(value, list):
+            return f'{field} is a list, set it to a list or use add'
+        evidences[field] = list(dict.fromkeys(items))
+    elif op == 'add':
+        index = operation.get('index', len(evidences[field]))
+        if not isinstance(index, int) or isinstance(index, bool):
+            return 'index must be an integer'
+        new = [item for item in dict.fromkeys(items) if item not in evidences[field]]
+        evidences[field][index:index] = new
+    else:
+        missing = [item for item in items if item not in evidences[field]]
+        evidences[field] = [item for item in evidences[field] if item not in items]
+        if missing:
+            return f'not in {field}: {json.dumps(missing)}'
+    return None
+
+
+def apply_patch(evidences: dict, patch: list) -> tuple[Dict[str, List[str] | str], List[str]]:
+    """
+    Apply a patch of evidence operations.
+
+    Args:
+        evidences (dict): Evidence to patch, it is not modified.
+        patch (list): Operations of the AI response.
+
+    Returns:
+        tuple: The patched evidence, and an error message for every operation that was rejected and every field of
+            `evidences` that did not have the type of the schema (it is coerced or cleared).
+    """
+    patched = empty_evidence()
+    errors = []
+    if not isinstance(evidences, dict):
+        errors.append(f'evidence must be an object, not {json.dumps(evidences)}')
+        evidences = {}
+    for key, value in evidences.items():
+        if key not in patched:
+            patched[key] = value
+            continue
+        patched[key], error = _coerce(key, value)
+        if error:
+            errors.append(f'{json.dumps({key: value})}: {error}')
+    if not isinstance(patch, list):
+        return patched, errors + ['patch must be a list of operations']
+    for operation in patch:
+        error = _apply(patched, operation)
+        if error:
+            errors.append(f'{json.dumps(operation)}: {error}')
+    return patched, errors
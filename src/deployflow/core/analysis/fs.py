@@ -1,11 +1,19 @@
+import importlib
 import os
-from typing import Callable
+import re
+from typing import Any, BinaryIO, Callable, Iterable, Iterator, NamedTuple, Optional
+
+from deployflow.core import trace
 
 """
 This module provides utilities to interact with the file system or remote repositories.
 
-The `init_target` function initializes a target (a directory, a zip file, a tar file, or a Git repository) and returns
-three functions: `ls`, `cat`, and `close`.
+The `open_target` function opens a target (a directory, a zip file, a tar file, or a Git repository) as a `Target`
+with `ls`, `cat`, `walk`, `glob`, `stat`, `open`, `read_many` and `close`. `init_target` returns only its `ls`, `cat`,
+and `close`.
+
+Every backend builds a `_TreeIndex` when the target is opened, `ls` and `cat` are served from it instead of rescanning
+the archive or the repository tree on every call. `cat` may be called from several threads at once.
 """
 
 
@@ -18,177 +26,552 @@ def _onerror(func, path, exc_info):
         raise
 
 
-def _process_ls_items(items: list[str], isdir: Callable[[str], bool] = lambda _: False) -> list[str]:
-    return [name + ('/' if isdir(name) else '') for name in items]
+class _Entry(NamedTuple):
+    path: str  # full path, directories end with /
+    is_dir: bool
+    size: Optional[int]  # None when the backend cannot tell without reading the file
+    ref: Any  # blob id, ZipInfo or TarInfo
+
+
+def _index_key(path: str | None) -> str:
+    path = (path or '').strip('/')
+    while path.startswith('./'):
+        path = path[2:]
+    return '' if path == '.' else path
+
+
+class _TreeIndex:
+    """
+    In-memory directory index of a target, built once when the target is opened.
+
+    Directories without an explicit entry (common in zip files) are added implicitly. Backends that can list a single
+    directory cheaply (plain directories) pass a `loader` that fills the index one directory at a time instead.
+    """
+
+    def __init__(self, loader: Callable[[str], None] = None):
+        self._entries: dict[str, _Entry] = {}
+        self._children: dict[str, list[str]] = {'': []}
+        self._loader = loader
+        self._loaded = set()
+
+    def add(self, path: str, is_dir: bool = False, size: int = None, ref: Any = None):
+        key = _index_key(path)
+        if not key:
+            return
+        entry = _Entry(key + '/' if is_dir else key, is_dir, size, ref)
+        if key in self._entries:
+            if not is_dir:
+                self._entries[key] = entry  # later tar members override earlier ones
+            elif self._entries[key].ref is None:
+                self._entries[key] = entry  # explicit entry for an implicitly added directory
+            return
+        parent = key.rpartition('/')[0]
+        if parent not in self._children:
+            self.add(parent, True)
+        self._entries[key] = entry
+        self._children.setdefault(parent, []).append(entry.path)
+        if is_dir:
+            self._children[key] = []
+
+    def ls(self, subdir: str = None) -> list[str]:
+        key = _index_key(subdir)
+        if self._loader and key not in self._loaded:
+            self._loaded.add(key)
+            self._loader(key)
+        if key not in self._children:
+            raise FileNotFoundError(f"No such directory: {subdir}")
+        return list(self._children[key])
+
+    def get(self, path: str) -> _Entry:
+        key = _index_key(path)
+        if key not in self._entries:
+            raise FileNotFoundError(f"No such file: {path}")
+        return self._entries[key]
+
+    def files(self, subdir: str = None, skip: set = frozenset(), max_depth: int = None) -> Iterator[str]:
+        """Every file under `subdir`, in one pass over the index."""
+        key = _index_key(subdir)
+        if key not in self._children:
+            raise FileNotFoundError(f"No such directory: {subdir}")
+        prefix = key + '/' if key else ''
+        base = prefix.count('/')
+        for path, entry in self._entries.items():
+            if entry.is_dir or not path.startswith(prefix):
+                continue
+            folders = path.split('/')[base:-1]
+            if (max_depth is None or len(folders) < max_depth) and skip.isdisjoint(folders):
+                yield path
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class _BlobReader:
+    """
+    Reads blobs straight from the object database of a partial clone.
+
+    A single long-lived `git cat-file --batch` process serves every read, blobs missing from the `blob:none` clone are
+    fetched from the promisor remote in one batch beforehand. The working tree is never touched.
+    """
+
+    _CHUNK = 256  # requests written to cat-file before reading replies, keeps the pipes from filling up
+
+    def __init__(self, git_dir: str):
+        import subprocess
+        import threading
+        self._git_dir = git_dir
+        self._fetched = set()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        self._proc = subprocess.Popen(['git', '--git-dir', git_dir, 'cat-file', '--batch'],
+                                      stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    def fetch(self, oids: list[str]):
+        import subprocess
+        with self._pending_lock:
+            self._pending.update(oid for oid in oids if oid not in self._fetched)
+        # callers arriving while a fetch runs queue up their blobs, whoever gets the lock next fetches all of them
+        with self._fetch_lock:
+            with self._pending_lock:
+                missing, self._pending = list(self._pending), set()
+            if not missing:
+                return
+            # same invocation git uses for lazy fetches, but with every missing object in one round trip
+            with trace.span('git fetch', 'subprocess', blobs=len(missing)):
+                try:
+                    subprocess.run(['git', '--git-dir', self._git_dir, '-c', 'fetch.negotiationAlgorithm=noop',
+                                    'fetch', 'origin', '--no-tags', '--no-write-fetch-head', '--recurse-submodules=no',
+                                    '--filter=blob:none', '--stdin'],
+                                   input='\n'.join(missing) + '\n', text=True, capture_output=True, check=True)
+                except subprocess.CalledProcessError as e:
+                    raise OSError(f"Failed to fetch {len(missing)} blobs from origin: {e.stderr.strip()}") from e
+            self._fetched.update(missing)
+
+    def read_many(self, oids: list[str]) -> list[bytes]:
+        self.fetch(oids)
+        results = []
+        with self._lock:
+            for i in range(0, len(oids), self._CHUNK):
+                chunk = oids[i:i + self._CHUNK]
+                self._proc.stdin.write(''.join(oid + '\n' for oid in chunk).encode())
+                self._proc.stdin.flush()
+                not_found = None
+                for oid in chunk:
+                    header = self._proc.stdout.readline().split()
+                    if len(header) != 3:  # `<oid> missing`, no content follows
+                        not_found = not_found or oid
+                        continue
+                    results.append(self._proc.stdout.read(int(header[2])))
+                    self._proc.stdout.read(1)  # trailing newline
+                # only raise once every reply of the chunk is read, or the next read would get the rest of this one
+                if not_found:
+                    raise FileNotFoundError(f"Object {not_found} not found in repository")
+        return results
+
+    def read(self, oid: str) -> bytes:
+        return self.read_many([oid])[0]
+
+    def close(self):
+        self._proc.stdin.close()
+        self._proc.wait()
+        self._proc.stdout.close()
+
+
+class FileInfo(NamedTuple):
+    path: str  # directories end with /
+    is_dir: bool
+    size: Optional[int]  # None for directories and when the backend cannot tell without reading the file
+
+
+def _glob_regex(pattern: str) -> re.Pattern:
+    """`**/` matches any number of folders, `*` and `?` match within one path component."""
+    tokens = re.split(r'(\*\*/|\*\*|\*|\?)', pattern)
+    wildcards = {'**/': '(?:.*/)?', '**': '.*', '*': '[^/]*', '?': '[^/]'}
+    return re.compile(''.join(wildcards.get(token) or re.escape(token) for token in tokens) + r'\Z', re.S)
+
+
+class Target:
+    """
+    An opened target, served from the `_TreeIndex` built when it was opened.
+
+    Whole-tree consumers use `walk`, `glob` and `read_many` instead of recursing through `ls` and calling `cat` per
+    file: `walk` is one pass over the index (over `os.scandir` for directories) and `read_many` reads in the order that
+    is cheapest for the backend, by offset in archives and in one batched fetch for git.
+    """
+
+    root: Optional[str] = None  # local directory of the target, if it is one
+
+    def __init__(self, source: str, index: _TreeIndex):
+        self.source = source
+        self._index = index
+
+    def ls(self, subdir: str = None) -> list[str]:
+        return self._index.ls(subdir)
+
+    def _file(self, path: str) -> _Entry:
+        entry = self._index.get(path)
+        if entry.is_dir:
+            raise IsADirectoryError(f"Is a directory: {path}")
+        return entry
+
+    def _read(self, entry: _Entry) -> bytes:
+        raise NotImplementedError
+
+    def _order(self, entry: _Entry) -> int:
+        """Sort key of the entries of `read_many`, their offset in archives."""
+        return 0
+
+    def read(self, path: str) -> bytes:
+        return self._read(self._file(path))
+
+    def cat(self, path: str) -> str:
+        return self.read(path).decode('utf8')
+
+    def open(self, path: str) -> BinaryIO:
+        """Binary file object of `path`, backends that cannot stream a file read it whole."""
+        import io
+        return io.BytesIO(self.read(path))
+
+    def stat(self, path: str) -> FileInfo:
+        entry = self._index.get(path)
+        return FileInfo(entry.path, entry.is_dir, entry.size)
+
+    def digest(self, path: str) -> Optional[str]:
+        """Git blob id of the file at `path` when the backend knows it without reading the file, else None."""
+        return None
+
+    def tree_digest(self) -> Optional[str]:
+        """Digest of every path and content of the target when known without reading any file (git), else None."""
+        return None
+
+    def walk(self, subdir: str = None, skip: set = frozenset(), max_depth: int = None) -> Iterator[str]:
+        """
+        Yield the path of every file under `subdir`, skipping directories named in `skip` and files `max_depth` or more
+        directories below `subdir`.
+        """
+        return self._index.files(subdir, skip, max_depth)
+
+    def glob(self, pattern: str) -> list[str]:
+        """Files matching `pattern`, e.g. `**/package.json` or `app/*.py`, walking only the folder before its first
+        wildcard."""
+        pattern = _index_key(pattern)
+        regex = _glob_regex(pattern)
+        folder = re.split(r'[*?]', pattern)[0].rpartition('/')[0]
+        try:
+            return [path for path in self.walk(folder or None) if regex.match(path)]
+        except OSError:  # the folder does not exist
+            return []
+
+    def read_many(self, paths: Iterable[str]) -> Iterator[tuple[str, Optional[bytes]]]:
+        """
+        Yield `(path, content)` for every path, content is None for paths that cannot be read. The order is the one
+        cheapest for the backend, not the order of `paths`.
+        """
+        entries, missing = self._resolve(paths)
+        for path in missing:
+            yield path, None
+        for entry in entries:
+            try:
+                yield entry.path, self._read(entry)
+            except OSError:
+                yield entry.path, None
+
+    def _resolve(self, paths: Iterable[str]) -> tuple[list[_Entry], list[str]]:
+        """Entries of the files among `paths` in `_order`, and the paths that are not files."""
+        entries, missing = [], []
+        for path in paths:
+            try:
+                entries.append(self._file(path))
+            except OSError:
+                missing.append(path)
+        entries.sort(key=self._order)
+        return entries, missing
+
+    def close(self):
+        pass
 
+    def __enter__(self):
+        return self
 
-def _init_repo(repo_url: str) -> tuple[Callable[[str | None], list[str]], Callable[[str], str], Callable[[], None]]:
-    from git import Repo
-    import os
-    import time
-    import shutil
+    def __exit__(self, *exc):
+        self.close()
+
+
+class GitTarget(Target):
+    _READ_BATCH = 1024  # blobs per cat-file round trip of read_many
 
-    temp_dir = "".join(x for x in repo_url.split("/")[-1] if x.isalnum()) + str(hash(time.time()))
-    if os.path.exists(temp_dir):
-        shutil.rmtree(temp_dir, onerror=_onerror)
-    try:
-        repo = Repo.clone_from(repo_url, temp_dir, no_checkout=True, depth=1, filter=['blob:none'])
-
-        def ls(subdir: str = None) -> list[str]:
-            if subdir:
-                if subdir.endswith('/'):
-                    subdir = subdir[:-1]
-                files = [item.path for item in repo.commit().tree[subdir].traverse(depth=1)]
-
-                def is_dir(path):
-                    return repo.commit().tree[path].type == 'tree'
-            else:
-                files = [item.path for item in repo.commit().tree.traverse(depth=1)]
-
-                def is_dir(path):
-                    return repo.commit().tree[path].type == 'tree'
-            return _process_ls_items(files, is_dir)
-
-        def cat(file_path: str) -> str:
-            sparse_checkout_file = os.path.join(temp_dir, '.git', 'info', 'sparse-checkout')
-            with open(sparse_checkout_file, 'w') as f:
-                f.write(f'/{file_path}\n')
-            repo.git.config('core.sparseCheckout', 'true')
-            repo.git.checkout()
-            with open(temp_dir + "/" + file_path, 'r', encoding='utf8') as f:
-                content = f.read()
-            return content
-
-        def close():
-            repo.close()
-            shutil.rmtree(temp_dir, onerror=_onerror)
-
-        return ls, cat, close
-    except Exception as e:
-        raise ValueError(f"Failed to clone repository: {e}")
-
-
-def _init_dir(dir_path: str) -> tuple[Callable[[str | None], list[str]], Callable[[str], str], Callable[[], None]]:
-    _dir = dir_path if dir_path.endswith('/') else dir_path + '/'
-
-    def ls(subdir: str = None) -> list[str]:
-        items = os.listdir(_dir + subdir if subdir else _dir)
-        if subdir:
-            subdir = subdir if subdir.endswith('/') else subdir + '/'
-            items = [subdir + item for item in items]
-            print(items)
-
-        def is_dir(name):
-            return os.path.isdir(_dir + name)
-
-        return _process_ls_items(items, is_dir)
-
-    def cat(file_path: str) -> str:
-        with open(_dir + file_path, 'r', encoding='utf8') as f:
+    def __init__(self, repo_url: str):
+        from git import Repo
+        import time
+        import shutil
+
+        self._temp_dir = "".join(x for x in repo_url.split("/")[-1] if x.isalnum()) + str(hash(time.time()))
+        if os.path.exists(self._temp_dir):
+            shutil.rmtree(self._temp_dir, onerror=_onerror)
+        try:
+            self._repo = Repo.clone_from(repo_url, self._temp_dir, bare=True, depth=1, filter=['blob:none'])
+            self._blobs = _BlobReader(self._repo.git_dir)
+            index = _TreeIndex()
+            # trees are part of the blob:none clone, so listing never fetches file contents
+            for line in self._repo.git.ls_tree('-r', '-t', '-z', 'HEAD').split('\0'):
+                if not line:
+                    continue
+                info, path = line.split('\t', 1)
+                _, obj_type, oid = info.split()
+                index.add(path, obj_type != 'blob', None, oid)
+        except Exception as e:
+            raise ValueError(f"Failed to clone repository: {e}")
+        super().__init__(repo_url, index)
+
+    def _read(self, entry: _Entry) -> bytes:
+        return self._blobs.read(entry.ref)
+
+    def digest(self, path: str) -> Optional[str]:
+        return self._file(path).ref
+
+    def tree_digest(self) -> Optional[str]:
+        return self._repo.git.rev_parse('HEAD^{tree}')
+
+    def read_many(self, paths: Iterable[str]) -> Iterator[tuple[str, Optional[bytes]]]:
+        entries, missing = self._resolve(paths)
+        for path in missing:
+            yield path, None
+        try:
+            self._blobs.fetch([entry.ref for entry in entries])  # every missing blob in one round trip
+        except OSError:
+            yield from ((entry.path, None) for entry in entries)
+            return
+        for i in range(0, len(entries), self._READ_BATCH):
+            chunk = entries[i:i + self._READ_BATCH]
+            try:
+                contents = self._blobs.read_many([entry.ref for entry in chunk])
+            except OSError:  # one of them is missing, read them one by one to find which
+                yield from super().read_many(entry.path for entry in chunk)
+                continue
+            yield from zip((entry.path for entry in chunk), contents)
+
+    def close(self):
+        import shutil
+        self._blobs.close()
+        self._repo.close()
+        shutil.rmtree(self._temp_dir, onerror=_onerror)
+
+
+class DirTarget(Target):
+    def __init__(self, dir_path: str):
+        self.root = dir_path
+        self._dir = dir_path if dir_path.endswith('/') else dir_path + '/'
+        super().__init__(dir_path, _TreeIndex(self._load))
+
+    def _load(self, key: str):
+        prefix = key + '/' if key else ''
+        with os.scandir(self._dir + key if key else self._dir) as it:
+            for item in it:
+                self._index.add(prefix + item.name, item.is_dir(follow_symlinks=False))
+
+    def read(self, path: str) -> bytes:
+        with open(self._dir + path, 'rb') as f:
             return f.read()
 
-    def close():
-        pass
+    def cat(self, path: str) -> str:
+        with open(self._dir + path, 'r', encoding='utf8') as f:
+            return f.read()
 
-    return ls, cat, close
+    def open(self, path: str) -> BinaryIO:
+        return open(self._dir + path, 'rb')
+
+    def stat(self, path: str) -> FileInfo:
+        import stat
+        key = _index_key(path)
+        info = os.stat(self._dir + key)
+        if stat.S_ISDIR(info.st_mode):
+            return FileInfo(key + '/' if key else '', True, None)
+        return FileInfo(key, False, info.st_size)
+
+    def walk(self, subdir: str = None, skip: set = frozenset(), max_depth: int = None) -> Iterator[str]:
+        folders = [(_index_key(subdir), 0)]
+        while folders:
+            folder, depth = folders.pop()
+            prefix = folder + '/' if folder else ''
+            with os.scandir(self._dir + folder) as it:
+                for item in it:
+                    if not item.is_dir(follow_symlinks=False):  # linked folders may loop (a/loop -> ..)
+                        yield prefix + item.name
+                    elif item.name not in skip and (max_depth is None or depth + 1 < max_depth):
+                        folders.append((prefix + item.name, depth + 1))
+
+    def read_many(self, paths: Iterable[str]) -> Iterator[tuple[str, Optional[bytes]]]:
+        for path in paths:
+            try:
+                yield path, self.read(path)
+            except OSError:
+                yield path, None
+
+
+class ZipTarget(Target):
+    def __init__(self, archive_path: str):
+        import zipfile
+        self._remote = None
+        if archive_path.startswith("http"):
+            from deployflow.core.analysis.remote import open_remote
+            self._remote = open_remote(archive_path)
+            self._zip = zipfile.ZipFile(self._remote)
+        else:
+            self._zip = zipfile.ZipFile(archive_path, "r")
 
+        index = _TreeIndex()
+        for info in self._zip.infolist():
+            index.add(info.filename, info.is_dir(), info.file_size, info)
+        super().__init__(archive_path, index)
 
-def _init_zip(archive_path: str) -> tuple[Callable[[str | None], list[str]], Callable[[str], str], Callable[[], None]]:
-    import zipfile
-    if archive_path.startswith("http"):
-        import requests
-        import io
-        response = requests.get(archive_path)
-        zip_ref = zipfile.ZipFile(io.BytesIO(response.content))
-    else:
-        zip_ref = zipfile.ZipFile(archive_path, "r")
+    def _read(self, entry: _Entry) -> bytes:
+        with self._zip.open(entry.ref) as f:
+            return f.read()
+
+    def _order(self, entry: _Entry) -> int:
+        return entry.ref.header_offset
+
+    def open(self, path: str) -> BinaryIO:
+        return self._zip.open(self._file(path).ref)
+
+    def close(self):
+        self._zip.close()
+        if self._remote:
+            self._remote.close()
 
-    def ls(subdir: str = None) -> list[str]:
-        items = zip_ref.namelist()
-        if not subdir:
-            items = [item for item in items if not '/' in item or (item.endswith('/') and item.count('/') == 1)]
+
+class TarTarget(Target):
+    def __init__(self, archive_path: str):
+        import tarfile
+        import threading
+        self._remote = None
+        self._lock = threading.Lock()  # both readers seek a shared file object
+        if archive_path.startswith("http"):
+            from deployflow.core.analysis.remote import download_spooled
+            self._remote = download_spooled(archive_path)
+
+        index = _TreeIndex()
+        self._tar = self._gz = None
+        if archive_path.endswith(".tar"):
+            self._tar = tarfile.open(fileobj=self._remote, mode="r:") if self._remote \
+                else tarfile.open(archive_path, "r:")
+            for member in self._tar.getmembers():
+                index.add(member.name, member.isdir(), member.size, member)
+        else:
+            # extractfile() on a r:gz stream re-inflates from the start for every backwards seek, index it instead
+            from deployflow.core.analysis.gzindex import GzipIndex, tar_members
+            self._fileobj = self._remote or open(archive_path, "rb")
+            self._gz = GzipIndex(self._fileobj)
+            for name, is_dir, size, offset in tar_members(self._gz, None if self._remote else archive_path):
+                index.add(name, is_dir, size, offset)
+        super().__init__(archive_path, index)
+
+    def _read(self, entry: _Entry) -> bytes:
+        with self._lock:
+            if self._gz:
+                return self._gz.read_at(entry.ref, entry.size)
+            with self._tar.extractfile(entry.ref) as f:
+                return f.read()
+
+    def _order(self, entry: _Entry) -> int:
+        return entry.ref if self._gz else entry.ref.offset_data
+
+    def read_many(self, paths: Iterable[str]) -> Iterator[tuple[str, Optional[bytes]]]:
+        if not self._gz:
+            yield from super().read_many(paths)
+            return
+        entries, missing = self._resolve(paths)
+        for path in missing:
+            yield path, None
+        # one forward inflate over every wanted member instead of one from the nearest checkpoint per member
+        contents = self._gz.read_ranges((entry.ref, entry.size) for entry in entries)
+        for entry in entries:
+            with self._lock:  # held per member only, `cat` from other threads interleaves
+                data = next(contents)
+            yield entry.path, data
+
+    def close(self):
+        if self._gz:
+            self._fileobj.close()
         else:
-            subdir = subdir if subdir.endswith('/') else subdir + '/'
-            items = [item for item in items if item.startswith(subdir) and item != subdir  # is not the directory itself
-                     and (item[len(subdir):].count('/') == 0 or  # is file
-                          (item[len(subdir):].endswith('/') and item[len(subdir):].count('/') == 1))]  # is directory
+            self._tar.close()
+        if self._remote:
+            self._remote.close()
 
-        def is_dir(name):
-            return False  # zip already has / at the end of directory names
 
-        return _process_ls_items(items, is_dir)
+def walk(ls: Callable[[str | None], list[str]], skip: set = frozenset(), max_depth: int = None) -> Iterator[str]:
+    """
+    Yield the path of every file of a target using only its `ls`, skipping directories named in `skip`.
 
-    def cat(file_path: str) -> str:
-        with zip_ref.open(file_path) as f:
-            return f.read().decode("utf-8")
+    One `ls` per folder, `Target.walk` lists the whole tree in one pass. Kept for wrapped `ls` (e.g. a `ReadRecorder`).
+    """
+    folders = [('', 0)]
+    while folders:
+        folder, depth = folders.pop()
+        for path in ls(folder or None):
+            if not path.endswith('/'):
+                yield path
+            elif path.rstrip('/').rsplit('/', 1)[-1] not in skip and (max_depth is None or depth + 1 < max_depth):
+                folders.append((path, depth + 1))
 
-    def close():
-        zip_ref.close()
 
-    return ls, cat, close
+def _is_git_url(target: str) -> bool:
+    return (target.startswith("http") and target.endswith(".git")) or target.startswith(("git@", "file://"))
 
 
-def _init_tar(archive_path: str) -> tuple[Callable[[str | None], list[str]], Callable[[str], str], Callable[[], None]]:
-    import tarfile
-    if archive_path.startswith("http"):
-        import requests
-        import io
-        response = requests.get(archive_path)
-        tar_ref = tarfile.open(fileobj=io.BytesIO(response.content),
-                               mode="r:" if archive_path.endswith(".tar") else "r:gz")
-    else:
-        tar_ref = tarfile.open(archive_path, "r:" if archive_path.endswith(".tar") else "r:gz")
+class _Backend(NamedTuple):
+    kind: str
+    matches: Callable[[str], bool]
+    opener: str  # "module:Class" of the `Target`, resolved when a target of this kind is opened
+    suffixes: tuple = ()  # removed from the target name
 
-    def ls(subdir: str = None) -> list[str]:
-        items = tar_ref.getnames()
-        if not subdir:
-            items = [item for item in items if not '/' in item]
-        else:
-            subdir = subdir if subdir.endswith('/') else subdir + '/'
-            items = [item for item in items if item.startswith(subdir) and item != subdir  # is not the directory itself
-                     and item[len(subdir):].count('/') == 0]  # is file (tar does not have / at the end of directory
 
-        def is_dir(name):
-            return tar_ref.getmember(name).isdir()
+_BACKENDS: list[_Backend] = [
+    _Backend('git', _is_git_url, __name__ + ':GitTarget'),
+    _Backend('zip', lambda target: target.endswith(".zip"), __name__ + ':ZipTarget', ('.zip',)),
+    _Backend('tar', lambda target: target.endswith((".tar.gz", ".tar")), __name__ + ':TarTarget', ('.tar.gz', '.tar')),
+    _Backend('dir', os.path.isdir, __name__ + ':DirTarget'),
+]
+
 
-        return _process_ls_items(items, is_dir)
+def register_backend(kind: str, matches: Callable[[str], bool], opener: str, suffixes: tuple = ()):
+    """
+    Add a backend, tried before the built-in ones.
 
-    def cat(file_path: str) -> str:
-        with tar_ref.extractfile(file_path) as f:
-            return f.read().decode("utf-8")
+    `opener` names the `Target` subclass opening a target ("module:Class"), a backend defined in its own module is
+    only imported when the first target of this kind is opened.
+    """
+    _BACKENDS.insert(0, _Backend(kind, matches, opener, suffixes))
 
-    def close():
-        tar_ref.close()
 
-    return ls, cat, close
+def _backend(target: str) -> _Backend:
+    for backend in _BACKENDS:
+        if backend.matches(target):
+            return backend
+    raise ValueError("Unsupported target type")
 
 
 def identify_target(target: str) -> tuple[str, str]:
     target = target.replace("\\", "/")
     target = target[:-1] if target.endswith("/") else target
-    if (target.startswith("http") and target.endswith(".git")) or target.startswith("git@"):
-        return "git", target.split("/")[-1]
-    elif target.endswith(".zip"):
-        return "zip", target.split("/")[-1].replace(".zip", "")
-    elif target.endswith(".tar.gz") or target.endswith(".tar"):
-        return "tar", target.split("/")[-1].replace(".tar.gz", "").replace(".tar", "")
-    elif os.path.isdir(target):
-        return "dir", target.split("/")[-1]
-    else:
-        raise ValueError("Unsupported target type")
+    backend = _backend(target)
+    name = target.split("/")[-1]
+    for suffix in backend.suffixes:
+        name = name.replace(suffix, "")
+    return backend.kind, name
+
+
+def open_target(target: str) -> Target:
+    with trace.span('open', 'fs', target=target):
+        module, _, name = _backend(target).opener.partition(':')
+        return getattr(importlib.import_module(module), name)(target)
 
 
 def init_target(target: str) -> tuple[Callable[[str | None], list[str]], Callable[[str], str], Callable[[], None]]:
-    if (target.startswith("http") and target.endswith(".git")) or target.startswith("git@"):
-        return _init_repo(target)
-    elif target.endswith(".zip"):
-        return _init_zip(target)
-    elif target.endswith(".tar.gz") or target.endswith(".tar"):
-        return _init_tar(target)
-    elif os.path.isdir(target):
-        return _init_dir(target)
-    else:
-        raise ValueError("Unsupported target type")
+    source = open_target(target)
+    return trace.traced(source.ls, 'ls'), trace.traced(source.cat, 'cat'), source.close
 
 
 def copy_target(target: str, dest: str):
@@ -198,26 +581,24 @@ def copy_target(target: str, dest: str):
         print(f"Destination directory {dest} already exists. Skipping copy.")
         return
     os.makedirs(dest)
-    if (target.startswith("http") and target.endswith(".git")) or target.startswith("git@"):
+    if _is_git_url(target):
         from git import Repo
         Repo.clone_from(target, dest)
     elif target.endswith(".zip"):
         import zipfile
         if target.startswith("http"):
-            import requests
-            import io
-            response = requests.get(target)
-            target = io.BytesIO(response.content)
+            from deployflow.core.analysis.remote import download_spooled
+            target = download_spooled(target)
 
         with zipfile.ZipFile(target, 'r') as zip_ref:
             zip_ref.extractall(dest)
     elif target.endswith(".tar.gz") or target.endswith(".tar"):
         import tarfile
         if target.startswith("http"):
-            import requests
-            import io
-            response = requests.get(target)
-            target = io.BytesIO(response.content)
+            from deployflow.core.analysis.remote import download_spooled
+            with download_spooled(target) as spool, tarfile.open(fileobj=spool, mode='r:*') as tar_ref:
+                tar_ref.extractall(dest)
+            return
         with tarfile.open(target, 'r:*') as tar_ref:
             tar_ref.extractall(dest)
     elif os.path.isdir(target):
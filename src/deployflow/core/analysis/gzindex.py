@@ -0,0 +1,178 @@
+"""
+Random access into gzip compressed tarballs.
+
+A zran-style index: a single pass over the compressed stream records the offset of every tar member together with
+periodic decompressor checkpoints, so reading a member only inflates from the nearest checkpoint instead of from the
+start of the archive.
+
+Python's zlib does not expose `inflatePrime`, so checkpoints are decompressor snapshots (`Decompress.copy()`) that only
+live in memory. The member table is what gets cached next to the archive: reopening an indexed archive lists instantly,
+and checkpoints are rebuilt lazily by the first read that needs them.
+"""
+import bisect
+import io
+import json
+import os
+import zlib
+from typing import Iterable, Iterator
+
+SPAN = 4 * 1024 * 1024  # uncompressed bytes between checkpoints, bounds the work of a random read
+CHUNK = 64 * 1024
+INDEX_SUFFIX = '.dfidx'
+INDEX_VERSION = 1
+
+
+def _gzip_decompressor():
+    return zlib.decompressobj(zlib.MAX_WBITS | 16)
+
+
+class GzipIndex:
+    """
+    Checkpointed random access over a (possibly multi-member) gzip stream.
+
+    Args:
+        fileobj: Seekable binary file object of the compressed data.
+        span (int): Uncompressed distance between checkpoints.
+    """
+
+    def __init__(self, fileobj, span: int = SPAN):
+        self._fileobj = fileobj
+        self._span = span
+        # (uncompressed offset, compressed offset, decompressor that has consumed everything before the latter)
+        self._checkpoints = [(0, 0, _gzip_decompressor())]
+        self._offsets = [0]
+
+    def __len__(self):
+        return len(self._checkpoints)
+
+    def _inflate(self, checkpoint):
+        """Yield (uncompressed offset, data) from `checkpoint` onwards, recording new checkpoints past the last one."""
+        u_offset, c_offset, decompressor = checkpoint
+        decompressor = decompressor.copy()
+        while True:
+            self._fileobj.seek(c_offset)  # other reads may have moved the file between two chunks
+            data = self._fileobj.read(CHUNK)
+            if not data:
+                return
+            c_offset += len(data)
+            while data:
+                if decompressor.eof:
+                    if not data.strip(b'\0'):
+                        return  # trailing padding after the last member
+                    decompressor = _gzip_decompressor()
+                out = decompressor.decompress(data)
+                data = decompressor.unused_data if decompressor.eof else b''
+                if out:
+                    yield u_offset, out
+                    u_offset += len(out)
+            last_u, last_c, _ = self._checkpoints[-1]
+            if c_offset > last_c and u_offset - last_u >= self._span:
+                self._checkpoints.append((u_offset, c_offset, decompressor.copy()))
+                self._offsets.append(u_offset)
+
+    def read_at(self, offset: int, size: int) -> bytes:
+        """Read `size` uncompressed bytes starting at `offset`."""
+        if size <= 0:
+            return b''
+        checkpoint = self._checkpoints[bisect.bisect_right(self._offsets, offset) - 1]
+        buffer = bytearray()
+        for u_offset, out in self._inflate(checkpoint):
+            if u_offset + len(out) <= offset:
+                continue
+            start = max(0, offset - u_offset)
+            buffer += out[start:start + size - len(buffer)]
+            if len(buffer) >= size:
+                break
+        return bytes(buffer)
+
+    def read_ranges(self, ranges: Iterable[tuple[int, int]]) -> Iterator[bytes]:
+        """
+        Yield the bytes of every (offset, size) of `ranges`, sorted by offset, inflating forward in one pass.
+
+        The pass only restarts from a checkpoint to skip a gap longer than the span, or to go backwards.
+        """
+        chunks, u_offset, out = None, 0, b''
+        for offset, size in ranges:
+            checkpoint = self._checkpoints[bisect.bisect_right(self._offsets, offset) - 1]
+            if chunks is None or offset < u_offset or checkpoint[0] > u_offset + len(out):
+                chunks, (u_offset, out) = self._inflate(checkpoint), (checkpoint[0], b'')
+            buffer = bytearray()
+            while len(buffer) < size:
+                if u_offset + len(out) > offset:
+                    start = max(0, offset - u_offset)
+                    buffer += out[start:start + size - len(buffer)]
+                    if len(buffer) >= size:
+                        break
+                try:
+                    u_offset, out = next(chunks)
+                except StopIteration:
+                    break
+            yield bytes(buffer)
+
+    def stream(self):
+        """Forward-only file object over the whole uncompressed stream, indexing it on the way."""
+        return _InflateStream(self._inflate(self._checkpoints[0]))
+
+
+class _InflateStream(io.RawIOBase):
+    def __init__(self, chunks):
+        super().__init__()
+        self._chunks = chunks
+        self._buffer = b''
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._buffer:
+            try:
+                self._buffer = next(self._chunks)[1]
+            except StopIteration:
+                return 0
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+def _load_members(index_path: str, stat: os.stat_result):
+    try:
+        with open(index_path, 'r') as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cached.get('version') != INDEX_VERSION or cached.get('size') != stat.st_size \
+            or cached.get('mtime') != stat.st_mtime_ns:
+        return None
+    return [tuple(member) for member in cached['members']]
+
+
+def _save_members(index_path: str, stat: os.stat_result, members):
+    try:
+        with open(index_path + '.tmp', 'w') as f:
+            json.dump({'version': INDEX_VERSION, 'size': stat.st_size, 'mtime': stat.st_mtime_ns,
+                       'members': members}, f)
+        os.replace(index_path + '.tmp', index_path)
+    except OSError:
+        pass  # read-only location, the index is only an optimisation
+
+
+def tar_members(gz: GzipIndex, archive_path: str = None) -> list[tuple[str, bool, int, int]]:
+    """
+    List the members of a gzip compressed tarball as (name, is_dir, size, data offset).
+
+    The listing pass also builds the checkpoints of `gz`. When `archive_path` is a local file the listing is cached in
+    a sidecar file next to it and reused while the archive is unchanged.
+    """
+    import tarfile
+    stat = os.stat(archive_path) if archive_path else None
+    index_path = archive_path + INDEX_SUFFIX if archive_path else None
+    if stat:
+        members = _load_members(index_path, stat)
+        if members is not None:
+            return members
+    with tarfile.open(fileobj=gz.stream(), mode='r|') as tar:
+        members = [(member.name, member.isdir(), member.size, member.offset_data) for member in tar]
+    if stat:
+        _save_members(index_path, stat, members)
+    return members
@@ -0,0 +1,118 @@
+"""
+Access to remote archives without buffering them in memory.
+
+`HttpRangeFile` is a seekable, read-only file object backed by HTTP range requests, so `zipfile` only downloads the
+central directory and the members that are actually read. `download_spooled` streams a download into a spooled temporary
+file with bounded memory, for formats that have to be read from the start (tar).
+"""
+import io
+
+BLOCK_SIZE = 256 * 1024
+SPOOL_SIZE = 16 * 1024 * 1024
+
+
+class HttpRangeFile(io.RawIOBase):
+    """
+    Seekable read-only file over HTTP range requests.
+
+    Reads are served from a single read-ahead block, every miss costs one range request of at least `block_size`
+    bytes. `bytes_downloaded` counts the payload fetched so far.
+    """
+
+    def __init__(self, url: str, block_size: int = BLOCK_SIZE, session=None):
+        import requests
+        super().__init__()
+        self._session = session or requests.Session()
+        response = self._session.head(url, allow_redirects=True)
+        response.raise_for_status()
+        if response.headers.get('Accept-Ranges', '').lower() != 'bytes' or 'Content-Length' not in response.headers:
+            raise ValueError(f"Server does not support range requests for {url}")
+        self.url = response.url
+        self.size = int(response.headers['Content-Length'])
+        self.block_size = block_size
+        self.bytes_downloaded = 0
+        self._pos = 0
+        self._block_start = 0
+        self._block = b''
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        if pos < 0:
+            raise OSError("Negative seek position")
+        self._pos = pos
+        return pos
+
+    def _fetch(self, start: int, end: int) -> bytes:
+        response = self._session.get(self.url, headers={'Range': f'bytes={start}-{end - 1}'})
+        response.raise_for_status()
+        if response.status_code != 206:
+            raise OSError(f"Server ignored range request for {self.url}")
+        self.bytes_downloaded += len(response.content)
+        return response.content
+
+    def readinto(self, buffer) -> int:
+        size = min(len(buffer), self.size - self._pos)
+        if size <= 0:
+            return 0
+        offset = self._pos - self._block_start
+        if offset < 0 or offset + size > len(self._block):
+            end = min(self.size, self._pos + max(size, self.block_size))
+            self._block_start, self._block = self._pos, self._fetch(self._pos, end)
+            offset = 0
+        buffer[:size] = self._block[offset:offset + size]
+        self._pos += size
+        return size
+
+    def close(self):
+        self._block = b''
+        super().close()
+
+
+def download_spooled(url: str, max_memory: int = SPOOL_SIZE, chunk_size: int = 1024 * 1024):
+    """
+    Stream a download into a temporary file that only stays in memory while it is smaller than `max_memory`.
+
+    Args:
+        url (str): URL to download.
+        max_memory (int): Size in bytes after which the download is rolled over to disk.
+        chunk_size (int): Size of the chunks read from the network.
+
+    Returns:
+        tempfile.SpooledTemporaryFile: The downloaded file, positioned at the start.
+    """
+    import requests
+    import tempfile
+    spool = tempfile.SpooledTemporaryFile(max_size=max_memory)
+    with requests.get(url, stream=True) as response:
+        response.raise_for_status()
+        for chunk in response.iter_content(chunk_size):
+            spool.write(chunk)
+    spool.seek(0)
+    return spool
+
+
+def open_remote(url: str):
+    """
+    Open a remote file for random access, falling back to a spooled download when ranges are not supported.
+    """
+    import requests
+    try:
+        return HttpRangeFile(url)
+    except (ValueError, requests.RequestException):
+        return download_spooled(url)
@@ -0,0 +1,229 @@
+"""
+Scanner for hardcoded URLs, IP addresses, localhost addresses and host:port literals.
+
+Sweeps every text file of a target with a single compiled regex instead of having the AI read the files one by one.
+The files are listed in one `walk` of the target. Plain directories are scanned by a process pool that memory-maps the
+files, other targets are read with `read_many` (in archive order, in one batched fetch for git) and scanned in the same
+pool. Hits on loopback addresses on the app's ports are turned into `update_commands` that substitute `$PUBLIC_IP` /
+`$PORT`.
+
+This module does not write to the repository or execute any commands.
+"""
+import hashlib
+import os
+import re
+import shlex
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, NamedTuple
+
+from deployflow.core.analysis.fs import Target
+from deployflow.core.analysis.static import NODE_ENTRY_FILES, PY_ENTRY_FILES, SKIP_DIRS
+
+MAX_FILE_SIZE = 2 * 1024 * 1024
+BATCH = 256
+IN_FLIGHT = 2  # batches per worker submitted ahead of the results
+SKIP_FILES = {'package-lock.json', 'yarn.lock', 'pnpm-lock.yaml', 'poetry.lock', 'Pipfile.lock', 'Cargo.lock',
+              'go.sum', 'composer.lock', 'Gemfile.lock'}
+LOOPBACK = {'localhost', '127.0.0.1'}
+
+# Every pattern starts with a literal re can skip to quickly, the text around a candidate is checked afterwards.
+# A single alternation of anchored patterns is an order of magnitude slower.
+_URL = re.compile(rb'''://[^\s'"<>()`\\]+''')
+_SCHEME = re.compile(rb'(?<!\w)(?:https?|wss?)$')
+_IP = re.compile(rb'\.\d{1,3}\.\d{1,3}\.\d{1,3}(?::\d{2,5})?')
+_FIRST_OCTET = re.compile(rb'(?<![\w.])\d{1,3}$')
+_IPV4 = re.compile(rb'(?:(?:25[0-5]|2[0-4]\d|1?\d?\d)\.){3}(?:25[0-5]|2[0-4]\d|1?\d?\d)(?::\d{2,5})?')
+_LOCALHOST = re.compile(rb'localhost(?::\d{2,5})?\b')
+_PORT = re.compile(rb':\d{2,5}\b')
+_HOSTNAME_REVERSED = re.compile(rb'[A-Za-z]{2,}(?:\.[A-Za-z0-9-]+)+')
+_WORD = frozenset(b'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_')
+_HOST_CHARS = _WORD | frozenset(b'.-')
+_HOST = re.compile(r'^(?:\w+://)?([^/:?#]+)(?::(\d+))?')
+_IP_HOST = re.compile(r'\d{1,3}(?:\.\d{1,3}){3}')
+
+
+class Hit(NamedTuple):
+    path: str
+    line: int
+    kind: str  # url, ip, localhost or hostport
+    text: str
+
+
+def _matches(data):
+    for match in _URL.finditer(data):
+        start, end = match.span()
+        scheme = _SCHEME.search(data[max(0, start - 6):start])
+        if scheme:
+            yield start - len(scheme.group()), end, 'url'
+    for match in _IP.finditer(data):
+        start, end = match.span()
+        first = _FIRST_OCTET.search(data[max(0, start - 4):start])
+        if first:
+            start -= len(first.group())
+            if _IPV4.fullmatch(data, start, end) and (end == len(data) or data[end] not in _HOST_CHARS):
+                yield start, end, 'ip'
+    for match in _LOCALHOST.finditer(data):
+        start, end = match.span()
+        if start == 0 or data[start - 1] not in _WORD:
+            yield start, end, 'localhost'
+    for match in _PORT.finditer(data):
+        start, end = match.span()
+        before = data[max(0, start - 255):start][::-1]
+        host = _HOSTNAME_REVERSED.match(before)
+        if host and (host.end() == len(before) or before[host.end()] not in _HOST_CHARS):
+            yield start - host.end(), end, 'hostport'
+
+
+def _scan_bytes(path: str, data) -> List[Hit]:
+    if b'\0' in data[:8192]:
+        return []  # binary
+    hits = []
+    line, last, covered = 1, 0, 0
+    for start, end, kind in sorted(_matches(data)):
+        if start < covered:
+            continue  # part of an earlier match, e.g. the host of a URL
+        covered = end
+        line += data[last:start].count(b'\n')
+        last = start
+        hits.append(Hit(path, line, kind, data[start:end].decode('utf8', 'replace').rstrip('.,;')))
+    return hits
+
+
+def _scan_files(root: str, paths: List[str]) -> List[Hit]:
+    import mmap
+    hits = []
+    for path in paths:
+        try:
+            with open(os.path.join(root, path), 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                if size == 0 or size > MAX_FILE_SIZE:
+                    continue
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    hits += _scan_bytes(path, data)
+        except (OSError, ValueError):
+            continue
+    return hits
+
+
+def _scan_blobs(blobs: List[tuple[str, bytes]]) -> List[Hit]:
+    hits = []
+    for path, data in blobs:
+        hits += _scan_bytes(path, data)
+    return hits
+
+
+def _batches(items: Iterable, size: int = BATCH) -> Iterable[list]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _paths(source: Target) -> Iterable[str]:
+    return (path for path in source.walk(skip=SKIP_DIRS) if path.rsplit('/', 1)[-1] not in SKIP_FILES)
+
+
+def _small(source: Target, path: str) -> bool:
+    size = source.stat(path).size
+    return size is None or size <= MAX_FILE_SIZE  # git trees do not record sizes, large blobs are read
+
+
+def scan(source: Target, workers: int = None) -> List[Hit]:
+    """
+    Scan every text file of a target for hardcoded addresses.
+
+    Args:
+        source (Target): The opened target, its files are listed in one `walk`. Local directories are memory-mapped by
+            the workers, other targets are read with `read_many`.
+        workers (int): Number of worker processes, defaults to the number of CPUs.
+
+    Returns:
+        List[Hit]: Hits sorted by path and line.
+    """
+    workers = workers or os.cpu_count() or 1
+    if source.root:
+        batches = ((_scan_files, source.root, batch) for batch in _batches(_paths(source)))
+    else:
+        paths = [path for path in _paths(source) if _small(source, path)]
+        batches = ((_scan_blobs, [(path, data or b'') for path, data in batch])
+                   for batch in _batches(source.read_many(paths)))
+    hits = []
+    if workers == 1:
+        for fn, *args in batches:
+            hits += fn(*args)
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            pending = deque()
+            for fn, *args in batches:
+                pending.append(pool.submit(fn, *args))
+                if len(pending) >= IN_FLIGHT * workers:  # bounds the file contents held in memory
+                    hits += pending.popleft().result()
+            for result in pending:
+                hits += result.result()
+    return sorted(hits)
+
+
+def _sed(pattern: str, replacement: str, path: str) -> str:
+    pattern = re.sub(r'([.\[\]*^$\\#])', r'\\\1', pattern)
+    return f'sed -i "s#{pattern}#{replacement}#g" {shlex.quote(path)}'
+
+
+def update_commands(hits: List[Hit], ports: Iterable = ()) -> List[str]:
+    """
+    Commands replacing loopback addresses of the app with `$PUBLIC_IP` / `$PORT`.
+
+    Server entry files bind to 0.0.0.0 instead, everything else (templates, static files, configuration) is pointed
+    at the public address of the server. Only addresses on one of the app's `ports` (or without a port) are the app's,
+    other loopback services (`postgres://...@localhost:5432`, `redis://127.0.0.1:6379`) run next to it and are left
+    alone, as is every address of a file that has such a service, where replacing the host would move it too.
+    """
+    app_ports = {str(port) for port in ports}
+    services = set()
+    for hit in hits:
+        host, port = _HOST.match(hit.text).groups()
+        if host in LOOPBACK and port and port not in app_ports:
+            services.add(hit.path)
+    commands = []
+    for hit in hits:
+        host, port = _HOST.match(hit.text).groups()
+        if host not in LOOPBACK or (port and port not in app_ports):
+            continue
+        if hit.path.rsplit('/', 1)[-1] in PY_ENTRY_FILES | NODE_ENTRY_FILES and hit.kind != 'url':
+            command = _sed(host, '0.0.0.0', hit.path) if hit.path not in services else None
+        elif port:
+            command = _sed(f'{host}:{port}', '$PUBLIC_IP:$PORT', hit.path)
+        else:
+            command = _sed(host, '$PUBLIC_IP', hit.path) if hit.path not in services else None
+        if command and command not in commands:
+            commands.append(command)
+    return commands
+
+
+def file_digests(hits: List[Hit]) -> Dict[str, str]:
+    """Digest of the hits of every file, to tell which files' hardcoded addresses changed between two scans."""
+    digests = {}
+    for hit in hits:
+        digests.setdefault(hit.path, hashlib.sha1())
+        digests[hit.path].update(f'{hit.kind}:{hit.text}\n'.encode('utf8'))
+    return {path: digest.hexdigest() for path, digest in digests.items()}
+
+
+def _local(host: str) -> bool:
+    return host in LOOPBACK or bool(_IP_HOST.fullmatch(host))
+
+
+def notes(hits: List[Hit], limit: int = 30) -> List[str]:
+    """Evidence notes summarizing the scan, external URLs are only counted."""
+    addresses = [hit for hit in hits if hit.kind != 'url' or _local(_HOST.match(hit.text).group(1))]
+    external = len(hits) - len(addresses)
+    if not addresses:
+        return [f'Scanned all files, no hardcoded IP or localhost addresses found ({external} external URLs)']
+    lines = [f'{hit.path}:{hit.line} {hit.text}' for hit in addresses[:limit]]
+    more = f' (and {len(addresses) - limit} more)' if len(addresses) > limit else ''
+    return [f'Scanned all files, {len(addresses)} hardcoded addresses found{more}, {external} external URLs: ' +
+            '; '.join(lines)]
@@ -0,0 +1,275 @@
+"""
+Rule-based pre-analysis of a repository.
+
+Walks the tree once, reads the well-known manifests (requirements.txt, pyproject.toml, package.json, Dockerfile,
+Procfile, go.mod, ...) concurrently and derives platforms, frameworks, ports, build and deployment commands from them.
+The result seeds the evidence before the AI analysis starts, so the AI only has to confirm it and fill the gaps.
+
+This module does not write to the repository or execute any commands.
+"""
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+from deployflow.core.analysis.evidence import empty_evidence
+from deployflow.core.analysis.fs import walk
+from deployflow.logger import logger
+
+SKIP_DIRS = {'node_modules', '.git', '.venv', 'venv', 'env', '__pycache__', 'dist', 'build', 'vendor', 'target',
+             '.idea', '.vscode', '.next', '.terraform'}
+MAX_DEPTH = 4
+WORKERS = 8
+
+PYTHON_FRAMEWORKS = {'flask': 'Flask', 'django': 'Django', 'fastapi': 'FastAPI', 'streamlit': 'Streamlit',
+                     'gunicorn': 'Gunicorn', 'uvicorn': 'Uvicorn', 'tornado': 'Tornado', 'aiohttp': 'aiohttp',
+                     'bottle': 'Bottle', 'gradio': 'Gradio'}
+NODE_FRAMEWORKS = {'express': 'Express', 'next': 'Next.js', 'react': 'React', 'vue': 'Vue', '@angular/core': 'Angular',
+                   '@nestjs/core': 'NestJS', 'koa': 'Koa', 'fastify': 'Fastify', 'vite': 'Vite', 'svelte': 'Svelte',
+                   'nuxt': 'Nuxt'}
+GO_FRAMEWORKS = {'github.com/gin-gonic/gin': 'Gin', 'github.com/labstack/echo': 'Echo',
+                 'github.com/gofiber/fiber': 'Fiber', 'github.com/gorilla/mux': 'Gorilla'}
+RUBY_FRAMEWORKS = {'rails': 'Rails', 'sinatra': 'Sinatra'}
+RUST_FRAMEWORKS = {'actix-web': 'Actix', 'axum': 'Axum', 'rocket': 'Rocket'}
+PHP_FRAMEWORKS = {'laravel/framework': 'Laravel', 'symfony/framework-bundle': 'Symfony'}
+DEFAULT_PORTS = {'Flask': 5000, 'Django': 8000, 'FastAPI': 8000, 'Streamlit': 8501, 'Express': 3000,
+                 'Next.js': 3000, 'Rails': 3000, 'Gradio': 7860}
+
+PY_ENTRY_FILES = {'app.py', 'main.py', 'server.py', 'wsgi.py', 'run.py', 'manage.py'}
+NODE_ENTRY_FILES = {'server.js', 'app.js', 'index.js', 'main.js'}
+
+_PORT_ARG = re.compile(r'''(?:\bport\s*[=:]\s*|--port[= ]|-p\s+|\bPORT\s*=\s*|\blisten\(\s*)['"]?(\d{2,5})\b''')
+_REQUIREMENT = re.compile(r'^\s*([A-Za-z0-9_.\-\[\]]+)', re.MULTILINE)
+
+
+def _in(folder: str, command: str) -> str:
+    return f'cd {folder.rstrip("/")} && {command}' if folder else command
+
+
+def _requirements(text: str) -> List[str]:
+    return [name.split('[')[0].lower() for name in _REQUIREMENT.findall(text)
+            if not name.startswith(('-', '#'))]
+
+
+def _frameworks(names, table) -> List[str]:
+    return [framework for name, framework in table.items() if any(n == name or n.startswith(name + '/')
+                                                                  for n in names)]
+
+
+def _ports(text: str) -> List[int]:
+    return [int(port) for port in _PORT_ARG.findall(text) if 0 < int(port) < 65536]
+
+
+def _json_object(text: str) -> dict:
+    data = json.loads(text)
+    if not isinstance(data, dict):
+        raise ValueError(f'expected an object, not {type(data).__name__}')
+    return data
+
+
+def _table(data: dict, *keys: str) -> dict:
+    """`data[key][...]`, empty when a level is missing or not a mapping."""
+    for key in keys:
+        data = data.get(key) if isinstance(data, dict) else None
+    return data if isinstance(data, dict) else {}
+
+
+def _python_requirements(path: str, folder: str, text: str, evidences: dict):
+    evidences['platform'].append('Python')
+    evidences['frameworks'] += _frameworks(_requirements(text), PYTHON_FRAMEWORKS)
+    evidences['build_commands'].append(f'pip install -r {path}')
+
+
+def _pyproject(path: str, folder: str, text: str, evidences: dict):
+    try:
+        import tomllib
+        data = tomllib.loads(text)
+        names = [re.split(r'[\s<>=!~;\[]', dep, maxsplit=1)[0].lower()
+                 for dep in _table(data, 'project').get('dependencies') or [] if isinstance(dep, str)]
+        names += [name.lower() for name in _table(data, 'tool', 'poetry', 'dependencies')]
+    except (ImportError, ValueError):
+        names = [name.lower() for name in re.findall(r'^\s*"?([A-Za-z0-9_.\-]+)', text, re.MULTILINE)]
+    evidences['platform'].append('Python')
+    evidences['frameworks'] += _frameworks(names, PYTHON_FRAMEWORKS)
+    evidences['build_commands'].append(_in(folder, 'pip install .'))
+
+
+def _pipfile(path: str, folder: str, text: str, evidences: dict):
+    evidences['platform'].append('Python')
+    evidences['frameworks'] += _frameworks(_requirements(text), PYTHON_FRAMEWORKS)
+    evidences['build_commands'] += ['pip install pipenv', _in(folder, 'pipenv install --system --deploy')]
+
+
+def _package_json(path: str, folder: str, text: str, evidences: dict):
+    data = _json_object(text)
+    names = list(_table(data, 'dependencies')) + list(_table(data, 'devDependencies'))
+    scripts = _table(data, 'scripts')
+    evidences['platform'].append('Node.js')
+    evidences['frameworks'] += _frameworks(names, NODE_FRAMEWORKS)
+    evidences['build_commands'].append(_in(folder, 'npm install'))
+    if 'build' in scripts:
+        evidences['build_commands'].append(_in(folder, 'npm run build'))
+    if isinstance(scripts.get('start'), str):
+        evidences['deployment_commands'].append(_in(folder, 'npm start'))
+        evidences['ports'] += _ports(scripts['start'])
+    elif data.get('main'):
+        evidences['deployment_commands'].append(_in(folder, f'node {data["main"]}'))
+
+
+def _dockerfile(path: str, folder: str, text: str, evidences: dict):
+    evidences['platform'].append('Docker')
+    evidences['ports'] += [int(port) for port in re.findall(r'^\s*EXPOSE\s+(\d+)', text, re.MULTILINE | re.I)]
+    evidences['notes'].append(f'{path} found, the application can also be built as a container image')
+
+
+def _compose(path: str, folder: str, text: str, evidences: dict):
+    evidences['platform'].append('Docker')
+    evidences['ports'] += [int(port) for port in re.findall(r'''['"]?\d+:(\d+)['"]?''', text)]
+    evidences['deployment_commands'].append(_in(folder, 'docker compose up -d'))
+
+
+def _procfile(path: str, folder: str, text: str, evidences: dict):
+    for line in text.splitlines():
+        process, _, command = line.partition(':')
+        if process.strip() == 'web' and command.strip():
+            evidences['deployment_commands'].append(_in(folder, command.strip()))
+            evidences['ports'] += _ports(command)
+
+
+def _go_mod(path: str, folder: str, text: str, evidences: dict):
+    evidences['platform'].append('Go')
+    evidences['frameworks'] += _frameworks(re.findall(r'^\s*(?:require\s+)?([\w.\-/]+)\s+v', text, re.MULTILINE),
+                                           GO_FRAMEWORKS)
+    evidences['build_commands'].append(_in(folder, 'go build -o app .'))
+    evidences['deployment_commands'].append(_in(folder, './app'))
+
+
+def _gemfile(path: str, folder: str, text: str, evidences: dict):
+    evidences['platform'].append('Ruby')
+    evidences['frameworks'] += _frameworks(re.findall(r'''^\s*gem\s+['"]([\w\-]+)''', text, re.MULTILINE),
+                                           RUBY_FRAMEWORKS)
+    evidences['build_commands'].append(_in(folder, 'bundle install'))
+
+
+def _cargo(path: str, folder: str, text: str, evidences: dict):
+    evidences['platform'].append('Rust')
+    evidences['frameworks'] += _frameworks(re.findall(r'^\s*([\w\-]+)\s*=', text, re.MULTILINE), RUST_FRAMEWORKS)
+    evidences['build_commands'].append(_in(folder, 'cargo build --release'))
+
+
+def _maven(path: str, folder: str, text: str, evidences: dict):
+    evidences['platform'].append('Java')
+    if 'spring-boot' in text:
+        evidences['frameworks'].append('Spring Boot')
+    evidences['build_commands'].append(_in(folder, 'mvn -B package -DskipTests'))
+
+
+def _gradle(path: str, folder: str, text: str, evidences: dict):
+    evidences['platform'].append('Java')
+    if 'spring-boot' in text or 'org.springframework.boot' in text:
+        evidences['frameworks'].append('Spring Boot')
+    evidences['build_commands'].append(_in(folder, 'gradle build -x test'))
+
+
+def _composer(path: str, folder: str, text: str, evidences: dict):
+    require = _table(_json_object(text), 'require')
+    evidences['platform'].append('PHP')
+    evidences['frameworks'] += _frameworks(require, PHP_FRAMEWORKS)
+    evidences['build_commands'].append(_in(folder, 'composer install --no-dev'))
+
+
+def _dotenv(path: str, folder: str, text: str, evidences: dict):
+    evidences['ports'] += [int(port) for port in re.findall(r'^\s*PORT\s*=\s*(\d+)', text, re.MULTILINE)]
+
+
+def _entry_file(path: str, folder: str, text: str, evidences: dict):
+    name = path.rsplit('/', 1)[-1]
+    evidences['platform'].append('Python' if name.endswith('.py') else 'Node.js')
+    evidences['ports'] += _ports(text)
+    if name == 'manage.py':
+        evidences['deployment_commands'].append(_in(folder, 'python manage.py runserver 0.0.0.0:$PORT'))
+    elif name.endswith('.py') and '__main__' in text:
+        evidences['deployment_commands'].append(_in(folder, f'python {name}'))
+    elif name.endswith('.js'):
+        evidences['deployment_commands'].append(_in(folder, f'node {name}'))
+
+
+MANIFESTS: Dict[str, Callable[[str, str, str, dict], None]] = {
+    'requirements.txt': _python_requirements,
+    'pyproject.toml': _pyproject,
+    'Pipfile': _pipfile,
+    'package.json': _package_json,
+    'Dockerfile': _dockerfile,
+    'docker-compose.yml': _compose,
+    'docker-compose.yaml': _compose,
+    'compose.yml': _compose,
+    'compose.yaml': _compose,
+    'Procfile': _procfile,
+    'go.mod': _go_mod,
+    'Gemfile': _gemfile,
+    'Cargo.toml': _cargo,
+    'pom.xml': _maven,
+    'build.gradle': _gradle,
+    'build.gradle.kts': _gradle,
+    'composer.json': _composer,
+    '.env': _dotenv,
+    '.env.example': _dotenv,
+    **{name: _entry_file for name in PY_ENTRY_FILES | NODE_ENTRY_FILES},
+}
+CONFIG_FILES = set(MANIFESTS) - PY_ENTRY_FILES - NODE_ENTRY_FILES
+
+
+def _find_manifests(ls: Callable[[str | None], list[str]]) -> List[str]:
+    return sorted(path for path in walk(ls, SKIP_DIRS, MAX_DEPTH) if path.rsplit('/', 1)[-1] in MANIFESTS)
+
+
+def _unique(items: list) -> list:
+    return list(dict.fromkeys(items))
+
+
+def static_analysis(ls: Callable[[str | None], list[str]], cat: Callable[[str], str]) -> Dict[str, List[str] | str]:
+    """
+    Derive deployment evidence from well-known manifests without using AI.
+
+    Args:
+        ls (callable): Lists a directory of the target.
+        cat (callable): Reads a file of the target.
+
+    Returns:
+        Dict[str, List[str]]: Evidence in the schema of the AI analysis, fields that could not be derived are empty.
+    """
+    evidences = empty_evidence()
+    manifests = _find_manifests(ls)
+
+    def read(path):
+        try:
+            return path, cat(path)
+        except (OSError, UnicodeDecodeError) as e:
+            logger.debug(f"static analysis could not read {path}: {e}")
+            return path, None
+
+    with ThreadPoolExecutor(WORKERS) as pool:
+        contents = list(pool.map(read, manifests))
+    for path, text in contents:
+        if text is None:
+            continue
+        folder, _, name = path.rpartition('/')
+        folder = folder + '/' if folder else ''
+        try:
+            MANIFESTS[name](path, folder, text, evidences)
+        except ValueError as e:
+            evidences['notes'].append(f'{path} could not be parsed: {e}')
+            continue
+        if name in CONFIG_FILES:
+            evidences['config_files'].append(path)
+            evidences['checked_paths'].append(path)
+
+    for key, value in evidences.items():
+        if isinstance(value, list):
+            evidences[key] = _unique(value)
+    if not evidences['ports']:
+        evidences['ports'] = _unique(DEFAULT_PORTS[f] for f in evidences['frameworks'] if f in DEFAULT_PORTS)
+    read_paths = [path for path, text in contents if text is not None]
+    if read_paths:
+        evidences['notes'].append(f'Pre-filled by static analysis of {", ".join(read_paths)}, confirm and complete it')
+    return evidences
@@ -0,0 +1,213 @@
+"""
+Embedded store of the evidence of every analysis run.
+
+Runs are rows of a SQLite database (`~/.deployflow/evidence.db`, `evidence_db` in the `[cache]` section of the config
+file) indexed by target, revision and task, so `deploy` finds the evidence of an earlier analysis of the same revision
+with one index lookup, without opening the target. The revision is cheap to compute:
+
+- git URL: the commit of the remote HEAD (`git ls-remote`)
+- folder in a git work tree: HEAD commit, plus the status and size / modification time of the uncommitted files
+- other folders: size and modification time of every file
+- zip and tar files: their size and modification time
+
+Each run also records when it was made, how long the analysis took and how its deployment ended. `deployflow evidence`
+lists, diffs and prunes runs.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import subprocess
+import time
+from pathlib import Path
+from typing import Dict, List, NamedTuple
+
+from deployflow import config
+
+DB_PATH = os.path.join(Path.home(), '.deployflow', 'evidence.db')
+SKIPPED_DIRS = {'.git', 'node_modules', '.venv', '__pycache__'}
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    target TEXT NOT NULL,
+    revision TEXT NOT NULL,
+    task TEXT NOT NULL,
+    created REAL NOT NULL,
+    duration REAL,
+    status TEXT,
+    evidences TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_lookup ON runs (target, revision, task, created);
+CREATE INDEX IF NOT EXISTS runs_created ON runs (created);
+"""
+
+
+class Run(NamedTuple):
+    id: int
+    target: str
+    revision: str
+    task: str
+    created: float  # unix time
+    duration: float  # seconds of analysis
+    status: str  # of the deployment: None, deployed or failed
+    evidences: dict
+
+    def __str__(self):
+        created = time.strftime('%Y-%m-%d %H:%M', time.localtime(self.created))
+        status = self.status or 'not deployed'
+        return f'#{self.id} {created} {self.target} @ {self.revision[:12]} ({status}) {self.task}'
+
+
+def normalize_target(target: str) -> str:
+    if target.startswith(('http', 'git@', 'file://')):
+        return target
+    return os.path.abspath(target)
+
+
+def _git(*args: str, cwd: str = None) -> str | None:
+    try:
+        result = subprocess.run(['git', *args], cwd=cwd, capture_output=True, text=True, timeout=30)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return result.stdout if result.returncode == 0 else None
+
+
+def _stat(path: str) -> str:
+    stat = os.stat(path)
+    return f'{stat.st_size}:{stat.st_mtime_ns}'
+
+
+def _walk_digest(root: str) -> str:
+    digest = hashlib.sha1()
+    for folder, dirs, files in os.walk(root):
+        dirs[:] = sorted(d for d in dirs if d not in SKIPPED_DIRS)
+        for name in sorted(files):
+            path = os.path.join(folder, name)
+            try:
+                digest.update(f'{os.path.relpath(path, root)}\0{_stat(path)}\n'.encode('utf8', 'replace'))
+            except OSError:
+                continue
+    return 'files:' + digest.hexdigest()
+
+
+def revision(target: str) -> str | None:
+    """Identity of the current content of `target`, None when it cannot be told cheaply."""
+    from deployflow.core.analysis.fs import identify_target
+    try:
+        kind = identify_target(target)[0]
+    except ValueError:  # nothing there
+        return None
+    if kind == 'git':
+        head = _git('ls-remote', target, 'HEAD')
+        return head.split()[0] if head else None
+    if target.startswith('http'):
+        return None
+    if os.path.isdir(target):
+        work_tree = _git('rev-parse', 'HEAD', '--show-toplevel', cwd=target)
+        if work_tree is None or _git('check-ignore', '-q', '.', cwd=target) is not None:  # not tracked by git
+            return _walk_digest(target)
+        head, top = work_tree.splitlines()
+        status = _git('status', '--porcelain', '-z', '--untracked-files=all', '--', '.', cwd=target) or ''
+        if not status:
+            return head
+        digest = hashlib.sha1(status.encode('utf8'))
+        for entry in status.split('\0'):
+            path = os.path.join(top, entry[3:])  # relative to the top of the work tree
+            if entry[3:] and os.path.isfile(path):
+                digest.update(_stat(path).encode())
+        return f'{head}+{digest.hexdigest()[:12]}'
+    if os.path.isfile(target):
+        return 'file:' + _stat(target)
+    return None
+
+
+def diff(old: dict, new: dict) -> List[str]:
+    """Differences between two evidences, one `+ field: item`, `- field: item` or `~ field: old -> new` per line."""
+    lines = []
+    for field in dict.fromkeys([*old, *new]):
+        before, after = old.get(field), new.get(field)
+        if isinstance(before, list) or isinstance(after, list):
+            before, after = before or [], after or []
+            lines += [f'- {field}: {item}' for item in before if item not in after]
+            lines += [f'+ {field}: {item}' for item in after if item not in before]
+        elif before != after:
+            lines.append(f'~ {field}: {before!r} -> {after!r}')
+    return lines
+
+
+class EvidenceStore:
+    def __init__(self, path: str = None):
+        self.path = path or config.get_val('cache', 'evidence_db', DB_PATH)
+        self._db = None
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        if self._db is None:  # opened on first use
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._db = sqlite3.connect(self.path)
+            self._db.executescript(SCHEMA)
+        return self._db
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    @staticmethod
+    def _run(row) -> Run:
+        return Run(*row[:7], json.loads(row[7]))
+
+    def put(self, target: str, revision: str | None, task: str, evidences: Dict, duration: float = None) -> int:
+        """Record an analysis run, returns its id."""
+        with self.db:
+            cursor = self.db.execute(
+                'INSERT INTO runs (target, revision, task, created, duration, evidences) VALUES (?, ?, ?, ?, ?, ?)',
+                (normalize_target(target), revision or '', task, time.time(), duration, json.dumps(evidences)))
+        return cursor.lastrowid
+
+    def get(self, target: str, revision: str | None, task: str) -> Run | None:
+        """Latest run of `task` on this revision of `target`."""
+        if not revision:
+            return None
+        row = self.db.execute('SELECT * FROM runs WHERE target = ? AND revision = ? AND task = ? '
+                              'ORDER BY created DESC, id DESC LIMIT 1',
+                              (normalize_target(target), revision, task)).fetchone()
+        return self._run(row) if row else None
+
+    def run(self, run_id: int) -> Run | None:
+        row = self.db.execute('SELECT * FROM runs WHERE id = ?', (run_id,)).fetchone()
+        return self._run(row) if row else None
+
+    def runs(self, target: str = None, limit: int = 50) -> List[Run]:
+        """Latest runs first, of `target` only when given."""
+        if target:
+            rows = self.db.execute('SELECT * FROM runs WHERE target = ? ORDER BY created DESC, id DESC LIMIT ?',
+                                   (normalize_target(target), limit))
+        else:
+            rows = self.db.execute('SELECT * FROM runs ORDER BY created DESC, id DESC LIMIT ?', (limit,))
+        return [self._run(row) for row in rows]
+
+    def set_status(self, run_id: int, status: str):
+        with self.db:
+            self.db.execute('UPDATE runs SET status = ? WHERE id = ?', (status, run_id))
+
+    def prune(self, keep: int = None, older_than: float = None) -> int:
+        """
+        Delete runs, returns how many.
+
+        Args:
+            keep (int): Runs kept per target and task, the latest ones.
+            older_than (float): Delete runs older than this many days.
+        """
+        deleted = 0
+        with self.db:
+            if older_than is not None:
+                deleted += self.db.execute('DELETE FROM runs WHERE created < ?',
+                                           (time.time() - older_than * 86400,)).rowcount
+            if keep is not None:
+                deleted += self.db.execute(
+                    'DELETE FROM runs WHERE id IN (SELECT id FROM (SELECT id, ROW_NUMBER() OVER '
+                    '(PARTITION BY target, task ORDER BY created DESC, id DESC) AS position FROM runs) '
+                    'WHERE position > ?)', (keep,)).rowcount
+        self.db.execute('VACUUM')
+        return deleted
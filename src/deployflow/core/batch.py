@@ -0,0 +1,236 @@
+"""
+Batch deployments: many repositories and regions from one manifest, analyzed and deployed concurrently.
+
+```yaml
+workers: 4            # jobs running at once
+llm_concurrency: 4    # AI calls running at once, over all jobs
+output: fleet_batch   # job folders, defaults to <manifest name>_batch next to the manifest
+defaults:             # applied to every job
+  command: Deploy this app on AWS
+jobs:
+  - repo: services/api                          # paths are relative to the manifest
+    regions: [us-east-1, eu-west-1]              # one job per region, ids api-us-east-1 and api-eu-west-1
+  - id: web
+    repo: https://github.com/Arvo-AI/hello_world.git
+    command: Deploy the Flask app on AWS
+    target: aws
+    evidence_file: web-evidences.json           # skip the analysis
+    analyze_only: false
+```
+
+Every job gets a folder under `output` with its log (`job.log`, everything the job prints), its evidence and its
+deployment directory. The regions of a repository share one analysis, run by the first of their jobs. Jobs share one
+AI client, so `llm_concurrency` bounds the AI calls of the whole batch. Questions to the user are asked one at a time,
+prefixed with the job id. A failing job does not stop the others, the batch ends with a status and timing report of
+every job (also written to `report.json`).
+"""
+import copy
+import json
+import os
+import re
+import threading
+import time
+import traceback
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import List, NamedTuple, Tuple
+
+from deployflow.core import colors, console, trace
+from deployflow.core.policy import get_policy
+from deployflow.core.utils import load_document
+
+WORKERS = 4
+ANSI = re.compile(r'\x1b\[[0-9;]*m')
+
+
+class Job(NamedTuple):
+    id: str
+    repo: str
+    command: str
+    region: str = None
+    target: str = None
+    evidence_file: str = None
+    analyze_only: bool = False
+
+
+class JobResult(NamedTuple):
+    job: Job
+    status: str  # deployed, analyzed, failed or error
+    analysis: float  # seconds
+    deployment: float
+    total: float
+    message: str
+    log: str
+
+    @property
+    def ok(self) -> bool:
+        return self.status in ('deployed', 'analyzed')
+
+
+def _resolve(base: str, path: str | None) -> str | None:
+    if not path or path.startswith(('http://', 'https://', 'git@', 'file://')) or os.path.isabs(path):
+        return path
+    return os.path.normpath(os.path.join(base, path))
+
+
+def load_manifest(path: str) -> Tuple[dict, List[Job]]:
+    """
+    Read a batch manifest.
+
+    Returns:
+        tuple: The settings (workers, llm_concurrency, output) and the jobs, one per repository and region.
+    """
+    manifest = load_document(path) or {}
+    base = os.path.dirname(os.path.abspath(path))
+    defaults = manifest.get('defaults') or {}
+    jobs, ids = [], set()
+    for i, entry in enumerate(manifest.get('jobs') or []):
+        entry = {**defaults, **entry}
+        if not entry.get('repo'):
+            raise ValueError(f"Job {i + 1} of {path} has no repo")
+        if not entry.get('command'):
+            raise ValueError(f"Job {i + 1} of {path} has no command")
+        repo_name = os.path.basename(entry['repo'].rstrip('/\\')).removesuffix('.git')
+        name = entry.get('id') or ''.join(c for c in repo_name if c.isalnum() or c in '-_') or f'job{i + 1}'
+        regions = entry.get('regions') or [entry.get('region')]
+        for region in regions:
+            job_id = f'{name}-{region}' if len(regions) > 1 else name
+            if job_id in ids:
+                raise ValueError(f"Duplicate job id {job_id} in {path}, set an id")
+            ids.add(job_id)
+            jobs.append(Job(job_id, _resolve(base, entry['repo']), entry['command'], region, entry.get('target'),
+                            _resolve(base, entry.get('evidence_file')), bool(entry.get('analyze_only'))))
+    if not jobs:
+        raise ValueError(f"{path} has no jobs")
+    stem = os.path.splitext(os.path.basename(path))[0]
+    settings = {'workers': int(manifest.get('workers') or WORKERS),
+                'llm_concurrency': manifest.get('llm_concurrency'),
+                'output': _resolve(base, manifest.get('output')) or os.path.join(base, stem + '_batch')}
+    return settings, jobs
+
+
+def _last_line(log_path: str) -> str:
+    with open(log_path, 'r', encoding='utf8', errors='replace') as f:
+        lines = [ANSI.sub('', line).strip() for line in f if line.strip()]
+    return lines[-1] if lines else ''
+
+
+class _Analyses:
+    """The analysis of every (repository, command) of a batch, run once by the first job that needs it."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._futures = {}
+
+    def get(self, job: Job, use_cache: bool) -> dict:
+        from deployflow.core.analysis import analyze
+        key = job.repo, job.command
+        with self._lock:
+            owner, future = self._futures.setdefault(key, (job.id, Future()))
+        if owner == job.id:
+            try:
+                future.set_result(analyze.analyze_repository(job.repo, job.command, use_cache))
+            except BaseException as e:  # fatal() included, the jobs waiting for it fail the same way
+                future.set_exception(e)
+        else:
+            print(f"Using the analysis of job {owner}")
+        return copy.deepcopy(future.result())  # every job sets its own target and region
+
+
+def run_job(job: Job, root: str, use_cache: bool = True, analyses: _Analyses = None) -> JobResult:
+    """Analyze and deploy one job, everything it prints goes to its log."""
+    from deployflow.core.analysis import analyze
+    from deployflow.core.deployment import ai_deployer
+    job_dir = os.path.join(root, job.id)
+    os.makedirs(job_dir, exist_ok=True)
+    log_path = os.path.join(job_dir, 'job.log')
+    start = time.perf_counter()
+    analysis = deployment = 0.0
+    status, message = 'error', ''
+    with open(log_path, 'w', encoding='utf8', buffering=1) as log, console.job(job.id, log), \
+            trace.span('job', 'phase', job=job.id):
+        try:
+            step = time.perf_counter()
+            if job.evidence_file:
+                with open(job.evidence_file, 'r', encoding='utf8') as f:
+                    evidences = json.load(f)
+            elif analyses is not None:
+                evidences = analyses.get(job, use_cache)
+            else:
+                evidences = analyze.analyze_repository(job.repo, job.command, use_cache)
+            analysis = time.perf_counter() - step
+            evidences['target'] = job.target or evidences.get('target') or get_policy().target or \
+                console.ask("Enter deployment target (aws): ", 'aws')
+            evidences['target'] = evidences['target'].lower()
+            if job.region:
+                evidences['region'] = job.region
+            with open(os.path.join(job_dir, 'evidences.json'), 'w', encoding='utf8') as f:
+                json.dump(evidences, f, indent=2)
+            if job.analyze_only:
+                status = 'analyzed'
+            else:
+                step = time.perf_counter()
+                deployed = ai_deployer.deploy_target(job.repo, job.command, evidences,
+                                                     target_dir=os.path.join(job_dir, 'deploy'), reuse=use_cache)
+                deployment = time.perf_counter() - step
+                status, message = ('deployed', '') if deployed else ('failed', 'the AI gave up, see the log')
+        except SystemExit:  # fatal()
+            status = 'failed'
+        except Exception as e:
+            status, message = 'error', f'{type(e).__name__}: {e}'
+            traceback.print_exc(file=log)
+    if status == 'failed' and not message:
+        message = _last_line(log_path)
+    return JobResult(job, status, analysis, deployment, time.perf_counter() - start, message, log_path)
+
+
+def report(results: List[JobResult], wall: float) -> str:
+    """Status and timing table of a batch."""
+    width = max(len(result.job.id) for result in results) + 2
+    lines = [f"{'job':<{width}}{'status':<10}{'analysis s':>11}{'deploy s':>10}{'total s':>9}  message"]
+    for result in results:
+        color = colors.GREEN if result.ok else colors.RED
+        lines.append(f'{result.job.id:<{width}}{color}{result.status:<10}{colors.ENDC}{result.analysis:>11.1f}'
+                     f'{result.deployment:>10.1f}{result.total:>9.1f}  {result.message[:80]}')
+    counts = {}
+    for result in results:
+        counts[result.status] = counts.get(result.status, 0) + 1
+    lines.append(f"{len(results)} jobs: {', '.join(f'{count} {status}' for status, count in counts.items())}, "
+                 f"{wall:.1f}s wall clock for {sum(result.total for result in results):.1f}s of jobs")
+    return '\n'.join(lines)
+
+
+def run_batch(path: str, use_cache: bool = True, workers: int = None) -> List[JobResult]:
+    """
+    Run every job of the manifest at `path`, `workers` at a time.
+
+    Returns:
+        list: The result of every job, in manifest order.
+    """
+    from deployflow.core import ai
+    settings, jobs = load_manifest(path)
+    workers = workers or settings['workers']
+    if settings['llm_concurrency']:
+        ai.limit(int(settings['llm_concurrency']))
+    ai.get_ai()  # asks for the API key, if needed, before the jobs start
+    root = settings['output']
+    os.makedirs(root, exist_ok=True)
+    print(f'Running {len(jobs)} jobs, {workers} at a time, logs in {root}')
+    start = time.perf_counter()
+    results, analyses = {}, _Analyses()
+    with console.routed(), ThreadPoolExecutor(workers, thread_name_prefix='deployflow-job') as pool:
+        futures = {pool.submit(run_job, job, root, use_cache, analyses): job for job in jobs}
+        for future in as_completed(futures):
+            result = future.result()
+            results[result.job.id] = result
+            color = colors.GREEN if result.ok else colors.RED
+            print(f'[{result.job.id}] {color}{result.status}{colors.ENDC} in {result.total:.1f}s ({len(results)}/'
+                  f'{len(jobs)}) {result.message}')
+    results = [results[job.id] for job in jobs]
+    wall = time.perf_counter() - start
+    print(report(results, wall))
+    with open(os.path.join(root, 'report.json'), 'w', encoding='utf8') as f:
+        json.dump({'wall': wall, 'jobs': [{**result.job._asdict(), 'status': result.status, 'analysis': result.analysis,
+                                           'deployment': result.deployment, 'total': result.total,
+                                           'message': result.message, 'log': result.log} for result in results]},
+                  f, indent=2)
+    return results
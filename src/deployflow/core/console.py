@@ -0,0 +1,121 @@
+"""
+Terminal input and output of concurrent jobs.
+
+While batch jobs run (`routed`), `sys.stdout` and `sys.stderr` are replaced by routers: what a job's thread prints
+goes to that job's log, everything else to the terminal. Questions to the user (`ask`) are serialized and prefixed with
+the job id, so two jobs never prompt at the same time. Outside of jobs, `ask` is `input`.
+
+In non-interactive mode (`--non-interactive`), `ask` never reads from the terminal: a question with a default is
+answered with it, one without fails the run (or the job) at once.
+"""
+import io
+import sys
+import threading
+from contextlib import contextmanager
+from typing import Callable, TextIO
+
+_local = threading.local()
+_ask_lock = threading.Lock()
+_interactive = True
+
+
+class _Router(io.TextIOBase):
+    def __init__(self, terminal: TextIO):
+        super().__init__()
+        self.terminal = terminal
+
+    def _target(self) -> TextIO:
+        return getattr(_local, 'stream', None) or self.terminal
+
+    @property
+    def encoding(self):
+        return self.terminal.encoding
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        return self._target().write(text)
+
+    def flush(self):
+        self._target().flush()
+
+    def isatty(self) -> bool:
+        return self._target().isatty()
+
+
+@contextmanager
+def routed():
+    """Route output per job for the duration of the block."""
+    from deployflow.logger import handler
+    terminal, errors = sys.stdout, sys.stderr
+    router = _Router(terminal)
+    sys.stdout, sys.stderr = router, _Router(errors)
+    log = handler.setStream(router)
+    try:
+        yield
+    finally:
+        sys.stdout, sys.stderr = terminal, errors
+        handler.setStream(log)
+
+
+@contextmanager
+def job(job_id: str, stream: TextIO):
+    """Send what the current thread prints to `stream`, questions it asks are prefixed with `job_id`."""
+    _local.job, _local.stream = job_id, stream
+    try:
+        yield
+    finally:
+        _local.job = _local.stream = None
+
+
+def bind(fn: Callable) -> Callable:
+    """Wrap a callback run on another thread (e.g. the AI client's) so that it prints where the caller does."""
+    job_id, stream = getattr(_local, 'job', None), getattr(_local, 'stream', None)
+    if stream is None:
+        return fn
+
+    def wrapper(*args, **kwargs):
+        previous = getattr(_local, 'job', None), getattr(_local, 'stream', None)
+        _local.job, _local.stream = job_id, stream
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.job, _local.stream = previous
+
+    return wrapper
+
+
+def set_interactive(interactive: bool):
+    global _interactive
+    _interactive = interactive
+
+
+def interactive() -> bool:
+    return _interactive
+
+
+def ask(prompt: str, default: str = None) -> str:
+    """
+    `input` that is safe to call from concurrent jobs, the question and answer are also written to the job's log.
+
+    An empty answer is `default`, which is also the answer in non-interactive mode.
+    """
+    if not _interactive:
+        if default is None:
+            from deployflow.core.utils import fatal
+            fatal(f"Cannot ask '{prompt.strip()}' in non-interactive mode, answer it in the policy file")
+        print(f'{prompt}{default} (non-interactive default)')
+        return default
+    job_id = getattr(_local, 'job', None)
+    if job_id is None:
+        return input(prompt) or default
+    stream = _local.stream
+    with _ask_lock:
+        _local.stream = None  # the prompt goes to the terminal
+        try:
+            answer = input(f'[{job_id}] {prompt}')
+        finally:
+            _local.stream = stream
+    stream.write(f'{prompt}{answer}\n')
+    return answer or default
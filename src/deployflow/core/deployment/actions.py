@@ -1,7 +1,10 @@
 import os
-import subprocess
+import sys
 
-from deployflow.core import colors
+from deployflow.core import colors, console, trace
+from deployflow.core.deployment import runner
+from deployflow.core.deployment.runner import CommandResult
+from deployflow.core.policy import ASK, DENY, get_policy
 from deployflow.core.utils import fatal
 from deployflow.logger import logger
 
@@ -12,32 +15,33 @@ def write_file(target_folder, file, content):
         f.write(content)
 
 
-def execute_command(target_folder, command) -> tuple[str, str]:
+def _print_output(stream: str, text: str):
+    (sys.stderr if stream == 'stderr' else sys.stdout).write(text)
+    (sys.stderr if stream == 'stderr' else sys.stdout).flush()
+
+
+def execute_command(target_folder, command, timeout: float = None, env: dict = None) -> CommandResult:
     print(f'\t{colors.YELLOW}ai executing command {command}{colors.ENDC}')
-    confirmation = input(f"Execute command '{colors.RED}{command}{colors.ENDC}'? (yes): ") or 'yes'
-    if confirmation.lower() != "yes" and confirmation.lower() != "y":
-        fatal("Command execution aborted")
-    try:
-        result = subprocess.run(
-            command,
-            cwd=target_folder,
-            input="yes\n",
-            text=True,
-            capture_output=True,
-            check=False
-        )
-        logger.debug(result.stdout)
-        if result.returncode != 0:
-            logger.error(result.stderr)
-            print(f'{colors.RED}Error executing command: {result.stderr}{colors.ENDC}')
-        else:
-            print(f'{colors.GREEN}Command executed successfully{colors.ENDC}')
-        if len(result.stdout or '') > 1000:
-            result.stdout = result.stdout[:500] + f"\n<<Truncated output>>\n" + result.stdout[-500:]
-        if len(result.stderr or '') > 1000:
-            result.stderr = result.stderr[:500] + f"\n<<Truncated output>>\n" + result.stderr[-500:]
-        return result.stdout, result.stderr
-    except subprocess.CalledProcessError as e:
-        print(f'{colors.RED}Error executing command: {e.stderr}{colors.ENDC}')
-        logger.error(e.stderr)
-        return "", e.stderr
+    decision = get_policy().check(command)
+    if decision == DENY:
+        fatal(f"Command '{command}' denied by policy")
+    if decision == ASK:
+        if not console.interactive():
+            fatal(f"Command '{command}' is not allowed by the policy, cannot ask in non-interactive mode")
+        with trace.span('confirm command', 'user', command=command):
+            confirmation = console.ask(f"Execute command '{colors.RED}{command}{colors.ENDC}'? (yes): ") or 'yes'
+        if confirmation.lower() != "yes" and confirmation.lower() != "y":
+            fatal("Command execution aborted")
+    with trace.span('command', 'subprocess', command=command) as args:
+        result = runner.run(command, cwd=target_folder, timeout=timeout, input="yes\n", on_output=_print_output,
+                            env=env)
+        args.update(returncode=result.returncode, timed_out=result.timed_out)
+    logger.debug(result)
+    if result.timed_out:
+        print(f'{colors.RED}Command timed out after {result.duration:.0f}s and was killed{colors.ENDC}')
+    elif result.returncode != 0:
+        logger.error(result.stderr)
+        print(f'{colors.RED}Command failed with exit code {result.returncode} ({result.duration:.1f}s){colors.ENDC}')
+    else:
+        print(f'{colors.GREEN}Command executed successfully ({result.duration:.1f}s){colors.ENDC}')
+    return result
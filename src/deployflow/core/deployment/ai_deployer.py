@@ -1,14 +1,18 @@
 import json
 import os.path
 import re
-import shutil
+from contextlib import nullcontext
 from typing import Dict, List
 from pathlib import Path
-from deployflow.core import colors
+from deployflow.core import colors, console, trace
 from deployflow.core.ai import get_ai
-from deployflow.core.analysis.fs import identify_target, copy_target, _onerror
+from deployflow.core.analysis.fs import identify_target
+from deployflow.core.deployment import artifacts, delta, terraform
 from deployflow.core.deployment.actions import execute_command, write_file
-from deployflow.core.deployment.prompts import STAGE_PROMPT, SYSTEM_PROMPT
+from deployflow.core.deployment.memory import Conversation
+from deployflow.core.deployment.packager import package_source
+from deployflow.core.deployment.prompts import REUSED_PROMPT, STAGE_PROMPT, SYSTEM_PROMPT
+from deployflow.core.policy import get_policy
 from deployflow.core.utils import fatal
 from deployflow.logger import logger
 
@@ -16,50 +20,96 @@ CODE_REGEX = r"```\w+ \[?(.+)\]?\s*([\s\S]*?)\s*```"
 SHELL_REGEX = r"```shell\s*(.*?)\s*```"
 
 
-def deploy_target(repo, task, evidences: Dict[str, List[str]]):
+class _Stream:
+    """Prints the tokens of a response as they arrive, and remembers if any did."""
+
+    def __init__(self):
+        self.streamed = False
+
+    def __call__(self, text: str):
+        self.streamed = True
+        print(text, end='', flush=True)
+
+    def end(self, text: str, color: str):
+        """Finish the response: a newline after the streamed text, or `text` when nothing was streamed."""
+        print()
+        if not self.streamed:
+            print()
+            print(color + text + colors.ENDC)
+
+
+def _write_main_tf(target_dir: str, conversation: Conversation, content: str, follow: str):
+    """Write main.tf and initialize terraform, from the providers of an earlier deployment when it can."""
+    write_file(target_dir, 'main.tf', content)
+    with terraform.locked():
+        reused = terraform.warm(target_dir)
+        result = execute_command(target_dir, 'terraform init', env=terraform.env())
+        if not result.ok or result.stderr.strip():
+            fatal(f"Error initializing terraform:\n{colors.RED}{result.stderr}{colors.ENDC}")
+        print(terraform.save(target_dir, result.duration, reused))
+    conversation.wrote('main.tf', content)
+    conversation.ran('terraform init', result, follow=follow)
+
+
+def deploy_target(repo, task, evidences: Dict[str, List[str]], target_dir: str = None, reuse: bool = True) -> bool:
+    """
+    Deploy `repo` with the AI, returns True once it reports the deployment complete, False if it gives up.
+
+    The user is asked for the deployment directory unless `target_dir` is given or the policy has one. With `reuse`,
+    the files of an earlier successful deployment with the same evidence are used instead of generating them.
+    """
     print("・┈┈・┈┈・┈┈・")
     repo_type, repo_name = identify_target(repo)
     repo_name = ''.join([c for c in repo_name if c.isalnum()])
     _DEFAULT_DIR = repo_name + "_deploy"
-    target_dir = input(f"Enter the local directory to store deployment details ({_DEFAULT_DIR}): ") or _DEFAULT_DIR
+    target_dir = target_dir or get_policy().directory(repo_name)
+    if not target_dir:
+        with trace.span('deployment directory', 'user'):
+            target_dir = console.ask(f"Enter the local directory to store deployment details ({_DEFAULT_DIR}): ",
+                                     _DEFAULT_DIR)
     if not os.path.exists(target_dir):
         os.makedirs(target_dir, exist_ok=True)
-    if repo_type == "zip":
-        shutil.copyfile(repo, target_dir + "/src.zip")
-    else:
-        if repo_type == 'dir':
-            p1 = Path(repo).resolve()
-            p2 = Path(target_dir).resolve()
-            if p1 in p2.parents or p2 in p1.parents or p1 == p2:
-                fatal("Target directory cannot be a subdirectory of the repository (or vice versa)")
-        copy_target(repo, target_dir + "/src")
-        shutil.make_archive(target_dir + "/src", 'zip', target_dir + "/src")
-        shutil.rmtree(target_dir + "/src", onerror=_onerror)
+    if repo_type == 'dir':
+        p1 = Path(repo).resolve()
+        p2 = Path(target_dir).resolve()
+        if p1 in p2.parents or p2 in p1.parents or p1 == p2:
+            fatal("Target directory cannot be a subdirectory of the repository (or vice versa)")
+    with trace.span('package source', 'phase') as args:
+        report = package_source(repo, target_dir + "/src.zip")
+        args.update(files=report.files, bytes=report.bytes, ignored=report.ignored)
+        delta_report = delta.prepare(target_dir)
+    print(report)
+    if delta_report:
+        print(delta_report)
     print("Creating ssh keypair (this will be used to access the server)")
     execute_command(target_dir, f'ssh-keygen -t rsa -b 4096 -C "{repo_name}" -f id_rsa -N ""')
     execute_command(target_dir, 'chmod 400 id_rsa')
     print(f'Deploying "{colors.GREEN}{task}{colors.ENDC}" on "{colors.GREEN}{repo}{colors.ENDC}" ...{colors.ENDC}')
     client = get_ai()
-    messages = [
-        {
-            "role": "system",
-            "content": SYSTEM_PROMPT.replace("%%EVIDENCE%%", json.dumps(evidences, indent=2)).replace("%%TASK%%", task)
-        },
-        {
-            "role": "user",
-            "content": STAGE_PROMPT[0]
-        }
-    ]
+    cached = artifacts.lookup(evidences, repo_name) if reuse else None
+    example = artifacts.nearest(evidences, repo_name) if reuse and not cached else None
+    conversation = Conversation(
+        SYSTEM_PROMPT.replace("%%EVIDENCE%%", json.dumps(evidences, indent=2)).replace("%%TASK%%", task),
+        STAGE_PROMPT[0] + (delta_report.prompt if delta_report else "") + (example.prompt if example else ""))
     stage = 0
+    if cached:
+        print(colors.BLUE + str(cached) + colors.ENDC)
+        conversation.assistant(f"```hcl main.tf\n{cached.main_tf}\n```\nReused main.tf")
+        _write_main_tf(target_dir, conversation, cached.main_tf, follow='')
+        conversation.assistant(f"```bash auto-deploy.sh\n{cached.auto_deploy}\n```\nReused auto-deploy.sh")
+        file_content = delta.add_apply_step(cached.auto_deploy)
+        write_file(target_dir, 'auto-deploy.sh', file_content)
+        conversation.wrote('auto-deploy.sh', file_content)
+        conversation.user(REUSED_PROMPT)
+        stage = 2
+    elif example:
+        print(colors.BLUE + str(example) + colors.ENDC)
     while True:
-        response = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=messages,
-            max_tokens=1000,
-            stream=False
-        )
-        res_text = response.choices[0].message.content.strip()
-        messages.append({"role": "assistant", "content": res_text})
+        messages = conversation.messages
+        logger.debug(f"deployment prompt: {len(messages)} messages, ~{conversation.tokens} tokens")
+        stream = _Stream()
+        res_text = client.complete(messages, on_token=console.bind(stream), max_tokens=1000).strip()
+        conversation.assistant(res_text)
         logger.debug(res_text)
         if stage == 0:
             search = re.search(CODE_REGEX, res_text)
@@ -67,68 +117,48 @@ def deploy_target(repo, task, evidences: Dict[str, List[str]]):
                 file_name, file_content = search.groups()
                 if file_name != "main.tf":
                     fatal(f"AI provided wrong terraform configuration file name '{file_name}'")
-                write_file(target_dir, file_name, file_content)
             else:
                 fatal("AI did not provide terraform configuration file 'main.tf'")
-            print()
-            print()
-            print(colors.BLUE + res_text.split('\n')[-1] + colors.ENDC)
-            std, err = execute_command(target_dir, 'terraform init')
-            if err.strip():
-                fatal(f"Error initializing terraform:\n{colors.RED}{err}{colors.ENDC}")
+            stream.end(res_text.split('\n')[-1], colors.BLUE)
+            _write_main_tf(target_dir, conversation, file_content, follow=STAGE_PROMPT[1])
             stage = 1
-            messages.append({
-                "role": "user",
-                "content": f"Result of `terraform init`:\n{std}\n{'Error: ' + err if err.strip() else ''}\n\n" +
-                           STAGE_PROMPT[1]
-            })
         elif stage == 1:
             search = re.search(CODE_REGEX, res_text)
             if search:
                 file_name, file_content = search.groups()
                 if file_name != "auto-deploy.sh":
                     fatal(f"AI provided wrong auto-deploy script file name '{file_name}'")
-                print()
-                print()
-                print(colors.BLUE + res_text.split('\n')[-1] + colors.ENDC)
+                stream.end(res_text.split('\n')[-1], colors.BLUE)
+                file_content = delta.add_apply_step(file_content)
                 write_file(target_dir, file_name, file_content)
             else:
-                print(res_text)
+                stream.end(res_text, '')
                 fatal("AI did not provide auto-deploy script file 'auto-deploy.sh'")
             stage = 2
-            messages.append({
-                "role": "user",
-                "content": f"created file `auto-deploy.sh`"
-            })
+            conversation.wrote(file_name, file_content)
         elif '<<COMPLETION>>' in res_text:
-            print()
-            print()
-            print(colors.GREEN + res_text + colors.ENDC)
-            break
+            stream.end(res_text, colors.GREEN)
+            delta.commit(target_dir)
+            artifacts.save(evidences, target_dir, repo_name)
+            return True
         elif '<<ERROR>>' in res_text:
-            print()
-            print()
-            print(colors.RED + res_text + colors.ENDC)
-            break
+            stream.end(res_text, colors.RED)
+            if cached:
+                artifacts.forget(cached.key)
+            return False
         else:
             file_write = re.search(CODE_REGEX, res_text)
             shell_command = re.search(SHELL_REGEX, res_text)
-            print()
-            print()
-            print(colors.BLUE + res_text.split('\n')[-1] + colors.ENDC)
+            stream.end(res_text.split('\n')[-1], colors.BLUE)
             if file_write:
                 file_name, file_content = file_write.groups()
+                if file_name == "auto-deploy.sh":
+                    file_content = delta.add_apply_step(file_content)
                 write_file(target_dir, file_name, file_content)
-                messages.append({
-                    "role": "user",
-                    "content": f"created file `{file_name}`"
-                })
+                conversation.wrote(file_name, file_content)
             if shell_command:
                 command = shell_command.groups()[0]
-                std, err = execute_command(target_dir, command)
-                messages.append({
-                    "role": "user",
-                    "content": f"Result of `{command}`:\n{std}\n{'Error: ' + err if err.strip() else ''}"
-                })
+                with terraform.locked() if 'terraform init' in command else nullcontext():
+                    conversation.ran(command, execute_command(target_dir, command, env=terraform.env()))
             if not file_write and not shell_command:
                 print(f'{colors.RED}AI did not give an response.{colors.ENDC}')
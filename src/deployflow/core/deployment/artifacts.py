@@ -0,0 +1,172 @@
+"""
+Reuse of the `main.tf` and `auto-deploy.sh` of successful deployments.
+
+When a deployment completes, its final `main.tf` and `auto-deploy.sh` are kept under a fingerprint of the evidence it
+was made from: platform, frameworks, ports, build, update and deployment commands, target, region and instance type,
+normalized (case, whitespace, order and duplicates do not matter). A later deployment with the same fingerprint skips
+the two generation stages and starts from those files. The repository name is replaced by the current one only in the
+name attributes of `main.tf` (e.g. `key_name = "shop-key-1a2b"`), as a whole word: `~/app` and `app.py` of a
+repository named `app` are left alone. Everything else is reused as is, resource names have random suffixes.
+
+Without an exact match, the closest earlier deployment to the same target (when similar enough) is given to the AI as
+an example to start from.
+
+Entries live under `~/.deployflow/artifacts` (`artifact_cache` in the `[deployment]` section of the config file). An
+entry whose reused files end in a failed deployment is dropped.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Set
+
+from deployflow import config
+from deployflow.core.analysis.budget import truncate
+from deployflow.core.deployment.delta import APPLY_STEP
+from deployflow.core.deployment.prompts import EXAMPLE_PROMPT
+
+CACHE_DIR = os.path.join(Path.home(), '.deployflow', 'artifacts')
+FIELDS = ['platform', 'frameworks', 'ports', 'build_commands', 'update_commands', 'deployment_commands', 'target',
+          'region', 'instance_type']
+FILES = ['main.tf', 'auto-deploy.sh']
+REPO = '%%DEPLOYFLOW_REPO%%'
+MIN_SIMILARITY = 0.5  # of the evidence items, for a near match to be offered as an example
+EXAMPLE_TOKENS = 1000  # per file of an example
+NAME_ATTRIBUTE = re.compile(r'^(\s*(?:key_name|name|name_prefix|Name)\s*=\s*")([^"\n]*)(")', re.M)
+
+
+class Artifacts(NamedTuple):
+    key: str
+    main_tf: str
+    auto_deploy: str
+    similarity: float  # 1.0 for an exact match
+    differences: List[str]  # evidence items of only one of the two deployments
+
+    @property
+    def prompt(self) -> str:
+        """Addition to the first stage prompt offering these files as an example."""
+        return EXAMPLE_PROMPT.replace('%%DIFFERENCES%%', ', '.join(self.differences) or 'none') \
+            .replace('%%MAIN_TF%%', truncate(self.main_tf, EXAMPLE_TOKENS)) \
+            .replace('%%AUTO_DEPLOY%%', truncate(self.auto_deploy, EXAMPLE_TOKENS))
+
+    def __str__(self):
+        if self.similarity == 1.0:
+            return 'Reusing main.tf and auto-deploy.sh of an earlier successful deployment with the same evidence'
+        return f'Giving the AI an earlier deployment as an example ({self.similarity:.0%} similar evidence)'
+
+
+def cache_dir() -> str:
+    return config.get_val('deployment', 'artifact_cache', CACHE_DIR)
+
+
+def _items(value) -> List[str]:
+    values = value if isinstance(value, list) else [value]
+    return sorted({' '.join(str(item).split()).lower() for item in values if str(item).strip()})
+
+
+def normalize(evidences: dict) -> Dict[str, List[str]]:
+    """The fingerprinted part of the evidence, in a canonical form."""
+    return {field: _items(evidences.get(field) or []) for field in FIELDS}
+
+
+def fingerprint(evidences: dict) -> str:
+    key = json.dumps(normalize(evidences), sort_keys=True)
+    return hashlib.sha256(key.encode('utf8')).hexdigest()[:24]
+
+
+def _flat(normalized: Dict[str, List[str]]) -> Set[str]:
+    return {f'{field}: {item}' for field, items in normalized.items() for item in items}
+
+
+def _rename(main_tf: str, old: str, new: str) -> str:
+    """Replace the word `old` by `new` in the name attributes of `main.tf`."""
+    word = re.compile(rf'(?<![A-Za-z0-9]){re.escape(old)}(?![A-Za-z0-9])')
+    return NAME_ATTRIBUTE.sub(lambda match: match.group(1) + word.sub(lambda _: new, match.group(2)) + match.group(3),
+                              main_tf)
+
+
+def _read(entry: str, repo_name: str) -> List[str] | None:
+    contents = []
+    for name in FILES:
+        try:
+            with open(os.path.join(entry, name), 'r', encoding='utf8') as f:
+                contents.append(f.read().replace(REPO, repo_name))
+        except OSError:
+            return None
+    return contents
+
+
+def lookup(evidences: dict, repo_name: str) -> Artifacts | None:
+    """Files of an earlier successful deployment with the same evidence fingerprint."""
+    key = fingerprint(evidences)
+    contents = _read(os.path.join(cache_dir(), key), repo_name)
+    return Artifacts(key, *contents, 1.0, []) if contents else None
+
+
+def nearest(evidences: dict, repo_name: str) -> Artifacts | None:
+    """Files of the earlier deployment to the same target whose evidence is the most similar, if similar enough."""
+    root = cache_dir()
+    if not os.path.isdir(root):
+        return None
+    normalized = normalize(evidences)
+    items = _flat(normalized)
+    best = None
+    for key in os.listdir(root):
+        if key.endswith('.tmp'):  # a save in progress
+            continue
+        try:
+            with open(os.path.join(root, key, 'meta.json'), 'r', encoding='utf8') as f:
+                other = json.load(f)['evidence']
+        except (OSError, ValueError, KeyError):
+            continue
+        if other.get('target') != normalized['target']:
+            continue
+        other_items = _flat(other)
+        similarity = len(items & other_items) / (len(items | other_items) or 1)
+        if similarity >= MIN_SIMILARITY and (not best or similarity > best[0]):
+            best = similarity, key, sorted(items ^ other_items)
+    if not best:
+        return None
+    contents = _read(os.path.join(root, best[1]), repo_name)
+    return Artifacts(best[1], *contents, best[0], best[2]) if contents else None
+
+
+def save(evidences: dict, target_dir: str, repo_name: str) -> str | None:
+    """Keep the files of a successful deployment in `target_dir`, returns the entry's key."""
+    contents = []
+    for name in FILES:
+        path = os.path.join(target_dir, name)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf8') as f:
+            content = f.read().replace(APPLY_STEP, '')  # added again by the deployment that reuses it
+        contents.append(_rename(content, repo_name, REPO) if name == 'main.tf' and repo_name else content)
+    key = fingerprint(evidences)
+    entry = os.path.join(cache_dir(), key)
+    os.makedirs(cache_dir(), exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=key + '.', suffix='.tmp', dir=cache_dir())
+    try:
+        for name, content in zip(FILES, contents):
+            with open(os.path.join(tmp, name), 'w', encoding='utf8') as f:
+                f.write(content)
+        with open(os.path.join(tmp, 'meta.json'), 'w', encoding='utf8') as f:
+            json.dump({'evidence': normalize(evidences), 'saved': str(datetime.now())}, f, indent=2)
+        shutil.rmtree(entry, ignore_errors=True)
+        try:
+            os.replace(tmp, entry)
+        except OSError:
+            if not os.path.isdir(entry):
+                raise
+            # another deployment with the same evidence saved its files in the meantime, either will do
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return key
+
+
+def forget(key: str):
+    """Drop an entry, e.g. when its files did not deploy."""
+    shutil.rmtree(os.path.join(cache_dir(), key), ignore_errors=True)
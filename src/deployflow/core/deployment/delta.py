@@ -0,0 +1,171 @@
+"""
+Delta uploads for re-deploys.
+
+Every `src.zip` carries a manifest of the sha256 of each file (`.deployflow/manifest.json`), a copy of the manifest of
+the last successful deployment is kept in the deployment directory. When the deployment directory already has one, the
+files that changed since are written to `src.delta.zip` (copied from `src.zip` without recompression), together with the
+list of deleted files and the hash of the manifest the delta applies to.
+
+On the server, the step `APPLY_STEP` added to `auto-deploy.sh` applies `~/src.delta.zip` to the unzipped source in `~/`,
+and refuses to when the server does not have the manifest the delta was built against. A server that already has the
+new source (new or replaced servers get the whole `src.zip`) skips the delta. `apply_delta` does the same locally.
+"""
+import hashlib
+import json
+import os
+import zipfile
+from typing import Dict, List, NamedTuple
+
+from deployflow.core.deployment.packager import CHUNK_SIZE, _Writer
+from deployflow.core.deployment.prompts import REDEPLOY_PROMPT
+
+MANIFEST = '.deployflow/manifest.json'
+DELETED = '.deployflow/deleted'
+BASE = '.deployflow/base'
+DELTA_ZIP = 'src.delta.zip'
+LAST_MANIFEST = 'manifest.json'  # of the last successful deployment, in the deployment directory
+NEXT_MANIFEST = 'manifest.next.json'  # of the current deployment, becomes LAST_MANIFEST when it succeeds
+
+APPLY_STEP = """
+# deployflow: apply src.delta.zip (only the files changed since the last deployment) to the source in ~/
+if [ -f ~/src.delta.zip ]; then
+  base=$(unzip -p ~/src.delta.zip .deployflow/base)
+  target=$(unzip -p ~/src.delta.zip .deployflow/manifest.json | sha256sum | cut -d' ' -f1)
+  current=$(sha256sum ~/.deployflow/manifest.json 2>/dev/null | cut -d' ' -f1)
+  if [ "$target" = "$current" ]; then
+    echo "source already up to date, src.delta.zip not needed"
+  elif [ "$base" != "$current" ]; then
+    echo "src.delta.zip was built for another version of the source, upload src.zip instead" >&2
+    exit 1
+  else
+    unzip -p ~/src.delta.zip .deployflow/deleted | while IFS= read -r path; do rm -f -- ~/"$path"; done
+    unzip -q -o ~/src.delta.zip -d ~ -x .deployflow/deleted .deployflow/base
+  fi
+  rm -f ~/src.delta.zip
+fi
+"""
+
+class DeltaReport(NamedTuple):
+    changed: List[str]
+    deleted: List[str]
+    size: int  # bytes of the delta zip
+    full_size: int  # bytes of src.zip
+
+    @property
+    def prompt(self) -> str:
+        """Addition to the first stage prompt telling the AI to upload the delta."""
+        return REDEPLOY_PROMPT.replace('%%CHANGED%%', str(len(self.changed))).replace('%%DELETED%%',
+                                                                                      str(len(self.deleted)))
+
+    def __str__(self):
+        return (f'Re-deploy: {len(self.changed)} changed and {len(self.deleted)} deleted files, uploading '
+                f'{self.size / 1024 / 1024:.1f} MB instead of {self.full_size / 1024 / 1024:.1f} MB')
+
+
+def _dumps(manifest: Dict[str, str]) -> bytes:
+    return json.dumps(manifest, sort_keys=True, separators=(',', ':')).encode('utf8')
+
+
+def manifest_hash(manifest: Dict[str, str]) -> str:
+    """Hash of the manifest file as it is stored, what `sha256sum` prints for it on the server."""
+    return hashlib.sha256(_dumps(manifest)).hexdigest()
+
+
+def build_manifest(zip_ref: zipfile.ZipFile) -> Dict[str, str]:
+    manifest = {}
+    for info in zip_ref.infolist():
+        if info.is_dir() or info.filename.startswith('.deployflow/'):
+            continue
+        digest = hashlib.sha256()
+        with zip_ref.open(info) as f:
+            while chunk := f.read(CHUNK_SIZE):
+                digest.update(chunk)
+        manifest[info.filename] = digest.hexdigest()
+    return manifest
+
+
+def stamp(zip_path: str) -> Dict[str, str]:
+    """Add the manifest of the files in `zip_path` to it, returns the manifest."""
+    with zipfile.ZipFile(zip_path, 'a') as zip_ref:
+        if MANIFEST in zip_ref.NameToInfo:
+            return json.loads(zip_ref.read(MANIFEST))
+        manifest = build_manifest(zip_ref)
+        zip_ref.writestr(MANIFEST, _dumps(manifest))
+    return manifest
+
+
+def write_delta(zip_path: str, old: Dict[str, str], new: Dict[str, str], dest: str) -> DeltaReport:
+    """Write the files of `zip_path` that are new or changed from `old`, and the deleted ones, to the zip `dest`."""
+    changed = sorted(name for name, digest in new.items() if old.get(name) != digest)
+    deleted = sorted(name for name in old if name not in new)
+    writer = _Writer(dest)
+    with open(zip_path, 'rb') as f, zipfile.ZipFile(f) as zip_ref:
+        for name in changed:
+            writer.write_raw(zip_ref.getinfo(name), f)
+    writer.zip.writestr(DELETED, ''.join(name + '\n' for name in deleted))
+    writer.zip.writestr(BASE, manifest_hash(old) + '\n')
+    writer.zip.writestr(MANIFEST, _dumps(new))
+    writer.close()
+    return DeltaReport(changed, deleted, os.path.getsize(dest), os.path.getsize(zip_path))
+
+
+def apply_delta(delta_path: str, root: str) -> bool:
+    """
+    Apply a delta to the source unzipped in `root`, like `APPLY_STEP` does on the server.
+
+    Returns:
+        bool: False when `root` already has the source the delta leads to, nothing is changed then.
+    """
+    current = ''
+    if os.path.exists(os.path.join(root, MANIFEST)):
+        with open(os.path.join(root, MANIFEST), 'rb') as f:
+            current = hashlib.sha256(f.read()).hexdigest()
+    with zipfile.ZipFile(delta_path) as zip_ref:
+        if hashlib.sha256(zip_ref.read(MANIFEST)).hexdigest() == current:
+            return False
+        if zip_ref.read(BASE).decode().strip() != current:
+            raise ValueError(f'{delta_path} was built for another version of the source')
+        for name in zip_ref.read(DELETED).decode('utf8').splitlines():
+            if os.path.exists(os.path.join(root, name)):
+                os.remove(os.path.join(root, name))
+        zip_ref.extractall(root, [name for name in zip_ref.namelist() if name not in (DELETED, BASE)])
+    return True
+
+
+def add_apply_step(script: str) -> str:
+    """Insert `APPLY_STEP` at the top of an `auto-deploy.sh`, after its shebang."""
+    if APPLY_STEP in script:
+        return script
+    if script.startswith('#!'):
+        shebang, _, rest = script.partition('\n')
+        return shebang + '\n' + APPLY_STEP + rest
+    return '#!/bin/bash\n' + APPLY_STEP + script
+
+
+def prepare(target_dir: str) -> DeltaReport | None:
+    """
+    Add the manifest to `src.zip` in `target_dir`, and write `src.delta.zip` when an earlier deployment succeeded.
+
+    Returns:
+        DeltaReport: What the delta contains, None for a first deployment.
+    """
+    zip_path = os.path.join(target_dir, 'src.zip')
+    manifest = stamp(zip_path)
+    with open(os.path.join(target_dir, NEXT_MANIFEST), 'wb') as f:
+        f.write(_dumps(manifest))
+    delta = os.path.join(target_dir, DELTA_ZIP)
+    if os.path.exists(delta):
+        os.remove(delta)
+    last = os.path.join(target_dir, LAST_MANIFEST)
+    if not os.path.exists(last):
+        return None
+    with open(last, 'r', encoding='utf8') as f:
+        old = json.load(f)
+    return write_delta(zip_path, old, manifest, delta)
+
+
+def commit(target_dir: str):
+    """Record the manifest of the current deployment as deployed, the next one is a delta against it."""
+    pending = os.path.join(target_dir, NEXT_MANIFEST)
+    if os.path.exists(pending):
+        os.replace(pending, os.path.join(target_dir, LAST_MANIFEST))
@@ -0,0 +1,156 @@
+"""
+Bounded conversation memory for the deployment loop.
+
+The deployment is one long conversation: every file the AI writes and every command output is a message, and the
+whole conversation is re-sent on every call. `Conversation` keeps the system prompt and the most recent turns verbatim
+and folds older turns into a single structured summary: the files written (with their latest content), the commands
+run and whether they failed, the resources terraform created or destroyed, its outputs, and the errors seen. The
+prompt stays about the same size however long the repair loop runs.
+
+A turn is one AI response and the user messages answering it (files written, command results).
+
+Token counts are estimates, see `deployflow.core.analysis.budget`.
+"""
+import re
+from typing import Dict, List
+
+from deployflow import config
+from deployflow.core.analysis.budget import estimate_tokens, truncate
+from deployflow.core.deployment.runner import CommandResult
+
+MEMORY_BUDGET = 6000  # tokens per request, system prompt included
+KEEP_TURNS = 4  # most recent turns always sent verbatim, unless they alone exceed the budget
+MAX_COMMANDS = 12  # commands listed in the summary, older ones are only counted
+MAX_ERRORS = 8
+FILES_SHARE = 3  # files of the summary may use 1/3 of the budget
+
+CREATED = re.compile(r'^(\S+): Creation complete after \S+(?: \[id=(.*?)\])?', re.M)
+DESTROYED = re.compile(r'^(\S+): Destruction complete', re.M)
+APPLY = re.compile(r'^(?:Apply|Destroy) complete! Resources: .*$', re.M)
+OUTPUT = re.compile(r'^(\w+) = (.+)$', re.M)
+ERROR = re.compile(r'^[│╷\s]*Error: (.+)$', re.M)
+
+
+def _errors(std: str, err: str) -> List[str]:
+    errors = ERROR.findall(std + '\n' + err)
+    if not errors and err.strip():
+        errors = [next(line.strip() for line in err.splitlines() if line.strip())]
+    return [error.strip()[:200] for error in errors]
+
+
+class Conversation:
+    """
+    Chat messages of a deployment, compacted to fit a token budget.
+
+    Args:
+        system (str): System prompt, always sent first.
+        prompt (str): The first user message.
+        budget (int): Tokens per request, defaults to the `deployment.memory_budget` config value.
+        keep (int): Number of recent turns kept verbatim.
+    """
+
+    def __init__(self, system: str, prompt: str, budget: int = None, keep: int = KEEP_TURNS):
+        self.system = {'role': 'system', 'content': system}
+        self.budget = budget or int(config.get_val('deployment', 'memory_budget', MEMORY_BUDGET))
+        self.keep = keep
+        self._opening = [{'role': 'user', 'content': prompt}]  # user messages before the first kept turn
+        self._turns: List[dict] = []
+        self._compacted = 0
+        self.files: Dict[str, str] = {}
+        self.commands: List[str] = []
+        self.resources: Dict[str, str] = {}
+        self.outputs: Dict[str, str] = {}
+        self.errors: List[str] = []
+        self.applies: List[str] = []
+
+    def assistant(self, content: str):
+        """Start a new turn with the AI's response."""
+        self._turns.append({'messages': [{'role': 'assistant', 'content': content}], 'files': {}, 'commands': []})
+
+    def user(self, content: str):
+        self._current.append({'role': 'user', 'content': content})
+
+    @property
+    def _current(self) -> List[dict]:
+        return self._turns[-1]['messages'] if self._turns else self._opening
+
+    def wrote(self, file_name: str, content: str):
+        """Record a file the AI wrote and tell it so."""
+        if self._turns:
+            self._turns[-1]['files'][file_name] = content
+        self.user(f"created file `{file_name}`")
+
+    def ran(self, command: str, result: CommandResult, follow: str = ''):
+        """Record a command and send its output, followed by `follow`."""
+        if self._turns:
+            self._turns[-1]['commands'].append((command, result))
+        status = 'timed out' if result.timed_out else f'exit code {result.returncode}'
+        content = f"Result of `{command}` ({status}, {result.duration:.1f}s):\n{result.stdout}\n" \
+                  f"{'Error: ' + result.stderr if result.stderr.strip() else ''}"
+        self.user(content + (f"\n\n{follow}" if follow else ''))
+
+    def _fold(self, turn: dict):
+        """Merge the facts of `turn` into the summary."""
+        self.files.update(turn['files'])
+        for command, result in turn['commands']:
+            std = result.stdout
+            errors = _errors(std, result.stderr)
+            if result.timed_out:
+                errors.append(f'`{command}` timed out after {result.duration:.0f}s')
+            status = 'ok' if result.ok and not errors else f'failed (exit code {result.returncode})'
+            self.commands.append(f"`{command}`: {status}")
+            for address, resource_id in CREATED.findall(std):
+                self.resources[address] = resource_id
+            for address in DESTROYED.findall(std):
+                self.resources.pop(address, None)
+            self.applies += APPLY.findall(std)
+            if 'Outputs:' in std:
+                self.outputs.update(OUTPUT.findall(std.split('Outputs:', 1)[1]))
+            for error in errors:
+                if error in self.errors:
+                    self.errors.remove(error)
+                self.errors.append(error)
+        self._compacted += 1
+
+    def summary(self, budget: int) -> str:
+        lines = [f'Summary of the {self._compacted} earlier steps of this deployment (their messages were removed):']
+        if self.commands:
+            earlier = len(self.commands) - MAX_COMMANDS
+            lines.append('Commands run:' + (f' ({earlier} earlier commands not listed)' if earlier > 0 else ''))
+            lines += [f'- {command}' for command in self.commands[-MAX_COMMANDS:]]
+        if self.resources:
+            lines.append('Resources created: ' + ', '.join(
+                f'{address} [id={resource_id}]' if resource_id else address for address, resource_id in
+                self.resources.items()))
+        if self.applies:
+            lines.append(f'Last apply: {self.applies[-1]}')
+        if self.outputs:
+            lines.append('Outputs: ' + ', '.join(f'{name} = {value}' for name, value in self.outputs.items()))
+        if self.errors:
+            lines.append('Errors seen (most recent last):')
+            lines += [f'- {error}' for error in self.errors[-MAX_ERRORS:]]
+        if self.files:
+            share = max(budget // len(self.files), 100)
+            lines.append('Files written in those steps, last version:')
+            for name, content in self.files.items():
+                lines.append(f'=== file: {name}\n{truncate(content, share)}\n===')
+        return '\n'.join(lines)
+
+    @property
+    def messages(self) -> List[Dict[str, str]]:
+        """The messages to send: system prompt, summary of the compacted turns, then the recent turns verbatim."""
+        while len(self._turns) > self.keep or (len(self._turns) > 1 and self.tokens > self.budget):
+            self._fold(self._turns.pop(0))
+            self._opening = []
+        opening = self._opening
+        if self._compacted:
+            opening = [{'role': 'user', 'content': self.summary(self.budget // FILES_SHARE)}]
+        return [self.system] + opening + [message for turn in self._turns for message in turn['messages']]
+
+    @property
+    def tokens(self) -> int:
+        """Estimated tokens of the messages as they would be sent now."""
+        turns = sum(estimate_tokens(message['content']) for turn in self._turns for message in turn['messages'])
+        opening = estimate_tokens(self.summary(self.budget // FILES_SHARE)) if self._compacted else \
+            sum(estimate_tokens(message['content']) for message in self._opening)
+        return estimate_tokens(self.system['content']) + opening + turns
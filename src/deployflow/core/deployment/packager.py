@@ -0,0 +1,314 @@
+"""
+Single-pass packaging of the source code into `src.zip`.
+
+Entries are streamed from the source straight into the zip, nothing is extracted or copied to disk first:
+
+- zip: members are copied raw, their compressed bytes pass through without being inflated and deflated again (remote
+  zips only download the members that are kept)
+- git: a depth 1 bare clone streamed through `git archive`
+- tar / tar.gz: members are read from the archive in order
+- folders: walked once, ignored folders are never entered
+
+Paths matched by a `.gitignore` or `.dockerignore` (or one of `DEFAULT_IGNORE`) are left out. `.gitignore` patterns
+apply to the folder of the file, `.dockerignore` patterns are anchored to it.
+"""
+import copy
+import io
+import os
+import re
+import shutil
+import struct
+import subprocess
+import tarfile
+import tempfile
+import time
+import zipfile
+from typing import BinaryIO, Callable, Dict, Iterator, List, NamedTuple, Tuple
+
+from deployflow.core.analysis.fs import _onerror, identify_target
+
+DEFAULT_IGNORE = ['.git/', 'node_modules/', '.venv/', '__pycache__/', '.DS_Store']
+IGNORE_FILES = ('.gitignore', '.dockerignore')
+STORED_SUFFIXES = ('.zip', '.gz', '.tgz', '.bz2', '.xz', '.7z', '.jar', '.war', '.whl', '.png', '.jpg', '.jpeg', '.gif',
+                   '.webp', '.ico', '.mp3', '.mp4', '.woff', '.woff2', '.pdf')  # already compressed
+CHUNK_SIZE = 1024 * 1024
+
+
+def _compile(pattern: str, anchored: bool) -> re.Pattern:
+    if pattern.startswith('/') or '/' in pattern.rstrip('/'):
+        anchored = True
+    pattern = pattern.strip('/')
+    regex, i = '', 0
+    while i < len(pattern):
+        if pattern.startswith('**/', i):
+            regex, i = regex + '(?:.*/)?', i + 3
+        elif pattern.startswith('**', i):
+            regex, i = regex + '.*', i + 2
+        elif pattern[i] == '*':
+            regex, i = regex + '[^/]*', i + 1
+        elif pattern[i] == '?':
+            regex, i = regex + '[^/]', i + 1
+        elif pattern[i] == '[' and ']' in pattern[i + 2:]:
+            end = pattern.index(']', i + 2)
+            body = pattern[i + 1:end]
+            regex, i = regex + '[' + ('^' + body[1:] if body.startswith('!') else body) + ']', end + 1
+        else:
+            regex, i = regex + re.escape(pattern[i]), i + 1
+    return re.compile(regex if anchored else '(?:.*/)?' + regex)
+
+
+class Ignore:
+    """
+    Gitignore-style path matcher, the last matching pattern wins and nothing inside an ignored folder is kept.
+
+    Paths use "/" and are relative to the source root, folders are passed without a trailing "/".
+    """
+
+    def __init__(self, patterns: List[str] = DEFAULT_IGNORE):
+        self._rules: List[Tuple[str, re.Pattern, bool, bool]] = []
+        self._folders: Dict[str, bool] = {}
+        self.add('', '\n'.join(patterns))
+
+    def add(self, base: str, text: str, anchored: bool = False):
+        """Add the patterns of an ignore file in the folder `base` ("" for the root, otherwise ending with "/")."""
+        for line in text.splitlines():
+            line = line.rstrip()
+            if not line or line.startswith('#'):
+                continue
+            negate = line.startswith('!')
+            line = line[1:] if negate else line
+            self._rules.append((base, _compile(line, anchored), negate, line.endswith('/')))
+        self._folders.clear()
+
+    def add_file(self, path: str, text: str):
+        folder, name = path.rsplit('/', 1) if '/' in path else ('', path)
+        self.add(folder + '/' if folder else '', text, anchored=name == '.dockerignore')
+
+    def _match(self, path: str, is_dir: bool) -> bool:
+        ignored = False
+        for base, regex, negate, dir_only in self._rules:
+            if path.startswith(base) and (is_dir or not dir_only) and regex.fullmatch(path[len(base):]):
+                ignored = not negate
+        return ignored
+
+    def ignored(self, path: str, is_dir: bool = False) -> bool:
+        parts = path.split('/')
+        for i in range(1, len(parts)):
+            folder = '/'.join(parts[:i])
+            if folder not in self._folders:
+                self._folders[folder] = self._match(folder, True)
+            if self._folders[folder]:
+                return True
+        return self._match(path, is_dir)
+
+
+class PackageReport(NamedTuple):
+    files: int
+    bytes: int  # uncompressed bytes packaged
+    ignored: int
+    ignored_bytes: int
+    size: int  # bytes of the zip written
+
+    @property
+    def saved(self) -> int:
+        """Bytes no longer written to disk, the copy of the whole source that used to be archived."""
+        return self.bytes + self.ignored_bytes
+
+    def __str__(self):
+        return (f'Packaged {self.files} files ({_mb(self.bytes)}) into {_mb(self.size)}, left out {self.ignored} '
+                f'ignored files ({_mb(self.ignored_bytes)}), {_mb(self.saved)} of intermediate copy not written')
+
+
+def _mb(size: int) -> str:
+    return f'{size / 1024 / 1024:.1f} MB'
+
+
+class _Writer:
+    def __init__(self, dest: str):
+        self.zip = zipfile.ZipFile(dest, 'w', zipfile.ZIP_DEFLATED)
+        self.files = self.bytes = self.ignored = self.ignored_bytes = 0
+
+    def skip(self, size: int):
+        self.ignored += 1
+        self.ignored_bytes += size
+
+    def write(self, name: str, size: int, mode: int, mtime: float, src: BinaryIO):
+        info = zipfile.ZipInfo(name, time.localtime(max(mtime, 315532800))[:6])  # zip dates start in 1980
+        info.external_attr = ((mode or 0o644) & 0xFFFF | 0o100000) << 16
+        info.compress_type = zipfile.ZIP_STORED if name.lower().endswith(STORED_SUFFIXES) else zipfile.ZIP_DEFLATED
+        info.file_size = size
+        with self.zip.open(info, 'w') as out:
+            shutil.copyfileobj(src, out, CHUNK_SIZE)
+        self.files += 1
+        self.bytes += size
+
+    def write_raw(self, info: zipfile.ZipInfo, src: BinaryIO):
+        """Copy a member of another zip without decompressing it, `src` is that zip's file object."""
+        src.seek(info.header_offset)
+        header = src.read(30)
+        name_length, extra_length = struct.unpack('<HH', header[26:30])
+        src.seek(name_length + extra_length, io.SEEK_CUR)
+        info = copy.copy(info)
+        info.flag_bits &= ~0x08  # sizes and CRC go in the local header, no data descriptor
+        info.extra = b''
+        # zipfile has no public raw write, append to its file list the way ZipFile.write does
+        out = self.zip.fp
+        info.header_offset = out.tell()
+        out.write(info.FileHeader())
+        left = info.compress_size
+        while left:
+            chunk = src.read(min(left, CHUNK_SIZE))
+            if not chunk:
+                raise EOFError(f'Truncated zip member {info.filename}')
+            out.write(chunk)
+            left -= len(chunk)
+        self.zip.filelist.append(info)
+        self.zip.NameToInfo[info.filename] = info
+        self.zip.start_dir = out.tell()
+        self.files += 1
+        self.bytes += info.file_size
+
+    def close(self) -> PackageReport:
+        self.zip.close()
+        return PackageReport(self.files, self.bytes, self.ignored, self.ignored_bytes,
+                             os.path.getsize(self.zip.filename))
+
+
+def _tree_size(path: str) -> Tuple[int, int]:
+    files = size = 0
+    for folder, _, names in os.walk(path):
+        for name in names:
+            try:
+                size += os.lstat(os.path.join(folder, name)).st_size
+                files += 1
+            except OSError:
+                pass
+    return files, size
+
+
+def _package_dir(root: str, writer: _Writer, ignore: Ignore):
+    for folder, dirs, names in os.walk(root):
+        rel = os.path.relpath(folder, root).replace(os.sep, '/')
+        prefix = '' if rel == '.' else rel + '/'
+        for name in IGNORE_FILES:
+            if name in names:
+                with open(os.path.join(folder, name), 'r', encoding='utf8', errors='replace') as f:
+                    ignore.add_file(prefix + name, f.read())
+        for name in list(dirs):
+            if ignore.ignored(prefix + name, True):
+                dirs.remove(name)
+                files, size = _tree_size(os.path.join(folder, name))
+                writer.ignored += files
+                writer.ignored_bytes += size
+        for name in sorted(names):
+            path = os.path.join(folder, name)
+            stat = os.stat(path)
+            if ignore.ignored(prefix + name):
+                writer.skip(stat.st_size)
+                continue
+            with open(path, 'rb') as f:
+                writer.write(prefix + name, stat.st_size, stat.st_mode, stat.st_mtime, f)
+
+
+def _package_zip(target: str, writer: _Writer, ignore: Ignore):
+    if target.startswith('http'):
+        from deployflow.core.analysis.remote import open_remote
+        fileobj = open_remote(target)
+    else:
+        fileobj = open(target, 'rb')
+    try:
+        with zipfile.ZipFile(fileobj) as zip_ref:
+            members = [info for info in zip_ref.infolist() if not info.is_dir()]
+            for info in members:
+                if info.filename.rsplit('/', 1)[-1] in IGNORE_FILES:
+                    ignore.add_file(info.filename, zip_ref.read(info).decode('utf8', errors='replace'))
+            for info in members:
+                if ignore.ignored(info.filename.rstrip('/')):
+                    writer.skip(info.file_size)
+                else:
+                    writer.write_raw(info, fileobj)
+    finally:
+        fileobj.close()
+
+
+def _package_members(members: Iterator[tarfile.TarInfo], extract: Callable[[tarfile.TarInfo], BinaryIO],
+                     writer: _Writer, ignore: Ignore):
+    for member in members:
+        if not member.isfile():
+            continue
+        name = member.name[2:] if member.name.startswith('./') else member.name
+        if ignore.ignored(name):
+            writer.skip(member.size)
+            continue
+        with extract(member) as f:
+            writer.write(name, member.size, member.mode, member.mtime, f)
+
+
+def _package_tar(target: str, writer: _Writer, ignore: Ignore):
+    remote = None
+    if target.startswith('http'):
+        from deployflow.core.analysis.remote import download_spooled
+        remote = download_spooled(target)
+    try:
+        with tarfile.open(fileobj=remote, mode='r:*') if remote else tarfile.open(target, 'r:*') as tar_ref:
+            members = tar_ref.getmembers()  # ignore files may come after the files they ignore
+            for member in members:
+                if member.isfile() and member.name.rsplit('/', 1)[-1] in IGNORE_FILES:
+                    with tar_ref.extractfile(member) as f:
+                        ignore.add_file(member.name.removeprefix('./'), f.read().decode('utf8', errors='replace'))
+            _package_members(iter(members), tar_ref.extractfile, writer, ignore)
+    finally:
+        if remote:
+            remote.close()
+
+
+def _package_git(target: str, writer: _Writer, ignore: Ignore):
+    from git import Repo
+    temp_dir = tempfile.mkdtemp(prefix='deployflow-')
+    try:
+        repo = Repo.clone_from(target, temp_dir, bare=True, depth=1)
+        for path in repo.git.ls_tree('-r', '--name-only', '-z', 'HEAD').split('\0'):
+            if path.rsplit('/', 1)[-1] in IGNORE_FILES:
+                ignore.add_file(path, repo.git.show(f'HEAD:{path}'))
+        archive = subprocess.Popen(['git', '-C', temp_dir, 'archive', '--format=tar', 'HEAD'], stdout=subprocess.PIPE)
+        try:
+            with tarfile.open(fileobj=archive.stdout, mode='r|') as tar_ref:
+                _package_members(tar_ref, tar_ref.extractfile, writer, ignore)
+        finally:
+            archive.stdout.close()
+            if archive.wait():
+                raise ValueError(f'git archive failed with exit code {archive.returncode}')
+        repo.close()
+    finally:
+        shutil.rmtree(temp_dir, onerror=_onerror)
+
+
+def package_source(target: str, dest: str, ignore: Ignore = None) -> PackageReport:
+    """
+    Package the source at `target` (folder, zip, tar, tar.gz or git URL) into the zip `dest` in a single pass.
+
+    Args:
+        target (str): The source, as accepted by `init_target`.
+        dest (str): Path of the zip to write.
+        ignore (Ignore): Base patterns, the ignore files of the source are added to it. Defaults to `DEFAULT_IGNORE`.
+
+    Returns:
+        PackageReport: Files and bytes packaged and ignored.
+    """
+    ignore = ignore or Ignore()
+    kind = identify_target(target)[0]
+    writer = _Writer(dest)
+    try:
+        if kind == 'git':
+            _package_git(target, writer, ignore)
+        elif kind == 'zip':
+            _package_zip(target, writer, ignore)
+        elif kind == 'tar':
+            _package_tar(target, writer, ignore)
+        else:
+            _package_dir(target, writer, ignore)
+    except BaseException:
+        writer.zip.close()
+        os.remove(dest)
+        raise
+    return writer.close()
@@ -93,3 +93,25 @@ STAGE_PROMPT = [
     Reply with auto-deploy.sh content and reasoning.
     """
 ]
+
+REDEPLOY_PROMPT = """
+    This is a re-deployment. 'src.delta.zip' contains only the files changed since the last deployment (%%CHANGED%% changed, %%DELETED%% deleted).
+    Upload it to ~/src.delta.zip with a null_resource triggered by filesha256("src.delta.zip"), then run auto-deploy.sh again, it applies the delta to the source in ~/.
+    'src.zip' is still uploaded when the server is created.
+    """
+
+EXAMPLE_PROMPT = """
+    An earlier deployment with similar evidence succeeded with the files below, use them as a starting point and adapt them to this evidence.
+    Evidence that differs between the two deployments: %%DIFFERENCES%%
+    ```hcl main.tf
+%%MAIN_TF%%
+    ```
+    ```bash auto-deploy.sh
+%%AUTO_DEPLOY%%
+    ```
+    """
+
+REUSED_PROMPT = """
+    main.tf and auto-deploy.sh above were reused from an earlier successful deployment with the same evidence, they are already written and terraform is initialized.
+    Continue with the deployment.
+    """
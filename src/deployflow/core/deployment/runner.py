@@ -0,0 +1,148 @@
+"""
+Streaming subprocess runner for the commands of the deployment.
+
+Output is streamed live as it is produced, only a bounded head and tail of each stream is kept for the AI (`HeadTail`),
+so a command printing gigabytes uses constant memory. Commands are killed, with their whole process group, when they
+run longer than their timeout or when the run is cancelled (Ctrl+C).
+"""
+import asyncio
+import codecs
+import os
+import signal
+import time
+from collections import deque
+from typing import Callable, Dict, NamedTuple
+
+from deployflow import config
+
+HEAD = 500  # characters kept from the start of each stream
+TAIL = 500  # characters kept from the end of each stream
+COMMAND_TIMEOUT = 1800  # seconds
+KILL_GRACE = 5  # seconds between SIGTERM and SIGKILL
+CHUNK_SIZE = 4096
+
+
+class HeadTail:
+    """Keeps the first `head` and the last `tail` characters written to it."""
+
+    def __init__(self, head: int = HEAD, tail: int = TAIL):
+        self.head, self.tail = head, tail
+        self._head = ''
+        self._tail = deque()
+        self._tail_size = 0
+        self.total = 0
+
+    def write(self, text: str):
+        self.total += len(text)
+        if len(self._head) < self.head:
+            taken = text[:self.head - len(self._head)]
+            self._head += taken
+            text = text[len(taken):]
+        if text:
+            self._tail.append(text)
+            self._tail_size += len(text)
+            while self._tail_size - len(self._tail[0]) >= self.tail:
+                self._tail_size -= len(self._tail.popleft())
+
+    def text(self) -> str:
+        tail = ''.join(self._tail)[-self.tail:] if self.tail else ''
+        omitted = self.total - len(self._head) - len(tail)
+        if omitted:
+            return self._head + f'\n<<Truncated output, {omitted} characters omitted>>\n' + tail
+        return self._head + tail
+
+
+class CommandResult(NamedTuple):
+    stdout: str  # head and tail only
+    stderr: str
+    returncode: int
+    duration: float  # seconds
+    timed_out: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0 and not self.timed_out
+
+
+def _kill(process: asyncio.subprocess.Process, sig: int):
+    if process.returncode is not None:
+        return
+    try:
+        if os.name == 'nt':
+            process.kill()
+        else:
+            os.killpg(process.pid, sig)
+    except ProcessLookupError:
+        pass
+
+
+async def _stop(process: asyncio.subprocess.Process):
+    _kill(process, signal.SIGTERM)
+    try:
+        await asyncio.wait_for(process.wait(), KILL_GRACE)
+    except asyncio.TimeoutError:
+        _kill(process, signal.SIGKILL)
+        await process.wait()
+
+
+async def _pump(stream: asyncio.StreamReader, name: str, buffer: HeadTail, on_output: Callable[[str, str], None]):
+    decoder = codecs.getincrementaldecoder('utf8')(errors='replace')
+    while chunk := await stream.read(CHUNK_SIZE):
+        text = decoder.decode(chunk)
+        buffer.write(text)
+        if on_output and text:
+            on_output(name, text)
+    text = decoder.decode(b'', final=True)
+    buffer.write(text)
+
+
+async def arun(command: str, cwd: str = None, timeout: float = None, input: str = None,
+               on_output: Callable[[str, str], None] = None, env: Dict[str, str] = None) -> CommandResult:
+    """
+    Run a shell command, streaming its output.
+
+    Args:
+        command (str): Shell command.
+        cwd (str): Working directory.
+        timeout (float): Seconds before the command is killed, defaults to the `deployment.command_timeout` config
+            value. Pass 0 for no timeout.
+        input (str): Written to the command's stdin, which is then closed.
+        on_output (callable): Called with ("stdout" or "stderr", text) as output arrives.
+        env (dict): Environment of the command, defaults to the current one.
+
+    Returns:
+        CommandResult: Head and tail of the output, exit code and duration.
+    """
+    if timeout is None:
+        timeout = float(config.get_val('deployment', 'command_timeout', COMMAND_TIMEOUT))
+    start = time.perf_counter()
+    process = await asyncio.create_subprocess_shell(
+        command, cwd=cwd, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE, start_new_session=os.name != 'nt', env=env)
+    stdout, stderr = HeadTail(), HeadTail()
+    timed_out = False
+    try:
+        if input:
+            process.stdin.write(input.encode('utf8'))
+        try:
+            await process.stdin.drain()
+        except ConnectionResetError:
+            pass  # the command exited without reading its input
+        process.stdin.close()
+        pumps = asyncio.gather(_pump(process.stdout, 'stdout', stdout, on_output),
+                               _pump(process.stderr, 'stderr', stderr, on_output), process.wait())
+        try:
+            await asyncio.wait_for(pumps, timeout or None)
+        except asyncio.TimeoutError:
+            timed_out = True
+            await _stop(process)
+    except BaseException:  # cancelled
+        await asyncio.shield(_stop(process))
+        raise
+    return CommandResult(stdout.text(), stderr.text(), process.returncode, time.perf_counter() - start, timed_out)
+
+
+def run(command: str, cwd: str = None, timeout: float = None, input: str = None,
+        on_output: Callable[[str, str], None] = None, env: Dict[str, str] = None) -> CommandResult:
+    """Blocking version of `arun`, Ctrl+C kills the command and raises KeyboardInterrupt."""
+    return asyncio.run(arun(command, cwd, timeout, input, on_output, env))
@@ -0,0 +1,199 @@
+"""
+Shared Terraform provider cache and warm working directories.
+
+Every deployment directory used to download its providers again on `terraform init`. Terraform commands now run with a
+CLI config that points at a plugin cache shared by all deployments (`~/.deployflow/terraform/plugins`), and, when
+`terraform_mirror` is set in the `[deployment]` section of the config file, installs providers from that filesystem
+mirror only, so init works offline (fill a mirror with `terraform providers mirror DIR`).
+
+After a successful init, the lock file and `.terraform/providers` are kept under a fingerprint of the provider set of
+`main.tf` (sources, version constraints and platform). A new deployment directory with the same provider set starts
+from a copy of them, and the time saved compared to the first init with that provider set is reported.
+
+Terraform does not support concurrent inits on one plugin cache, so concurrent deployments (batch jobs, or several
+deployflow processes) take turns with `locked` for their warm, init and save.
+
+A `TF_CLI_CONFIG_FILE` already set in the environment is left alone, only the plugin cache is added to it.
+"""
+import hashlib
+import json
+import os
+import platform
+import re
+import shutil
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, NamedTuple
+
+from deployflow import config
+
+CACHE_DIR = os.path.join(Path.home(), '.deployflow', 'terraform')
+LOCK_FILE = '.terraform.lock.hcl'
+
+BLOCK = re.compile(r'required_providers\s*\{')
+ENTRY = re.compile(r'([\w-]+)\s*=\s*(?:\{([^{}]*)\}|"([^"]*)")')
+SOURCE = re.compile(r'source\s*=\s*"([^"]*)"')
+VERSION = re.compile(r'version\s*=\s*"([^"]*)"')
+USED = re.compile(r'^\s*(?:resource|data)\s+"([a-z0-9]+)_[^"]*"|^\s*provider\s+"([\w-]+)"', re.M)
+
+
+class InitReport(NamedTuple):
+    duration: float  # seconds
+    cold: float  # seconds of the first init with this provider set
+    reused: bool  # started from the providers of an earlier deployment
+
+    @property
+    def saved(self) -> float:
+        return max(self.cold - self.duration, 0.0) if self.reused else 0.0
+
+    def __str__(self):
+        if self.reused:
+            return (f'terraform init took {self.duration:.1f}s, {self.saved:.1f}s saved by reusing the providers of an '
+                    f'earlier deployment')
+        return f'terraform init took {self.duration:.1f}s, providers cached for the next deployments'
+
+
+def cache_dir() -> str:
+    return config.get_val('deployment', 'terraform_cache', CACHE_DIR)
+
+
+@contextmanager
+def locked():
+    """Hold the lock of the cache, across threads and processes, for the duration of the block."""
+    root = cache_dir()
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, 'lock'), 'a+b') as f:
+        if os.name == 'nt':
+            import msvcrt
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:  # LK_LOCK gives up after 10 seconds
+                    pass
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if os.name == 'nt':
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _block(text: str, start: int) -> str:
+    """Body of the block whose opening brace ends at `start`."""
+    depth, i = 1, start
+    while depth and i < len(text):
+        depth += {'{': 1, '}': -1}.get(text[i], 0)
+        i += 1
+    return text[start:i - 1]
+
+
+def providers(main_tf: str) -> List[str]:
+    """Provider requirements of a configuration, as sorted `name=source@constraint` strings."""
+    main_tf = re.sub(r'(?m)(#|//).*$', '', main_tf)
+    required: Dict[str, str] = {}
+    for match in BLOCK.finditer(main_tf):
+        for name, body, legacy_version in ENTRY.findall(_block(main_tf, match.end())):
+            source = SOURCE.search(body or '')
+            version = VERSION.search(body or '')
+            source = (source.group(1) if source else f'hashicorp/{name}').lower().removeprefix('registry.terraform.io/')
+            required[name] = f'{source}@{version.group(1) if version else legacy_version}'
+    for resource, provider in USED.findall(main_tf):
+        name = resource or provider
+        required.setdefault(name, f'hashicorp/{name}@')
+    return sorted(f'{name}={requirement}' for name, requirement in required.items())
+
+
+def fingerprint(main_tf: str) -> str:
+    key = json.dumps([providers(main_tf), platform.system(), platform.machine()])
+    return hashlib.sha256(key.encode('utf8')).hexdigest()[:24]
+
+
+def cli_config() -> str:
+    """Write the Terraform CLI config using the shared plugin cache (and the mirror, if set), returns its path."""
+    root = cache_dir()
+    plugins = os.path.join(root, 'plugins')
+    os.makedirs(plugins, exist_ok=True)
+    lines = [f'plugin_cache_dir = "{Path(plugins).as_posix()}"',
+             'plugin_cache_may_break_dependency_lock_file = true']
+    mirror = config.get_val('deployment', 'terraform_mirror')
+    if mirror:
+        lines += ['provider_installation {', '  filesystem_mirror {', f'    path = "{Path(mirror).resolve().as_posix()}"',
+                  '  }', '}']
+    content = '\n'.join(lines) + '\n'
+    path = os.path.join(root, 'terraformrc')
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf8') as f:
+            if f.read() == content:
+                return path
+    with open(path, 'w', encoding='utf8') as f:
+        f.write(content)
+    return path
+
+
+def env() -> Dict[str, str]:
+    """Environment for Terraform commands."""
+    environment = dict(os.environ)
+    if 'TF_CLI_CONFIG_FILE' in environment:
+        environment['TF_PLUGIN_CACHE_DIR'] = os.path.join(cache_dir(), 'plugins')
+        os.makedirs(environment['TF_PLUGIN_CACHE_DIR'], exist_ok=True)
+    else:
+        environment['TF_CLI_CONFIG_FILE'] = cli_config()
+    return environment
+
+
+def _entry(target_dir: str) -> str:
+    with open(os.path.join(target_dir, 'main.tf'), 'r', encoding='utf8') as f:
+        return os.path.join(cache_dir(), 'warm', fingerprint(f.read()))
+
+
+def warm(target_dir: str) -> bool:
+    """Give a deployment directory that was never initialized the providers of an earlier one, returns if it did."""
+    entry = _entry(target_dir)
+    if not os.path.exists(os.path.join(entry, LOCK_FILE)) or os.path.exists(os.path.join(target_dir, LOCK_FILE)) \
+            or os.path.exists(os.path.join(target_dir, '.terraform', 'providers')):
+        return False
+    shutil.copyfile(os.path.join(entry, LOCK_FILE), os.path.join(target_dir, LOCK_FILE))
+    if os.path.isdir(os.path.join(entry, 'providers')):
+        shutil.copytree(os.path.join(entry, 'providers'), os.path.join(target_dir, '.terraform', 'providers'),
+                        symlinks=True)
+    return True
+
+
+def save(target_dir: str, duration: float, reused: bool) -> InitReport:
+    """Keep the providers of a successful init for the next deployments with the same provider set."""
+    entry = _entry(target_dir)
+    meta_path = os.path.join(entry, 'meta.json')
+    meta = {}
+    if os.path.exists(meta_path):
+        with open(meta_path, 'r', encoding='utf8') as f:
+            meta = json.load(f)
+    if not reused:
+        meta['cold'] = max(duration, meta.get('cold', 0.0))
+    os.makedirs(os.path.dirname(entry), exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=os.path.basename(entry) + '.', suffix='.tmp', dir=os.path.dirname(entry))
+    try:
+        if os.path.exists(os.path.join(target_dir, LOCK_FILE)):
+            shutil.copyfile(os.path.join(target_dir, LOCK_FILE), os.path.join(tmp, LOCK_FILE))
+        if os.path.isdir(os.path.join(target_dir, '.terraform', 'providers')):
+            shutil.copytree(os.path.join(target_dir, '.terraform', 'providers'), os.path.join(tmp, 'providers'),
+                            symlinks=True)
+        with open(os.path.join(tmp, 'meta.json'), 'w', encoding='utf8') as f:
+            json.dump(meta, f)
+        shutil.rmtree(entry, ignore_errors=True)
+        try:
+            os.replace(tmp, entry)
+        except OSError:
+            if not os.path.isdir(entry):
+                raise
+            # another deployment saved the same provider set in the meantime, either copy will do
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return InitReport(duration, meta.get('cold', duration), reused)
@@ -0,0 +1,116 @@
+"""
+Declarative approval policy, so that runs can go unattended.
+
+```yaml
+commands:
+  allow:                          # shell globs, each part of a command (split on && || ; |) must match one
+    - ssh-keygen *
+    - chmod 400 id_rsa
+    - terraform init*
+    - terraform plan*
+    - terraform apply -auto-approve*
+    - terraform output*
+    - scp *
+    - ssh *
+  deny:                           # deny wins over allow, matched against every sub-command with or without options
+    - terraform destroy*
+    - rm -rf /*
+  default: ask                    # commands matching neither: ask, allow or deny
+answers:                          # questions of the analysis, first regex (case-insensitive) found in it wins
+  port: "5000"
+  database: "no database"
+deploy_dir: "{repo}_deploy"       # deployment directory, {repo} is the repository name
+target: aws                       # deployment target when the analysis finds none
+```
+
+Commands with shell syntax the policy does not parse (`&`, `` ` ``, `$(`, `<`, `>`) are never allowed, they are asked
+for (denied with `default: deny`). Without a policy every command is asked for. `--non-interactive` never reads from
+the terminal: questions with a default (deployment directory, target, repository) take it, other questions the policy
+does not answer and every command it does not allow fail the run at once (see `console.ask`).
+"""
+import re
+import shlex
+from fnmatch import fnmatchcase
+from typing import Dict, List, Set
+
+from deployflow.core.utils import load_document
+
+ALLOW, DENY, ASK = 'allow', 'deny', 'ask'
+SEPARATORS = re.compile(r'\s*(?:&&|\|\||;|\||\n)\s*')
+UNPARSED = re.compile(r'[&`<>]|\$\(')  # background jobs, command substitution and redirections
+HARMLESS = re.compile(r'(?<!\S)[12]?>(?:&[12]|\s*/dev/null)(?!\S)')  # 2>&1, >/dev/null
+
+_policy = None
+
+
+class Policy:
+    def __init__(self, allow: List[str] = (), deny: List[str] = (), default: str = ASK,
+                 answers: Dict[str, str] = None, deploy_dir: str = None, target: str = None):
+        if default not in (ALLOW, DENY, ASK):
+            raise ValueError(f"Policy default must be allow, deny or ask, not {default}")
+        self.allow, self.deny, self.default = list(allow), list(deny), default
+        self.answers = [(re.compile(pattern, re.I), str(answer)) for pattern, answer in (answers or {}).items()]
+        self.deploy_dir = deploy_dir
+        self.target = target
+
+    @classmethod
+    def load(cls, path: str) -> 'Policy':
+        document = load_document(path) or {}
+        commands = document.get('commands') or {}
+        return cls(commands.get('allow') or [], commands.get('deny') or [], commands.get('default') or ASK,
+                   document.get('answers'), document.get('deploy_dir'), document.get('target'))
+
+    def check(self, command: str) -> str:
+        """`allow`, `deny` or `ask` for a shell command, every part of a compound command must be allowed."""
+        parts = _parts(command)
+        if any(fnmatchcase(candidate, pattern) for part in parts for candidate in _sub_commands(part)
+               for pattern in self.deny):
+            return DENY
+        if any(UNPARSED.search(HARMLESS.sub('', part)) for part in parts):
+            return DENY if self.default == DENY else ASK
+        if parts and all(any(fnmatchcase(part, pattern) for pattern in self.allow) for part in parts):
+            return ALLOW
+        return self.default
+
+    def answer(self, question: str) -> str | None:
+        """Answer to a question of the analysis, None when the policy has none."""
+        for pattern, answer in self.answers:
+            if pattern.search(question):
+                return answer
+        return None
+
+    def directory(self, repo_name: str) -> str | None:
+        return self.deploy_dir.replace('{repo}', repo_name) if self.deploy_dir else None
+
+
+def _parts(command: str) -> List[str]:
+    return [' '.join(part.split()) for part in SEPARATORS.split(command.strip()) if part.strip()]
+
+
+def _sub_commands(part: str) -> Set[str]:
+    """
+    The part and every command it may run: from each word on (`sudo terraform destroy`), with the options left out
+    (`terraform -chdir=. destroy`), and the commands of quoted arguments (`sh -c "terraform destroy"`).
+    """
+    try:
+        words = shlex.split(part)
+    except ValueError:  # unbalanced quotes
+        words = part.split()
+    found = {part}
+    for sequence in (words, [word for word in words if not word.startswith('-')]):
+        found.update(' '.join(sequence[i:]) for i in range(len(sequence)))
+    for word in words:
+        if word != part and len(word.split()) > 1:
+            for inner in _parts(word):
+                found |= _sub_commands(inner)
+    return found
+
+
+def use_policy(path: str | None):
+    """Load the policy of the run from `path`, pass None for the default (ask for everything)."""
+    global _policy
+    _policy = Policy.load(path) if path else None
+
+
+def get_policy() -> Policy:
+    return _policy or Policy()
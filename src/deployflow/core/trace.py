@@ -0,0 +1,112 @@
+"""
+Run tracing: timed spans for the phases of a run, fs operations, AI calls, subprocesses and user input.
+
+Tracing is off unless a run is started with `run`, `span` is then a no-op. While it is on, every finished span is
+appended to `<name>.jsonl` as it happens, and when the run ends the spans are written as a Chrome trace (`<name>.json`,
+open it in chrome://tracing or https://ui.perfetto.dev) and summarized in a table of where the wall-clock time went.
+
+Categories: phase, fs, llm, subprocess, user.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List
+
+_tracer = None
+
+
+class Tracer:
+    def __init__(self, path: str):
+        self.path = os.path.splitext(path)[0]
+        self.events: List[dict] = []
+        self.start = time.perf_counter()
+        self._lock = threading.Lock()
+        self._lines = open(self.path + '.jsonl', 'w', encoding='utf8')
+
+    def add(self, name: str, category: str, start: float, end: float, args: dict):
+        event = {'name': name, 'cat': category, 'ph': 'X', 'pid': os.getpid(), 'tid': threading.get_ident(),
+                 'ts': round((start - self.start) * 1e6), 'dur': round((end - start) * 1e6), 'args': args}
+        with self._lock:
+            self.events.append(event)
+            self._lines.write(json.dumps(event, default=str) + '\n')
+            self._lines.flush()
+
+    def close(self) -> float:
+        wall = time.perf_counter() - self.start
+        self._lines.close()
+        with open(self.path + '.json', 'w', encoding='utf8') as f:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, f, default=str)
+        return wall
+
+
+@contextmanager
+def span(name: str, category: str, **args):
+    """
+    Time the enclosed block. Yields the span's args, values added to it while the block runs are recorded too.
+    """
+    tracer = _tracer
+    if tracer is None:
+        yield args
+        return
+    start = time.perf_counter()
+    try:
+        yield args
+    finally:
+        tracer.add(name, category, start, time.perf_counter(), args)
+
+
+def traced(fn: Callable, name: str, category: str = 'fs') -> Callable:
+    """Wrap `fn` so every call is a span with its first argument, or return it as is when tracing is off."""
+    if _tracer is None:
+        return fn
+
+    def wrapper(*args, **kwargs):
+        with span(name, category, target=args[0] if args else None):
+            return fn(*args, **kwargs)
+
+    return wrapper
+
+
+def enabled() -> bool:
+    return _tracer is not None
+
+
+def summary(events: List[dict], wall: float) -> str:
+    """Table of calls, total and mean time per category and span name, with the share of the wall clock."""
+    rows: Dict[tuple, list] = {}
+    tokens = [0, 0]
+    for event in events:
+        key = (event['cat'], event['name'])
+        row = rows.setdefault(key, [0, 0, 0])
+        row[0] += 1
+        row[1] += event['dur'] / 1e6
+        row[2] = max(row[2], event['dur'] / 1e6)
+        if event['cat'] == 'llm':
+            tokens[0] += event['args'].get('prompt_tokens') or 0
+            tokens[1] += event['args'].get('completion_tokens') or 0
+    lines = [f"{'category':<11}{'span':<28}{'calls':>7}{'total s':>10}{'mean ms':>10}{'max ms':>10}{'% wall':>8}"]
+    for (category, name), (calls, total, longest) in sorted(rows.items(), key=lambda item: -item[1][1]):
+        lines.append(f'{category:<11}{name[:27]:<28}{calls:>7}{total:>10.3f}{total / calls * 1000:>10.1f}'
+                     f'{longest * 1000:>10.1f}{total / wall * 100 if wall else 0:>7.1f}%')
+    lines.append(f'wall clock {wall:.3f}s, llm tokens: {tokens[0]} prompt, {tokens[1]} completion '
+                 f'(spans on different threads overlap, shares can add up to more than 100%)')
+    return '\n'.join(lines)
+
+
+@contextmanager
+def run(path: str = None):
+    """Trace the enclosed block to `path` (.json and .jsonl), print the summary when it ends. No-op if path is None."""
+    global _tracer
+    if not path or _tracer is not None:
+        yield
+        return
+    tracer = _tracer = Tracer(path)
+    try:
+        yield
+    finally:
+        _tracer = None
+        wall = tracer.close()
+        print(summary(tracer.events, wall))
+        print(f'Trace written to {tracer.path}.json and {tracer.path}.jsonl')
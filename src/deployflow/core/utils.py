@@ -1,3 +1,5 @@
+import json
+
 from deployflow.core import colors
 from deployflow.logger import logger
 
@@ -6,3 +8,15 @@ def fatal(error):
     logger.error(error)
     print(colors.BOLD + colors.RED + error + colors.ENDC)
     exit(1)
+
+
+def load_document(path: str):
+    """Read a YAML file, or a JSON one when `path` ends with .json."""
+    with open(path, 'r', encoding='utf8') as f:
+        if path.endswith('.json'):
+            return json.load(f)
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError(f"Reading {path} requires PyYAML (pip install pyyaml), or write it as JSON")
+        return yaml.safe_load(f)
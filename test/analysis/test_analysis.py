@@ -0,0 +1,160 @@
+import subprocess
+import time
+
+from deployflow.core.ai import Cassette
+from deployflow.core.analysis import ai_analyzer, analyze, scan
+from deployflow.core.analysis.cache import AnalysisCache
+from deployflow.core.analysis.fs import init_target, open_target
+from test.analysis.test_fs import make_git_repo, make_hello_world
+from test.conftest import FakeAI
+
+
+def hello_world_script(messages, n):
+    prompt = messages[-1]["content"]
+    if "=== file: app/app.py" in prompt or "re-check them" in prompt:
+        port = 8000 if "port=8000" in prompt else 5000
+        patch = [{"op": "set", "field": "ports", "value": [port]},
+                 {"op": "add", "field": "frameworks", "value": "Flask"}]
+        return {"patch": patch, "next_task": {"mode": "deploy"}, "summary": "found flask"}
+    return {"patch": [], "next_task": {"mode": "read", "targets": ["app/app.py"]}, "summary": "reading app"}
+
+
+def run(root, cache, fake, monkeypatch):
+    monkeypatch.setattr(ai_analyzer, "get_ai", lambda: fake)
+    with open_target(root) as source:
+        return analyze._cached_analysis(cache, root, source, "deploy")
+
+
+def test_unchanged_repository_needs_no_ai_calls(tmp_path, monkeypatch):
+    root = make_hello_world(str(tmp_path / "hello_world"))
+    cache = AnalysisCache(str(tmp_path / "cache"))
+    fake = FakeAI(hello_world_script)
+    first = run(root, cache, fake, monkeypatch)
+    assert first["ports"] == [5000]
+    calls = len(fake.requests)
+    assert run(root, cache, fake, monkeypatch) == first
+    assert len(fake.requests) == calls
+
+
+def test_changed_file_is_rechecked_alone(tmp_path, monkeypatch):
+    root = make_hello_world(str(tmp_path / "hello_world"))
+    cache = AnalysisCache(str(tmp_path / "cache"))
+    fake = FakeAI(hello_world_script)
+    run(root, cache, fake, monkeypatch)
+    with open(tmp_path / "hello_world" / "app" / "app.py", "a") as f:
+        f.write("app.run(port=8000)\n")
+    calls = len(fake.requests)
+    evidences = run(root, cache, fake, monkeypatch)
+    assert len(fake.requests) == calls + 1
+    prompt = fake.requests[-1]["messages"][-1]["content"]
+    assert "=== file: app/app.py" in prompt and "README.md\n" not in prompt
+    assert evidences["ports"] == [8000]
+
+
+def test_changed_hardcoded_address_is_rechecked(tmp_path, monkeypatch):
+    root = make_hello_world(str(tmp_path / "hello_world"))
+    cache = AnalysisCache(str(tmp_path / "cache"))
+    fake = FakeAI(hello_world_script)
+    run(root, cache, fake, monkeypatch)
+    with open(tmp_path / "hello_world" / "app" / "templates" / "index.html", "a") as f:
+        f.write("<script>fetch('http://localhost:5000/api')</script>\n")
+    calls = len(fake.requests)
+    evidences = run(root, cache, fake, monkeypatch)
+    assert len(fake.requests) == calls + 1
+    assert "=== file: app/templates/index.html" in fake.requests[-1]["messages"][-1]["content"]
+    assert evidences["update_commands"] == ['sed -i "s#localhost:5000#$PUBLIC_IP:$PORT#g" app/templates/index.html']
+
+
+def test_unchanged_git_tree_is_not_read(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    url = make_git_repo(tmp_path / "hello_world")
+    cache = AnalysisCache(str(tmp_path / "cache"))
+    fake = FakeAI(hello_world_script)
+    monkeypatch.setattr(ai_analyzer, "get_ai", lambda: fake)
+    with open_target(url) as source:
+        first = analyze._cached_analysis(cache, url, source, "deploy")
+
+    def unexpected(*args, **kwargs):
+        raise AssertionError(f"read an unchanged tree: {args}")
+
+    with monkeypatch.context() as patched, open_target(url) as source:
+        patched.setattr(scan, "scan", unexpected)
+        patched.setattr(source, "cat", unexpected)
+        assert analyze._cached_analysis(cache, url, source, "deploy") == first
+
+    with open(tmp_path / "hello_world" / "app" / "app.py", "a") as f:
+        f.write("app.run(port=8000)\n")
+    git = ["git", "-C", str(tmp_path / "hello_world"), "-c", "user.name=test", "-c", "user.email=test@example.com"]
+    subprocess.run(git + ["commit", "-qam", "port"], check=True)
+    with open_target(url) as source:
+        read, cat = [], source.cat
+        monkeypatch.setattr(source, "cat", lambda path: read.append(path) or cat(path))
+        evidences = analyze._cached_analysis(cache, url, source, "deploy")
+    assert read == ["app/app.py"] and evidences["ports"] == [8000]
+
+
+def test_batch_read_is_one_round_trip(tmp_path, monkeypatch):
+    root = make_hello_world(str(tmp_path / "hello_world"))
+
+    def script(messages, n):
+        if n == 1:
+            targets = ["app/app.py", "app/requirements.txt", "app/templates/", "missing.py"]
+            return {"patch": [], "next_task": {"mode": "read", "targets": targets}, "summary": "batch"}
+        return {"patch": [], "next_task": {"mode": "deploy"}, "summary": "done"}
+
+    fake = FakeAI(script)
+    monkeypatch.setattr(ai_analyzer, "get_ai", lambda: fake)
+    ls, cat, close = init_target(root)
+    try:
+        steps = []
+        evidences = ai_analyzer.ai_analysis({}, ls, cat, "deploy", steps)
+    finally:
+        close()
+    assert len(fake.requests) == 2
+    first, second = (request["messages"][-1]["content"] for request in fake.requests)
+    assert "=== file: README.md\n# Simple Deploy App" in first
+    assert "=== file: app/app.py\nfrom flask import Flask" in second
+    assert "=== file: app/requirements.txt\nflask" in second
+    assert 'app/templates/: ["app/templates/index.html"]' in second
+    assert "=== could not read missing.py" in second
+    assert evidences["checked_folders"] == ["/", "app/templates/"]
+    assert steps[1]["targets"] == ["app/app.py", "app/requirements.txt", "app/templates/", "missing.py"]
+
+
+def test_rejected_patch_operations_are_reported(tmp_path, monkeypatch):
+    root = make_hello_world(str(tmp_path / "hello_world"))
+
+    def script(messages, n):
+        if n == 1:
+            patch = [{"op": "add", "field": "ports", "value": 5000}, {"op": "add", "field": "target", "value": "aws"}]
+            return {"patch": patch, "next_task": {"mode": "read", "targets": ["app/"]}, "summary": "ports"}
+        return {"patch": [{"op": "set", "field": "target", "value": "aws"}], "next_task": {"mode": "deploy"},
+                "summary": "done"}
+
+    fake = FakeAI(script)
+    monkeypatch.setattr(ai_analyzer, "get_ai", lambda: fake)
+    ls, cat, close = init_target(root)
+    try:
+        evidences = ai_analyzer.ai_analysis({}, ls, cat, "deploy")
+    finally:
+        close()
+    assert evidences["ports"] == [5000] and evidences["target"] == "aws"
+    prompt = fake.requests[1]["messages"][-1]["content"]
+    assert "invalid operations" in prompt and "target is not a list, use set" in prompt
+    assert "invalid operations" not in fake.requests[0]["messages"][-1]["content"]
+
+
+def test_replayed_analysis_is_reproducible(tmp_path, monkeypatch):
+    root = make_hello_world(str(tmp_path / "hello_world"))
+    path = str(tmp_path / "cassette.json")
+    fake = FakeAI(hello_world_script)
+    monkeypatch.setattr(ai_analyzer, "get_ai", lambda: Cassette(path, "record", lambda: fake))
+    recorded = analyze.analyze_repository(root, "deploy", use_cache=False)
+
+    def offline():
+        raise AssertionError("replay contacted the AI")
+
+    monkeypatch.setattr(ai_analyzer, "get_ai", lambda: Cassette(path, "replay", offline))
+    start = time.perf_counter()
+    assert analyze.analyze_repository(root, "deploy", use_cache=False) == recorded
+    assert time.perf_counter() - start < 1
@@ -0,0 +1,56 @@
+import json
+
+from deployflow.core.analysis.budget import PromptBuilder, estimate_tokens, truncate
+
+
+def numbered(lines, width=60):
+    return "\n".join(f"line {i} ".ljust(width, "x") for i in range(1, lines + 1))
+
+
+def test_small_content_is_untouched():
+    text = numbered(10)
+    assert truncate(text, 1000) == text
+
+
+def test_truncate_keeps_head_middle_and_tail():
+    text = numbered(2000)
+    cut = truncate(text, 500)
+    assert estimate_tokens(cut) <= 550
+    lines = cut.splitlines()
+    assert lines[0].startswith("line 1 ")
+    assert lines[-2].startswith("line 2000 ")
+    assert lines[-1] == f"[2000 lines, {len(text)} characters in total]"
+    markers = [line for line in lines if line.startswith("[... lines")]
+    assert len(markers) == 2
+    assert any(line.startswith("line 10") and len(line.split()[1]) == 4 for line in lines)  # middle sample
+
+
+def test_truncate_single_huge_line():
+    cut = truncate("x" * 100_000, 100)
+    assert estimate_tokens(cut) < 150
+    assert cut.startswith("xxxx")
+
+
+def test_folders_are_listed_once_then_compacted():
+    builder = PromptBuilder("system", budget=4000)
+    files = {"/": ["README.md", "app/"]}
+    first, _ = builder.build("intro", files, {}, "instructions")
+    assert '/: ["README.md", "app/"]' in first
+    files["app/"] = ["app/app.py", "app/templates/"]
+    second, _ = builder.build("intro", files, {}, "instructions")
+    assert '/: ["README.md", "app/"]' not in second
+    assert "/ README.md app/\n" in second
+    assert 'app/: ["app/app.py", "app/templates/"]' in second
+
+
+def test_prompt_stays_within_budget():
+    builder = PromptBuilder("system", budget=3000)
+    files = {"/": [f"file{i}.py" for i in range(5000)]}
+    contents = [("big.py", numbered(5000)), ("small.py", "print(1)"), ("huge.py", numbered(20000))]
+    evidences = {"ports": [5000], "notes": ["a note"]}
+    prompt, tokens = builder.build("intro", files, evidences, "instructions", contents)
+    assert tokens <= 3000 * 1.1
+    assert tokens == estimate_tokens("system") + estimate_tokens(prompt)
+    assert "=== file: small.py\nprint(1)\n===" in prompt
+    assert "(and " in prompt and " more)" in prompt
+    assert json.dumps(evidences, separators=(",", ":")) in prompt
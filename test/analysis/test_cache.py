@@ -0,0 +1,59 @@
+import hashlib
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from deployflow.core.analysis.cache import AnalysisCache, content_hash, facts, retract
+
+
+def test_content_hash_is_git_blob_id(tmp_path):
+    path = tmp_path / "file.txt"
+    path.write_bytes(b"hello\n")
+    expected = subprocess.run(["git", "hash-object", str(path)], capture_output=True, text=True).stdout.strip()
+    assert content_hash(b"hello\n") == expected
+
+
+def test_cache_round_trip(tmp_path):
+    cache = AnalysisCache(str(tmp_path))
+    assert cache.get("ab" * 32) is None
+    cache.put("ab" * 32, {"evidences": {"ports": [80]}})
+    assert cache.get("ab" * 32) == {"evidences": {"ports": [80]}}
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = AnalysisCache(str(tmp_path), max_bytes=3100)
+    keys = [hashlib.sha256(str(i).encode()).hexdigest() for i in range(3)]
+    for i, key in enumerate(keys):
+        cache.put(key, {"data": "x" * 1000})
+        os.utime(cache._path(key), (i, i))
+    cache.get(keys[0])
+    cache.put(hashlib.sha256(b"new").hexdigest(), {"data": "x" * 1000})
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[1]) is None
+
+
+def test_eviction_leaves_puts_in_progress_alone(tmp_path):
+    cache = AnalysisCache(str(tmp_path), max_bytes=100)
+    key = hashlib.sha256(b"old").hexdigest()
+    cache.put(key, {"data": "x" * 1000})
+    in_progress = os.path.join(os.path.dirname(cache._path(key)), key + ".abc.tmp")
+    with open(in_progress, "w") as f:
+        f.write("x" * 1000)
+    cache.evict()
+    assert os.path.exists(in_progress)
+
+
+def test_concurrent_puts_and_evictions(tmp_path):
+    cache = AnalysisCache(str(tmp_path), max_bytes=5000)
+    keys = [hashlib.sha256(str(i % 8).encode()).hexdigest() for i in range(200)]
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda key: cache.put(key, {"data": "x" * 1000}), keys))
+    assert not [name for _, _, names in os.walk(tmp_path) for name in names if name.endswith(".tmp")]
+
+
+def test_facts_and_retract_are_inverse():
+    before = {"ports": [80], "target": "", "frameworks": []}
+    after = {"ports": [80, 5000], "target": "aws", "frameworks": ["Flask"]}
+    contributed = facts(before, after)
+    assert contributed == {"ports": [5000], "target": "aws", "frameworks": ["Flask"]}
+    assert retract(after, contributed) == before
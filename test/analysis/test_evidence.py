@@ -0,0 +1,62 @@
+from deployflow.core.analysis.evidence import apply_patch, empty_evidence
+
+
+def test_operations():
+    evidences = empty_evidence()
+    evidences["build_commands"] = ["pip install -r requirements.txt"]
+    patched, errors = apply_patch(evidences, [
+        {"op": "set", "field": "target", "value": "aws"},
+        {"op": "add", "field": "ports", "value": [5000, 5000]},
+        {"op": "add", "field": "build_commands", "value": "apt-get install -y python3", "index": 0},
+        {"op": "add", "field": "notes", "value": "a"},
+        {"op": "add", "field": "notes", "value": ["a", "b"]},
+        {"op": "remove", "field": "notes", "value": "a"},
+        {"op": "set", "field": "frameworks", "value": ["Flask"]},
+    ])
+    assert errors == []
+    assert patched["target"] == "aws"
+    assert patched["ports"] == [5000]
+    assert patched["build_commands"] == ["apt-get install -y python3", "pip install -r requirements.txt"]
+    assert patched["notes"] == ["b"]
+    assert patched["frameworks"] == ["Flask"]
+    assert evidences["build_commands"] == ["pip install -r requirements.txt"]  # not modified
+
+
+def test_invalid_operations_are_skipped():
+    patched, errors = apply_patch({"ports": [80]}, [
+        {"op": "add", "field": "target", "value": "aws"},
+        {"op": "set", "field": "ports", "value": 8080},
+        {"op": "add", "field": "colour", "value": "blue"},
+        {"op": "replace", "field": "ports", "value": [1]},
+        {"op": "add", "field": "ports", "value": {"port": 1}},
+        {"op": "add", "field": "ports"},
+        {"op": "remove", "field": "ports", "value": [80, 443]},
+        "add ports 80",
+    ])
+    assert len(errors) == 8
+    assert errors[-2].endswith("not in ports: [443]")
+    assert patched["ports"] == [] and patched["target"] == ""
+    assert set(patched) == set(empty_evidence())
+
+
+def test_patch_must_be_a_list():
+    patched, errors = apply_patch({}, {"op": "set", "field": "target", "value": "aws"})
+    assert errors == ["patch must be a list of operations"]
+    assert patched == empty_evidence()
+
+
+def test_base_evidence_is_coerced_to_the_schema():
+    patched, errors = apply_patch({"ports": "5000", "target": None, "region": 1, "frameworks": ["flask", {"x": 1}],
+                                   "notes": {"a": 1}, "extra": "kept"}, [
+        {"op": "add", "field": "ports", "value": 8080},
+        {"op": "add", "field": "frameworks", "value": "gunicorn"},
+    ])
+    assert patched["ports"] == ["5000", 8080] and patched["target"] == "" and patched["region"] == "1"
+    assert patched["frameworks"] == ["flask", "gunicorn"] and patched["notes"] == [] and patched["extra"] == "kept"
+    assert errors == ['{"ports": "5000"}: ports must be a list, kept as ["5000"]',
+                      '{"region": 1}: region must be a string, kept as "1"',
+                      '{"frameworks": ["flask", {"x": 1}]}: frameworks items must be strings or numbers, dropped the '
+                      'others',
+                      '{"notes": {"a": 1}}: notes must be a list, cleared']
+    patched, errors = apply_patch(["not", "an", "object"], [])
+    assert patched == empty_evidence() and errors == ['evidence must be an object, not ["not", "an", "object"]']
@@ -1,8 +1,61 @@
-from deployflow.core.analysis.fs import init_target
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import tarfile
+import zipfile
 
+import pytest
 
-def common_tests(target, subdir=""):
-    ls, cat, close = init_target(target)
+from deployflow.core.analysis.fs import identify_target, init_target, open_target
+
+
+def make_hello_world(root):
+    files = {
+        "README.md": "# Simple Deploy App with Frontend and Backend\n",
+        ".gitignore": "__pycache__/\n",
+        "app/app.py": "from flask import Flask\n\napp = Flask(__name__)\n",
+        "app/requirements.txt": "flask\n",
+        "app/templates/index.html": "<html><head><title>Simple Deploy App</title></head></html>\n",
+        "app/static/style.css": "body { margin: 0; }\n",
+    }
+    for name, content in files.items():
+        path = os.path.join(root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+    return root
+
+
+def make_git_repo(root):
+    make_hello_world(root)
+    git = ["git", "-C", str(root), "-c", "user.name=test", "-c", "user.email=test@example.com"]
+    subprocess.run(git + ["init", "-q"], check=True)
+    subprocess.run(git + ["config", "uploadpack.allowFilter", "true"], check=True)
+    subprocess.run(git + ["add", "."], check=True)
+    subprocess.run(git + ["commit", "-qm", "init"], check=True)
+    return "file://" + str(root)
+
+
+def make_zip(root, path, prefix, dir_entries=True):
+    with zipfile.ZipFile(path, "w") as zf:
+        for folder, dirs, files in os.walk(root):
+            rel = os.path.relpath(folder, root).replace(os.sep, "/")
+            rel = "" if rel == "." else rel + "/"
+            if dir_entries and rel:
+                zf.writestr(prefix + rel, "")
+            for name in files:
+                zf.write(os.path.join(folder, name), prefix + rel + name)
+    return str(path)
+
+
+def make_tar(root, path, prefix):
+    with tarfile.open(path, "w:gz" if str(path).endswith(".gz") else "w") as tf:
+        tf.add(root, prefix.rstrip("/"))
+    return str(path)
+
+
+def common_tests(target, subdir="", init=init_target):
+    ls, cat, close = init(target)
     try:
         assert set(ls(subdir)) == {subdir + "app/", subdir + "README.md", subdir + '.gitignore'}
         assert "Simple Deploy App with Frontend and Backend" in cat(subdir + "README.md")
@@ -21,6 +74,118 @@ def test_git_repo_remote():
     common_tests(repo_url)
 
 
+def test_git_repo_local(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    common_tests(make_git_repo(tmp_path / "hello_world"))
+
+
+def test_identify_target(tmp_path):
+    assert identify_target("file:///srv/git/hello_world") == ("git", "hello_world")
+    assert identify_target("git@github.com:Arvo-AI/hello_world.git") == ("git", "hello_world.git")
+    assert identify_target("https://example.com/app.tar.gz") == ("tar", "app")
+    assert identify_target(str(tmp_path)) == ("dir", tmp_path.name)
+
+
+def test_git_repo_reads_do_not_checkout(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    ls, cat, close = init_target(make_git_repo(tmp_path / "hello_world"))
+    try:
+        clones = [name for name in os.listdir(tmp_path) if name != "hello_world"]
+        assert "from flask import Flask" in cat("app/app.py")
+        assert "flask" in cat("app/requirements.txt")
+        for clone in clones:
+            assert not os.path.exists(tmp_path / clone / "app")
+    finally:
+        close()
+
+
+def test_concurrent_reads(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    root = make_hello_world(str(tmp_path / "hello_world"))
+    paths = ["README.md", ".gitignore", "app/app.py", "app/requirements.txt", "app/templates/index.html",
+             "app/static/style.css"] * 4
+    expected = [open(os.path.join(root, path)).read() for path in paths]
+    targets = [make_git_repo(tmp_path / "repo"), make_zip(root, tmp_path / "hello.zip", ""),
+               make_tar(root, tmp_path / "hello.tar", ""), make_tar(root, tmp_path / "hello.tar.gz", "")]
+    for target in targets:
+        ls, cat, close = init_target(target)
+        try:
+            with ThreadPoolExecutor(8) as pool:
+                assert list(pool.map(cat, paths)) == expected
+        finally:
+            close()
+
+
+def test_bulk_api(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    root = make_hello_world(str(tmp_path / "hello_world"))
+    files = {"README.md", ".gitignore", "app/app.py", "app/requirements.txt", "app/templates/index.html",
+             "app/static/style.css"}
+    targets = [root, make_git_repo(tmp_path / "repo"), make_zip(root, tmp_path / "hello.zip", "", False),
+               make_tar(root, tmp_path / "hello.tar", ""), make_tar(root, tmp_path / "hello.tar.gz", "")]
+    for target in targets:
+        with open_target(target) as source:
+            assert set(source.walk()) == files
+            assert set(source.walk("app")) == files - {"README.md", ".gitignore"}
+            assert set(source.walk(skip={"templates"}, max_depth=3)) == files - {"app/templates/index.html"}
+            assert set(source.walk(max_depth=2)) == {"README.md", ".gitignore", "app/app.py", "app/requirements.txt"}
+            assert set(source.walk(max_depth=1)) == {"README.md", ".gitignore"}
+            assert sorted(source.glob("**/*.py")) == ["app/app.py"]
+            assert sorted(source.glob("app/*/*.*")) == ["app/static/style.css", "app/templates/index.html"]
+            assert sorted(source.glob("*.md")) == ["README.md"] and source.glob("nope/**") == []
+            assert source.stat("app/").is_dir and not source.stat("app/app.py").is_dir
+            assert source.stat("app/requirements.txt").size in (None, 6)
+            with source.open("app/app.py") as f:
+                assert f.read().startswith(b"from flask import Flask")
+            contents = dict(source.read_many(["app/app.py", "README.md", "app", "missing.py"]))
+            assert contents == {"app/app.py": open(os.path.join(root, "app", "app.py"), "rb").read(),
+                                "README.md": open(os.path.join(root, "README.md"), "rb").read(),
+                                "app": None, "missing.py": None}
+            with pytest.raises(FileNotFoundError):
+                source.stat("missing.py")
+
+
+def test_symlink_loop(tmp_path):
+    root = make_hello_world(str(tmp_path / "hello_world"))
+    os.symlink("..", os.path.join(root, "app", "loop"))
+    with open_target(root) as source:
+        assert "app/loop" in set(source.walk()) and "app/loop" in source.ls("app")
+        assert len(list(source.walk())) == 7
+
+
+def test_local_fixture(tmp_path):
+    common_tests(make_hello_world(str(tmp_path / "hello_world-main")))
+
+
+def test_local_zip_fixture(tmp_path):
+    root = make_hello_world(str(tmp_path / "hello_world-main"))
+    common_tests(make_zip(root, tmp_path / "hello.zip", "hello_world-main/"), "hello_world-main/")
+
+
+def test_local_zip_without_directory_entries(tmp_path):
+    root = make_hello_world(str(tmp_path / "hello_world-main"))
+    common_tests(make_zip(root, tmp_path / "hello.zip", "nested/hello_world-main/", False),
+                 "nested/hello_world-main/")
+
+
+def test_local_tar_fixture(tmp_path):
+    root = make_hello_world(str(tmp_path / "hello_world-main"))
+    common_tests(make_tar(root, tmp_path / "hello.tar", "hello_world-main/"), "hello_world-main/")
+    common_tests(make_tar(root, tmp_path / "hello.tar.gz", "hello_world-main/"), "hello_world-main/")
+
+
+def test_missing_path(tmp_path):
+    root = make_hello_world(str(tmp_path / "hello_world-main"))
+    ls, cat, close = init_target(make_zip(root, tmp_path / "hello.zip", ""))
+    try:
+        with pytest.raises(FileNotFoundError):
+            ls("nope/")
+        with pytest.raises(FileNotFoundError):
+            cat("app/nope.py")
+    finally:
+        close()
+
+
 def test_local():
     repo_url = "C:\\Users\\zy\\Downloads\\hello_world-main"
     common_tests(repo_url)
@@ -39,3 +204,35 @@ def test_local_tar():
 def test_nested_zip():
     repo_url = "C:\\Users\\zy\\Downloads\\nested2.zip"
     common_tests(repo_url, 'nested2/nested/hello_world-main/')
+
+
+def test_git_missing_blob_does_not_desync_reads(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    source = open_target(make_git_repo(tmp_path / "hello_world"))
+    try:
+        good = source._index.get("README.md").ref
+        bad = "0" * len(good)
+        source._blobs._fetched.add(bad)
+        with pytest.raises(FileNotFoundError, match=bad):
+            source._blobs.read_many([bad, good, good])
+        assert b"Simple Deploy App" in source._blobs.read(good)
+        source._index._entries["app/app.py"] = source._index.get("app/app.py")._replace(ref=bad)
+        contents = dict(source.read_many(["README.md", "app/app.py"]))
+        assert contents["app/app.py"] is None and b"Simple Deploy App" in contents["README.md"]
+    finally:
+        source.close()
+
+
+def test_git_fetch_failure_is_an_os_error(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    source = open_target(make_git_repo(tmp_path / "hello_world"))
+    try:
+        def failing_run(*args, **kwargs):
+            raise subprocess.CalledProcessError(128, args[0], stderr="fatal: unable to access origin\n")
+
+        monkeypatch.setattr(subprocess, "run", failing_run)
+        with pytest.raises(OSError, match="unable to access origin"):
+            source.cat("README.md")
+        assert dict(source.read_many(["README.md", "app/app.py"])) == {"README.md": None, "app/app.py": None}
+    finally:
+        source.close()
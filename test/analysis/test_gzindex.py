@@ -0,0 +1,117 @@
+import gzip
+import io
+import os
+import random
+
+from deployflow.core.analysis import gzindex
+from deployflow.core.analysis.fs import init_target, open_target
+from deployflow.core.analysis.gzindex import GzipIndex, INDEX_SUFFIX
+from test.analysis.test_fs import common_tests, make_hello_world, make_tar
+
+
+class CountingFile(io.BytesIO):
+    def __init__(self, data):
+        super().__init__(data)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.bytes_read += len(data)
+        return data
+
+
+def make_data(size):
+    rng = random.Random(0)
+    words = [bytes(rng.choice(b"abcdefghij") for _ in range(8)) for _ in range(512)]
+    return b" ".join(rng.choice(words) for _ in range(size // 9))
+
+
+def test_random_reads_match():
+    data = make_data(3 * 1024 * 1024)
+    gz = GzipIndex(io.BytesIO(gzip.compress(data)), span=128 * 1024)
+    assert gz.stream().read() == data
+    assert len(gz) > 10
+    rng = random.Random(1)
+    for _ in range(50):
+        offset = rng.randrange(len(data))
+        size = rng.randrange(1, 100_000)
+        assert gz.read_at(offset, size) == data[offset:offset + size]
+
+
+def test_random_read_is_bounded_after_indexing():
+    data = make_data(3 * 1024 * 1024)
+    compressed = CountingFile(gzip.compress(data))
+    gz = GzipIndex(compressed, span=128 * 1024)
+    gz.stream().read()
+    compressed.bytes_read = 0
+    assert gz.read_at(len(data) - 1000, 1000) == data[-1000:]
+    assert compressed.bytes_read < len(compressed.getvalue()) / 4
+
+
+def test_read_ranges_is_one_forward_pass():
+    data = make_data(3 * 1024 * 1024)
+    compressed = CountingFile(gzip.compress(data))
+    gz = GzipIndex(compressed, span=128 * 1024)
+    gz.stream().read()
+    compressed.bytes_read = 0
+    ranges = [(offset, 700) for offset in range(0, len(data) - 700, 1000)]
+    assert list(gz.read_ranges(ranges)) == [data[offset:offset + size] for offset, size in ranges]
+    assert compressed.bytes_read <= len(compressed.getvalue()) + gzindex.CHUNK
+    rng = random.Random(2)
+    ranges = sorted((rng.randrange(len(data)), rng.randrange(0, 300_000)) for _ in range(30))
+    ranges += [(10, 5)]  # backwards
+    assert list(gz.read_ranges(ranges)) == [data[offset:offset + size] for offset, size in ranges]
+
+
+def test_tar_gz_read_many_inflates_once(tmp_path, monkeypatch):
+    root = str(tmp_path / "repo")
+    for i in range(300):
+        os.makedirs(os.path.join(root, f"pkg{i % 7}"), exist_ok=True)
+        with open(os.path.join(root, f"pkg{i % 7}", f"file{i}.txt"), "wb") as f:
+            f.write(make_data(20_000))
+    archive = make_tar(root, tmp_path / "repo.tar.gz", "")
+    with open_target(archive) as source:
+        paths = list(source.walk())
+        monkeypatch.setattr(GzipIndex, "read_at", lambda *args: (_ for _ in ()).throw(AssertionError("read_at")))
+        contents = dict(source.read_many(paths))
+    assert len(contents) == 300
+    for path in paths[:20]:
+        with open(os.path.join(root, path), "rb") as f:
+            assert contents[path] == f.read()
+
+
+def test_multi_member_stream():
+    parts = [make_data(200_000), make_data(50_000), b"tail"]
+    gz = GzipIndex(io.BytesIO(b"".join(gzip.compress(part) for part in parts) + b"\0" * 512), span=64 * 1024)
+    data = b"".join(parts)
+    assert gz.stream().read() == data
+    assert gz.read_at(len(data) - 10, 10) == data[-10:]
+
+
+def test_tar_gz_index_is_cached(tmp_path, monkeypatch):
+    root = make_hello_world(str(tmp_path / "hello_world-main"))
+    archive = make_tar(root, tmp_path / "hello.tar.gz", "hello_world-main/")
+    common_tests(archive, "hello_world-main/")
+    assert os.path.isfile(archive + INDEX_SUFFIX)
+
+    def no_scan(*args, **kwargs):
+        raise AssertionError("archive was scanned again")
+
+    monkeypatch.setattr("tarfile.open", no_scan)
+    common_tests(archive, "hello_world-main/")
+
+
+def test_tar_gz_index_invalidated_on_change(tmp_path):
+    root = make_hello_world(str(tmp_path / "hello_world-main"))
+    archive = make_tar(root, tmp_path / "hello.tar.gz", "hello_world-main/")
+    init_target(archive)[2]()
+    with open(os.path.join(root, "NEW.md"), "w") as f:
+        f.write("new file")
+    make_tar(root, archive, "hello_world-main/")
+    os.utime(archive, ns=(0, 0))
+    ls, cat, close = init_target(archive)
+    try:
+        assert cat("hello_world-main/NEW.md") == "new file"
+    finally:
+        close()
+    assert gzindex._load_members(archive + INDEX_SUFFIX, os.stat(archive)) is not None
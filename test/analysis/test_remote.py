@@ -0,0 +1,113 @@
+import os
+import threading
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from deployflow.core.analysis.fs import init_target, copy_target
+from deployflow.core.analysis.remote import HttpRangeFile, download_spooled
+from test.analysis.test_fs import common_tests, make_hello_world, make_tar, make_zip
+
+
+def serve(files, ranges=True):
+    served = {"bytes": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _body(self):
+            name = self.path.lstrip("/")
+            if name not in files:
+                self.send_error(404)
+                return None
+            with open(files[name], "rb") as f:
+                return f.read()
+
+        def do_HEAD(self):
+            body = self._body()
+            if body is None:
+                return
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            if ranges:
+                self.send_header("Accept-Ranges", "bytes")
+            self.end_headers()
+
+        def do_GET(self):
+            body = self._body()
+            if body is None:
+                return
+            header = self.headers.get("Range")
+            if ranges and header:
+                start, end = header.split("=")[1].split("-")
+                body = body[int(start):int(end) + 1]
+                self.send_response(206)
+            else:
+                self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            served["bytes"] += len(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/", served
+
+
+@pytest.fixture
+def archives(tmp_path):
+    root = make_hello_world(str(tmp_path / "hello_world-main"))
+    with open(os.path.join(root, "app", "static", "blob.bin"), "wb") as f:
+        f.write(os.urandom(4 * 1024 * 1024))
+    return {
+        "hello.zip": make_zip(root, tmp_path / "hello.zip", "hello_world-main/"),
+        "hello.tar.gz": make_tar(root, tmp_path / "hello.tar.gz", "hello_world-main/"),
+    }
+
+
+def test_remote_zip_reads_only_needed_ranges(archives):
+    server, url, served = serve(archives)
+    try:
+        common_tests(url + "hello.zip", "hello_world-main/")
+        assert served["bytes"] < os.path.getsize(archives["hello.zip"]) / 4
+    finally:
+        server.shutdown()
+
+
+def test_range_file_matches_local_file(archives):
+    server, url, _ = serve(archives)
+    try:
+        with open(archives["hello.zip"], "rb") as f:
+            expected = f.read()
+        remote = HttpRangeFile(url + "hello.zip", block_size=1024)
+        assert remote.size == len(expected)
+        remote.seek(-100, os.SEEK_END)
+        assert remote.read() == expected[-100:]
+        remote.seek(5000)
+        assert remote.read(3000) == expected[5000:8000]
+        with zipfile.ZipFile(remote) as zf:
+            assert "from flask import Flask" in zf.read("hello_world-main/app/app.py").decode()
+    finally:
+        server.shutdown()
+
+
+def test_remote_zip_without_range_support(archives):
+    server, url, _ = serve(archives, ranges=False)
+    try:
+        common_tests(url + "hello.zip", "hello_world-main/")
+    finally:
+        server.shutdown()
+
+
+def test_remote_tar_is_spooled(archives, tmp_path):
+    server, url, _ = serve(archives)
+    try:
+        common_tests(url + "hello.tar.gz", "hello_world-main/")
+        with download_spooled(url + "hello.tar.gz", max_memory=1024) as spool:
+            assert spool._rolled
+        copy_target(url + "hello.tar.gz", str(tmp_path / "copy"))
+        assert os.path.isfile(tmp_path / "copy" / "hello_world-main" / "app" / "app.py")
+    finally:
+        server.shutdown()
@@ -0,0 +1,63 @@
+import os
+
+import pytest
+
+from deployflow.core.analysis import scan
+from deployflow.core.analysis.fs import open_target
+from test.analysis.test_fs import make_hello_world, make_zip
+from test.analysis.test_static import write
+
+FILES = {
+    "app/app.py": "from flask import Flask\n\napp.run(host='127.0.0.1', port=5000)\n",
+    "app/templates/index.html": "<a href=\"https://github.com/x/y\">src</a>\n<script>\nfetch('http://localhost:5000/api')\n</script>\n",
+    "app/static/config.js": "const API = 'http://192.168.1.20:8080';\nconst DB = 'db.example.com:5432';\n",
+    "app/static/logo.png": "\0PNG http://localhost:1234",
+    "node_modules/x/index.js": "http://localhost:9999",
+}
+
+
+def hits_of(root, archive=False, workers=1):
+    target = make_zip(root, os.path.join(os.path.dirname(root), "t.zip"), "") if archive else root
+    with open_target(target) as source:
+        return scan.scan(source, workers=workers)
+
+
+@pytest.mark.parametrize("archive, workers", [(False, 1), (False, 2), (True, 1), (True, 2)])
+def test_scan_hits(tmp_path, archive, workers):
+    root = write(make_hello_world(str(tmp_path / "repo")), FILES)
+    hits = hits_of(root, archive, workers)
+    assert [(hit.path, hit.line, hit.kind, hit.text) for hit in hits] == [
+        ("app/app.py", 3, "ip", "127.0.0.1"),
+        ("app/static/config.js", 1, "url", "http://192.168.1.20:8080"),
+        ("app/static/config.js", 2, "hostport", "db.example.com:5432"),
+        ("app/templates/index.html", 1, "url", "https://github.com/x/y"),
+        ("app/templates/index.html", 3, "url", "http://localhost:5000/api"),
+    ]
+
+
+def test_update_commands(tmp_path):
+    root = write(make_hello_world(str(tmp_path / "repo")), FILES)
+    assert scan.update_commands(hits_of(root), [5000]) == [
+        'sed -i "s#127\\.0\\.0\\.1#0.0.0.0#g" app/app.py',
+        'sed -i "s#localhost:5000#$PUBLIC_IP:$PORT#g" app/templates/index.html',
+    ]
+    assert scan.update_commands(hits_of(root), [8000]) == ['sed -i "s#127\\.0\\.0\\.1#0.0.0.0#g" app/app.py']
+
+
+def test_update_commands_leave_other_services_alone(tmp_path):
+    root = write(make_hello_world(str(tmp_path / "repo")), {
+        "app/app.py": "DB = 'postgres://user:pw@localhost:5432/app'\napp.run(host='localhost', port=5000)\n",
+        "app/settings.py": "REDIS = 'redis://127.0.0.1:6379'\nAPI = 'http://127.0.0.1:5000/api'\nHOST = '127.0.0.1'\n",
+        "app/static/main.js": "fetch('http://localhost/api')\n",
+    })
+    assert scan.update_commands(hits_of(root), [5000]) == [
+        'sed -i "s#127\\.0\\.0\\.1:5000#$PUBLIC_IP:$PORT#g" app/settings.py',
+        'sed -i "s#localhost#$PUBLIC_IP#g" app/static/main.js',
+    ]
+
+
+def test_notes_skip_external_urls(tmp_path):
+    root = write(make_hello_world(str(tmp_path / "repo")), FILES)
+    note, = scan.notes(hits_of(root))
+    assert "4 hardcoded addresses found, 1 external URLs" in note
+    assert "github.com" not in note
@@ -0,0 +1,84 @@
+import json
+import os
+
+from deployflow.core.analysis.fs import init_target
+from deployflow.core.analysis.static import static_analysis
+from test.analysis.test_fs import make_hello_world
+
+
+def analyze(root):
+    ls, cat, close = init_target(str(root))
+    try:
+        return static_analysis(ls, cat)
+    finally:
+        close()
+
+
+def write(root, files):
+    for name, content in files.items():
+        path = os.path.join(root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+    return root
+
+
+def test_flask_app(tmp_path):
+    root = make_hello_world(str(tmp_path / "hello_world"))
+    with open(os.path.join(root, "app", "app.py"), "a") as f:
+        f.write("if __name__ == '__main__':\n    app.run(host='127.0.0.1', port=5000)\n")
+    evidences = analyze(root)
+    assert evidences["platform"] == ["Python"]
+    assert evidences["frameworks"] == ["Flask"]
+    assert evidences["ports"] == [5000]
+    assert evidences["build_commands"] == ["pip install -r app/requirements.txt"]
+    assert evidences["deployment_commands"] == ["cd app && python app.py"]
+    assert evidences["config_files"] == ["app/requirements.txt"]
+
+
+def test_node_and_docker(tmp_path):
+    write(tmp_path, {
+        "package.json": json.dumps({"dependencies": {"express": "^4"},
+                                    "scripts": {"build": "tsc", "start": "node dist/server.js --port 8080"}}),
+        "Dockerfile": "FROM node:20\nEXPOSE 8080\n",
+        "node_modules/pkg/package.json": json.dumps({"dependencies": {"koa": "1"}}),
+    })
+    evidences = analyze(tmp_path)
+    assert evidences["platform"] == ["Docker", "Node.js"]
+    assert evidences["frameworks"] == ["Express"]
+    assert evidences["ports"] == [8080]
+    assert evidences["build_commands"] == ["npm install", "npm run build"]
+    assert evidences["deployment_commands"] == ["npm start"]
+
+
+def test_other_manifests(tmp_path):
+    write(tmp_path, {
+        "api/go.mod": "module x\n\ngo 1.22\n\nrequire github.com/gin-gonic/gin v1.9.1\n",
+        "web/Procfile": "web: gunicorn app:app --bind 0.0.0.0:$PORT\n",
+        "web/pyproject.toml": '[project]\nname = "web"\ndependencies = ["django>=5"]\n',
+        "web/.env.example": "PORT=8000\n",
+    })
+    evidences = analyze(tmp_path)
+    assert set(evidences["platform"]) == {"Go", "Python"}
+    assert set(evidences["frameworks"]) == {"Gin", "Django"}
+    assert evidences["ports"] == [8000]
+    assert "cd web && pip install ." in evidences["build_commands"]
+    assert "cd web && gunicorn app:app --bind 0.0.0.0:$PORT" in evidences["deployment_commands"]
+
+
+def test_unparsable_manifest_is_noted(tmp_path):
+    write(tmp_path, {"package.json": "{not json"})
+    evidences = analyze(tmp_path)
+    assert evidences["platform"] == []
+    assert any("package.json could not be parsed" in note for note in evidences["notes"])
+
+
+def test_manifest_that_is_not_an_object_is_noted(tmp_path):
+    write(tmp_path, {"package.json": "[1, 2]", "api/composer.json": '"x"',
+                     "web/package.json": '{"dependencies": ["express"], "scripts": {"start": 3}, "main": "app.js"}',
+                     "web/requirements.txt": "flask\n"})
+    evidences = analyze(tmp_path)
+    assert set(evidences["platform"]) == {"Node.js", "Python"}
+    assert "cd web && node app.js" in evidences["deployment_commands"]
+    assert "package.json could not be parsed: expected an object, not list" in evidences["notes"]
+    assert "api/composer.json could not be parsed: expected an object, not str" in evidences["notes"]
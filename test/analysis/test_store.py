@@ -0,0 +1,99 @@
+import os
+import subprocess
+import time
+
+from typer.testing import CliRunner
+
+from deployflow import cli, config
+from deployflow.core.analysis import store
+from deployflow.core.analysis.store import EvidenceStore
+from test.analysis.test_fs import make_git_repo, make_hello_world
+
+EVIDENCES = {"platform": ["python"], "ports": [5000], "target": "aws", "notes": []}
+
+
+def test_revision_of_folder(tmp_path):
+    root = make_hello_world(str(tmp_path / "hello_world"))
+    first = store.revision(root)
+    assert first.startswith("files:") and store.revision(root) == first
+    with open(os.path.join(root, "app", "app.py"), "a") as f:
+        f.write("# changed\n")
+    assert store.revision(root) != first
+
+
+def test_revision_of_git_work_tree(tmp_path):
+    root = str(tmp_path / "hello_world")
+    url = make_git_repo(root)
+    head = subprocess.run(["git", "-C", root, "rev-parse", "HEAD"], capture_output=True, text=True).stdout.strip()
+    assert store.revision(root) == head
+    assert store.revision(url) == head
+    with open(os.path.join(root, "app", "new.py"), "w") as f:
+        f.write("untracked\n")
+    dirty = store.revision(root)
+    assert dirty.startswith(head + "+")
+    with open(os.path.join(root, "app", "new.py"), "a") as f:
+        f.write("more\n")
+    os.utime(os.path.join(root, "app", "new.py"), ns=(1, 1))
+    assert store.revision(root) not in (head, dirty)
+    assert store.revision(os.path.join(root, "app")).startswith(head + "+")
+
+
+def test_revision_of_archive_and_unknown(tmp_path):
+    archive = tmp_path / "app.zip"
+    archive.write_bytes(b"zip")
+    assert store.revision(str(archive)).startswith("file:")
+    assert store.revision("https://example.com/app.zip") is None
+    assert store.revision(str(tmp_path / "missing.zip")) is None
+
+
+def test_put_get_and_status(tmp_path):
+    evidence = EvidenceStore(str(tmp_path / "evidence.db"))
+    assert evidence.get("app", "abc", "deploy") is None
+    first = evidence.put("app", "abc", "deploy", EVIDENCES, 1.5)
+    latest = evidence.put("app", "abc", "deploy", dict(EVIDENCES, ports=[8080]))
+    evidence.put("app", "def", "deploy", EVIDENCES)
+    evidence.put("other", "abc", "deploy", EVIDENCES)
+    run = evidence.get(os.path.join(os.getcwd(), "app"), "abc", "deploy")
+    assert run.id == latest and run.evidences["ports"] == [8080]
+    assert evidence.get("app", None, "deploy") is None and evidence.get("app", "abc", "other task") is None
+    evidence.set_status(first, "deployed")
+    assert evidence.run(first).status == "deployed" and evidence.run(first).duration == 1.5
+    assert [run.id for run in evidence.runs("app")] == [3, latest, first]
+    assert len(evidence.runs(limit=2)) == 2
+    evidence.close()
+    assert EvidenceStore(str(tmp_path / "evidence.db")).run(first).status == "deployed"
+
+
+def test_prune(tmp_path, monkeypatch):
+    evidence = EvidenceStore(str(tmp_path / "evidence.db"))
+    now = time.time()
+    for i in range(5):
+        monkeypatch.setattr(time, "time", lambda: now - (5 - i) * 86400)
+        evidence.put("app", str(i), "deploy", EVIDENCES)
+        evidence.put("other", str(i), "deploy", EVIDENCES)
+    monkeypatch.setattr(time, "time", lambda: now)
+    assert evidence.prune(older_than=4.5) == 2
+    assert evidence.prune(keep=2) == 4
+    assert [run.revision for run in evidence.runs("app")] == ["4", "3"]
+
+
+def test_diff():
+    assert store.diff(EVIDENCES, dict(EVIDENCES, ports=[5000, 8080], platform=[], target="gcp", region="x")) == [
+        "- platform: python", "+ ports: 8080", "~ target: 'aws' -> 'gcp'", "~ region: None -> 'x'"]
+
+
+def test_evidence_commands(tmp_path, monkeypatch):
+    values = {("cache", "evidence_db"): str(tmp_path / "evidence.db")}
+    monkeypatch.setattr(config, "get_val", lambda section, key, default=None: values.get((section, key), default))
+    evidence = EvidenceStore()
+    old = evidence.put("app", "abc", "deploy on aws", EVIDENCES)
+    new = evidence.put("app", "def", "deploy on aws", dict(EVIDENCES, ports=[8080]))
+    runner = CliRunner()
+    result = runner.invoke(cli.app, ["evidence", "list"])
+    assert result.exit_code == 0 and f"#{new}" in result.output and "deploy on aws" in result.output
+    result = runner.invoke(cli.app, ["evidence", "diff", str(old), str(new)])
+    assert "- ports: 5000" in result.output and "+ ports: 8080" in result.output
+    result = runner.invoke(cli.app, ["evidence", "show", str(new)])
+    assert '"ports": [\n    8080\n  ]' in result.output
+    result = runner.invoke(cli.app, ["evidence", "prune", "--keep", "1"])
+    assert "Deleted 1 runs" in result.output and EvidenceStore().run(old) is None
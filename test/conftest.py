@@ -0,0 +1,35 @@
+import json
+
+import pytest
+
+from deployflow import config
+
+
+class FakeAI:
+    """
+    Scripted stand-in for the AI client, `script` maps the request messages and the request number to a response, a
+    dict is sent as JSON. Responses are streamed to `on_token` word by word, like the real client does.
+    """
+
+    def __init__(self, script):
+        self.script = script
+        self.requests = []
+
+    def complete(self, messages, on_token=None, **kwargs):
+        self.requests.append(dict(kwargs, messages=messages))
+        response = self.script(messages, len(self.requests))
+        response = response if isinstance(response, str) else json.dumps(response)
+        if on_token:
+            for token in response.split(" "):
+                on_token(token + " ")
+        return response
+
+
+@pytest.fixture
+def settings(tmp_path, monkeypatch):
+    """Config file values of the test, the deployment caches live under `tmp_path`. Add to the dict to set more."""
+    values = {("deployment", "artifact_cache"): str(tmp_path / "artifacts"),
+              ("deployment", "terraform_cache"): str(tmp_path / "terraform")}
+    monkeypatch.setattr(config, "get_val", lambda section, key, default=None: values.get((section, key), default))
+    monkeypatch.delenv("TF_CLI_CONFIG_FILE", raising=False)
+    return values
@@ -0,0 +1,112 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from deployflow.core.deployment import ai_deployer, artifacts, delta
+from deployflow.core.deployment.prompts import REUSED_PROMPT
+from deployflow.core.deployment.runner import CommandResult
+from test.conftest import FakeAI
+
+EVIDENCES = {
+    "platform": ["Python", "Flask"],
+    "frameworks": ["flask"],
+    "ports": [5000],
+    "build_commands": ["pip install -r requirements.txt"],
+    "update_commands": [],
+    "deployment_commands": ["python app.py"],
+    "notes": ["serves hello world"],
+    "target": "aws",
+    "region": "us-east-1",
+    "instance_type": "",
+}
+MAIN_TF = 'resource "aws_key_pair" "key" {\n  key_name = "helloworld-key"\n}\n'
+AUTO_DEPLOY = "#!/bin/bash\ncd ~/app && python app.py\n"
+
+
+def deployed(path, main_tf=MAIN_TF, auto_deploy=AUTO_DEPLOY):
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, "main.tf"), "w") as f:
+        f.write(main_tf)
+    with open(os.path.join(path, "auto-deploy.sh"), "w") as f:
+        f.write(delta.add_apply_step(auto_deploy))
+    return str(path)
+
+
+def test_fingerprint_is_normalized():
+    same = dict(EVIDENCES, platform=["flask ", "python", "Python"], ports=["5000"], notes=[],
+                build_commands=["pip  install -r requirements.txt"], target="AWS")
+    assert artifacts.fingerprint(same) == artifacts.fingerprint(EVIDENCES)
+    assert artifacts.fingerprint(dict(EVIDENCES, region="eu-west-1")) != artifacts.fingerprint(EVIDENCES)
+    assert artifacts.fingerprint(dict(EVIDENCES, ports=[8080])) != artifacts.fingerprint(EVIDENCES)
+
+
+def test_save_and_lookup(tmp_path, settings):
+    assert artifacts.lookup(EVIDENCES, "helloworld") is None
+    key = artifacts.save(EVIDENCES, deployed(tmp_path / "deploy"), "helloworld")
+    found = artifacts.lookup(dict(EVIDENCES, notes=["other notes"]), "otherapp")
+    assert found.key == key and found.similarity == 1.0
+    assert found.main_tf == MAIN_TF.replace("helloworld", "otherapp")
+    assert found.auto_deploy == AUTO_DEPLOY
+    artifacts.forget(key)
+    assert artifacts.lookup(EVIDENCES, "helloworld") is None
+
+
+def test_repository_name_is_only_replaced_in_names(tmp_path, settings):
+    main_tf = ('resource "aws_key_pair" "key" {\n  key_name = "app-key-1a2b"\n}\n'
+               'resource "aws_security_group" "sg" {\n  name = "webapp-sg"\n  description = "app"\n}\n'
+               'resource "aws_instance" "app" {\n  tags = {\n    Name = "app"\n  }\n}\n')
+    auto_deploy = "#!/bin/bash\ncd ~/app && python app.py\n"
+    artifacts.save(EVIDENCES, deployed(tmp_path / "deploy", main_tf, auto_deploy), "app")
+    found = artifacts.lookup(EVIDENCES, "shop")
+    assert found.main_tf == main_tf.replace('"app-key', '"shop-key').replace('Name = "app"', 'Name = "shop"')
+    assert found.auto_deploy == auto_deploy
+
+
+def test_save_needs_both_files(tmp_path, settings):
+    path = deployed(tmp_path / "deploy")
+    os.remove(os.path.join(path, "auto-deploy.sh"))
+    assert artifacts.save(EVIDENCES, path, "helloworld") is None
+
+
+def test_concurrent_saves(tmp_path, settings):
+    targets = [deployed(tmp_path / f"deploy{i}") for i in range(8)]
+    with ThreadPoolExecutor(8) as pool:
+        keys = set(pool.map(lambda target: artifacts.save(EVIDENCES, target, "helloworld"), targets))
+    assert len(keys) == 1 and os.listdir(tmp_path / "artifacts") == list(keys)
+    assert artifacts.lookup(EVIDENCES, "helloworld").main_tf == MAIN_TF
+
+
+def test_nearest(tmp_path, settings):
+    artifacts.save(EVIDENCES, deployed(tmp_path / "one"), "helloworld")
+    artifacts.save(dict(EVIDENCES, frameworks=["django"], platform=["python"], ports=[8000]),
+                   deployed(tmp_path / "two", main_tf="django"), "helloworld")
+    near = artifacts.nearest(dict(EVIDENCES, region="eu-west-1"), "helloworld")
+    assert near.main_tf == MAIN_TF and 0.5 <= near.similarity < 1.0
+    assert near.differences == ["region: eu-west-1", "region: us-east-1"]
+    assert "region: eu-west-1" in near.prompt and MAIN_TF in near.prompt
+    assert artifacts.nearest(dict(EVIDENCES, target="gcp"), "helloworld") is None
+    assert artifacts.nearest({"target": "aws", "ports": [1]}, "helloworld") is None
+
+
+def test_deployment_skips_generation_stages(tmp_path, settings, monkeypatch, capsys):
+    repo = tmp_path / "helloworld"
+    repo.mkdir()
+    (repo / "app.py").write_text("print('hello')\n")
+    artifacts.save(EVIDENCES, deployed(tmp_path / "earlier"), "helloworld")
+    commands = []
+
+    def execute_command(target_folder, command, timeout=None, env=None):
+        commands.append(command)
+        return CommandResult("", "", 0, 0.1)
+
+    ai = FakeAI(lambda messages, n: "<<COMPLETION>>\nhttp://203.0.113.7:5000")
+    monkeypatch.setattr(ai_deployer, "execute_command", execute_command)
+    monkeypatch.setattr(ai_deployer, "get_ai", lambda: ai)
+    target_dir = str(tmp_path / "deploy")
+    assert ai_deployer.deploy_target(str(repo), "deploy", EVIDENCES, target_dir=target_dir)
+    assert commands[-1] == "terraform init" and len(ai.requests) == 1
+    assert capsys.readouterr().out.count("http://203.0.113.7:5000") == 1  # streamed, not printed again
+    assert REUSED_PROMPT in ai.requests[0]["messages"][-1]["content"]
+    with open(os.path.join(target_dir, "main.tf")) as f:
+        assert f.read() == MAIN_TF
+    with open(os.path.join(target_dir, "auto-deploy.sh")) as f:
+        assert f.read() == delta.add_apply_step(AUTO_DEPLOY)
@@ -0,0 +1,109 @@
+import os
+import shutil
+import subprocess
+import zipfile
+
+import pytest
+
+from deployflow.core.deployment import delta
+from deployflow.core.deployment.packager import package_source
+from test.analysis.test_fs import make_hello_world
+
+
+def tree(root):
+    files = {}
+    for folder, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(folder, name)
+            with open(path, "rb") as f:
+                files[os.path.relpath(path, root)] = f.read()
+    return files
+
+
+def redeploy(tmp_path):
+    """Deploy the fixture, change it, and package it again. Returns the deployment dir, source and server dirs."""
+    source = make_hello_world(str(tmp_path / "hello"))
+    deploy_dir, server = str(tmp_path / "deploy"), str(tmp_path / "server")
+    os.makedirs(deploy_dir)
+    package_source(source, os.path.join(deploy_dir, "src.zip"))
+    assert delta.prepare(deploy_dir) is None
+    with zipfile.ZipFile(os.path.join(deploy_dir, "src.zip")) as zf:
+        zf.extractall(server)
+    delta.commit(deploy_dir)
+
+    with open(os.path.join(source, "app", "app.py"), "a") as f:
+        f.write("print('changed')\n")
+    with open(os.path.join(source, "app", "new.py"), "w") as f:
+        f.write("new = True\n")
+    os.remove(os.path.join(source, "app", "static", "style.css"))
+    with open(os.path.join(source, "big.bin"), "wb") as f:
+        f.write(os.urandom(200000))
+    package_source(source, os.path.join(deploy_dir, "src.zip"))
+    return deploy_dir, server
+
+
+def expected(deploy_dir, tmp_path):
+    with zipfile.ZipFile(os.path.join(deploy_dir, "src.zip")) as zf:
+        zf.extractall(tmp_path / "fresh")
+    return tree(tmp_path / "fresh")
+
+
+def test_delta_applies_to_the_previous_deployment(tmp_path):
+    deploy_dir, server = redeploy(tmp_path)
+    report = delta.prepare(deploy_dir)
+    assert report.changed == ["app/app.py", "app/new.py", "big.bin"]
+    assert report.deleted == ["app/static/style.css"]
+    assert "3 changed and 1 deleted" in str(report) and "3 changed, 1 deleted" in report.prompt
+    with zipfile.ZipFile(os.path.join(deploy_dir, delta.DELTA_ZIP)) as zf:
+        assert "README.md" not in zf.namelist()
+    assert delta.apply_delta(os.path.join(deploy_dir, delta.DELTA_ZIP), server)
+    assert tree(server) == expected(deploy_dir, tmp_path)
+    assert not delta.apply_delta(os.path.join(deploy_dir, delta.DELTA_ZIP), server)  # already applied
+    with open(os.path.join(server, delta.MANIFEST), "w") as f:
+        f.write("{}")
+    with pytest.raises(ValueError):  # the server is at neither version
+        delta.apply_delta(os.path.join(deploy_dir, delta.DELTA_ZIP), server)
+
+
+def test_fresh_server_skips_the_delta(tmp_path):
+    deploy_dir, _ = redeploy(tmp_path)
+    delta.prepare(deploy_dir)
+    fresh = expected(deploy_dir, tmp_path)  # a new server gets the whole src.zip
+    assert not delta.apply_delta(os.path.join(deploy_dir, delta.DELTA_ZIP), str(tmp_path / "fresh"))
+    assert tree(tmp_path / "fresh") == fresh
+
+
+def test_unchanged_source_gives_an_empty_delta(tmp_path):
+    deploy_dir, server = redeploy(tmp_path)
+    delta.prepare(deploy_dir)
+    delta.commit(deploy_dir)
+    report = delta.prepare(deploy_dir)
+    assert report.changed == [] and report.deleted == []
+
+
+@pytest.mark.skipif(not all(shutil.which(tool) for tool in ("bash", "unzip", "sha256sum")),
+                    reason="needs bash, unzip and sha256sum")
+def test_apply_step_on_the_server(tmp_path):
+    deploy_dir, server = redeploy(tmp_path)
+    delta.prepare(deploy_dir)
+    shutil.copy(os.path.join(deploy_dir, delta.DELTA_ZIP), os.path.join(server, "src.delta.zip"))
+    script = delta.add_apply_step("#!/bin/bash\necho deployed\n")
+    assert delta.add_apply_step(script) == script
+    result = subprocess.run(["bash", "-c", script], env={**os.environ, "HOME": server}, capture_output=True,
+                            text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout == "deployed\n"
+    assert tree(server) == expected(deploy_dir, tmp_path)
+
+    shutil.copy(os.path.join(deploy_dir, delta.DELTA_ZIP), os.path.join(server, "src.delta.zip"))
+    result = subprocess.run(["bash", "-c", script], env={**os.environ, "HOME": server}, capture_output=True,
+                            text=True)
+    assert result.returncode == 0 and "already up to date" in result.stdout  # e.g. a new server got src.zip
+    assert tree(server) == expected(deploy_dir, tmp_path)
+
+    with open(os.path.join(server, delta.MANIFEST), "w") as f:
+        f.write("{}")
+    shutil.copy(os.path.join(deploy_dir, delta.DELTA_ZIP), os.path.join(server, "src.delta.zip"))
+    result = subprocess.run(["bash", "-c", script], env={**os.environ, "HOME": server}, capture_output=True,
+                            text=True)
+    assert result.returncode == 1 and "upload src.zip instead" in result.stderr
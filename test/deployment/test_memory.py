@@ -0,0 +1,69 @@
+from deployflow.core.deployment.memory import Conversation
+from deployflow.core.deployment.runner import CommandResult
+
+APPLY = """aws_security_group.web: Creating...
+aws_security_group.web: Creation complete after 2s [id=sg-0123]
+aws_instance.app: Creation complete after 31s [id=i-0abc]
+
+Apply complete! Resources: 2 added, 0 changed, 0 destroyed.
+
+Outputs:
+
+public_ip = "3.91.4.2"
+"""
+
+
+def test_short_conversation_is_verbatim():
+    conversation = Conversation("system", "write main.tf", budget=4000)
+    conversation.assistant("```hcl main.tf\nresource {}\n```")
+    conversation.wrote("main.tf", "resource {}")
+    conversation.ran("terraform init", CommandResult("Terraform has been successfully initialized!", "", 0, 1.5),
+                     follow="next stage")
+    assert conversation.messages == [
+        {"role": "system", "content": "system"},
+        {"role": "user", "content": "write main.tf"},
+        {"role": "assistant", "content": "```hcl main.tf\nresource {}\n```"},
+        {"role": "user", "content": "created file `main.tf`"},
+        {"role": "user", "content": "Result of `terraform init` (exit code 0, 1.5s):\n"
+                                    "Terraform has been successfully initialized!\n\n\nnext stage"},
+    ]
+
+
+def test_old_turns_are_summarized():
+    conversation = Conversation("system", "write main.tf", budget=4000, keep=2)
+    conversation.assistant("main.tf please")
+    conversation.wrote("main.tf", "resource \"aws_instance\" \"app\" {}")
+    conversation.assistant("```shell\nterraform apply -auto-approve\n```")
+    conversation.ran("terraform apply -auto-approve", CommandResult(APPLY, "", 0, 40.0))
+    conversation.assistant("```shell\nterraform apply\n```")
+    conversation.ran("terraform apply", CommandResult("", "│ Error: creating EC2 Instance: UnauthorizedOperation\n│", 1, 3.0))
+    conversation.assistant("```shell\nterraform output\n```")
+    conversation.ran("terraform output", CommandResult("public_ip = 3.91.4.2", "", 0, 0.5))
+    messages = conversation.messages
+    assert [message["role"] for message in messages] == ["system", "user", "assistant", "user", "assistant", "user"]
+    assert messages[2]["content"] == "```shell\nterraform apply\n```"
+    summary = messages[1]["content"]
+    assert "Summary of the 2 earlier steps" in summary
+    assert "- `terraform apply -auto-approve`: ok" in summary
+    assert "aws_security_group.web [id=sg-0123], aws_instance.app [id=i-0abc]" in summary
+    assert "Last apply: Apply complete! Resources: 2 added, 0 changed, 0 destroyed." in summary
+    assert 'public_ip = "3.91.4.2"' in summary
+    assert "=== file: main.tf\nresource \"aws_instance\" \"app\" {}\n===" in summary
+    assert "write main.tf" not in summary and "UnauthorizedOperation" not in summary
+
+
+def test_prompt_size_stays_flat_over_a_long_repair_loop():
+    conversation = Conversation("system " * 500, "write main.tf", budget=3000)
+    sizes = []
+    for i in range(60):
+        conversation.assistant(f"```hcl main.tf\n{'resource {}' * 100}\n```\ntry {i}")
+        conversation.wrote("main.tf", "resource {}\n" * (100 + i))
+        conversation.ran("terraform apply -auto-approve", CommandResult(
+            "aws_instance.app: Creating...\n" * 100, f"Error: timeout number {i % 5}\n" + "detail\n" * 100, 1, 60.0))
+        conversation.messages
+        sizes.append(conversation.tokens)
+    assert max(sizes) <= 3000
+    assert max(sizes[20:]) - min(sizes[20:]) < 300
+    summary = conversation.messages[1]["content"]
+    assert "(47 earlier commands not listed)" in summary
+    assert summary.count("timeout number") == 5
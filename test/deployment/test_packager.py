@@ -0,0 +1,104 @@
+import os
+import subprocess
+import zipfile
+
+import pytest
+
+from deployflow.core.deployment.packager import Ignore, package_source
+from test.analysis.test_fs import make_git_repo, make_hello_world, make_tar, make_zip
+
+EXTRA = {
+    ".gitignore": "__pycache__/\n*.log\n",
+    ".dockerignore": "secrets.env\n/docs\n",
+    "secrets.env": "TOKEN=1\n",
+    "docs/guide.md": "# guide\n",
+    "app/docs/api.md": "# api\n",
+    "app/.gitignore": "!keep.log\n",
+    "app/keep.log": "kept\n",
+    "app/debug.log": "debug\n",
+    "node_modules/left-pad/index.js": "module.exports = 1\n" * 1000,
+    "deploy.sh": "#!/bin/sh\necho deploy\n",
+}
+KEPT = {"README.md", ".gitignore", ".dockerignore", "app/app.py", "app/requirements.txt", "app/templates/index.html",
+        "app/static/style.css", "app/docs/api.md", "app/.gitignore", "app/keep.log", "deploy.sh"}
+
+
+def make_source(root):
+    make_hello_world(root)
+    for name, content in EXTRA.items():
+        path = os.path.join(root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+    os.chmod(os.path.join(root, "deploy.sh"), 0o755)
+    return root
+
+
+def check(root, dest, report, prefix="", kept=KEPT):
+    with zipfile.ZipFile(dest) as zf:
+        assert zf.testzip() is None
+        assert set(zf.namelist()) == {prefix + name for name in kept}
+        for name in kept:
+            with open(os.path.join(root, name), "rb") as f:
+                assert zf.read(prefix + name) == f.read()
+    assert report.files == len(kept)
+    assert report.ignored >= 4 and report.ignored_bytes > 18000
+    assert report.saved == report.bytes + report.ignored_bytes
+
+
+def test_dir(tmp_path):
+    root = make_source(str(tmp_path / "hello"))
+    os.makedirs(os.path.join(root, "app", "__pycache__"))
+    with open(os.path.join(root, "app", "__pycache__", "app.pyc"), "wb") as f:
+        f.write(b"\0" * 100)
+    report = package_source(root, str(tmp_path / "src.zip"))
+    check(root, str(tmp_path / "src.zip"), report)
+    with zipfile.ZipFile(tmp_path / "src.zip") as zf:
+        assert zf.getinfo("deploy.sh").external_attr >> 16 & 0o111
+    assert "Packaged 11 files" in str(report)
+
+
+def test_zip_members_pass_through(tmp_path):
+    root = make_source(str(tmp_path / "hello"))
+    source = make_zip(root, tmp_path / "hello.zip", "hello-main/")
+    with open(os.path.join(root, "app", "big.txt"), "w") as f:
+        f.write("x" * 100000)
+    with zipfile.ZipFile(source, "a", zipfile.ZIP_DEFLATED) as zf:
+        zf.write(os.path.join(root, "app", "big.txt"), "hello-main/app/big.txt")
+    report = package_source(source, str(tmp_path / "src.zip"))
+    check(root, str(tmp_path / "src.zip"), report, "hello-main/", KEPT | {"app/big.txt"})
+    with zipfile.ZipFile(source) as original, zipfile.ZipFile(tmp_path / "src.zip") as packaged:
+        big = packaged.getinfo("hello-main/app/big.txt")
+        assert big.compress_type == zipfile.ZIP_DEFLATED and big.compress_size < 1000
+        assert (big.CRC, big.compress_size) == (original.getinfo("hello-main/app/big.txt").CRC,
+                                                original.getinfo("hello-main/app/big.txt").compress_size)
+
+
+@pytest.mark.parametrize("suffix", ["tar", "tar.gz"])
+def test_tar(tmp_path, suffix):
+    root = make_source(str(tmp_path / "hello"))
+    report = package_source(make_tar(root, tmp_path / f"hello.{suffix}", "hello-main/"), str(tmp_path / "src.zip"))
+    check(root, str(tmp_path / "src.zip"), report, "hello-main/")
+
+
+def test_git(tmp_path):
+    root = str(tmp_path / "hello")
+    target = make_git_repo(root)
+    make_source(root)
+    git = ["git", "-C", root, "-c", "user.name=test", "-c", "user.email=test@example.com"]
+    subprocess.run(git + ["add", "-f", "."], check=True)  # force-added ignored files are left out too
+    subprocess.run(git + ["commit", "-qm", "extra"], check=True)
+    report = package_source(target, str(tmp_path / "src.zip"))
+    check(root, str(tmp_path / "src.zip"), report)
+
+
+def test_ignore_patterns():
+    ignore = Ignore([])
+    ignore.add("", "*.log\n!important.log\nbuild/\n/dist\ndocs/**/*.md\n[!a]*.tmp\n")
+    ignore.add("sub/", "local.txt\n")
+    assert ignore.ignored("a/b/c.log") and not ignore.ignored("a/important.log")
+    assert ignore.ignored("x/build", True) and ignore.ignored("x/build/out.js") and not ignore.ignored("x/build")
+    assert ignore.ignored("dist/a.js") and not ignore.ignored("x/dist/a.js")
+    assert ignore.ignored("docs/a/b/c.md") and ignore.ignored("docs/c.md") and not ignore.ignored("docs/c.txt")
+    assert ignore.ignored("b.tmp") and not ignore.ignored("a.tmp")
+    assert ignore.ignored("sub/deep/local.txt") and not ignore.ignored("local.txt")
@@ -0,0 +1,49 @@
+import sys
+import time
+
+import pytest
+
+from deployflow.core.deployment.runner import HeadTail, run
+
+PYTHON = f'"{sys.executable}" -c'
+
+
+def test_head_tail_keeps_both_ends():
+    buffer = HeadTail(5, 5)
+    for piece in ["ab", "cdefg", "hij", "klmnopq", "rs"]:
+        buffer.write(piece)
+    assert buffer.text() == "abcde\n<<Truncated output, 9 characters omitted>>\nopqrs"
+    short = HeadTail(5, 5)
+    short.write("0123456789")
+    assert short.text() == "0123456789"
+
+
+def test_streams_output_and_reports_exit_code():
+    seen = []
+    script = "import sys, time; print('first', flush=True); time.sleep(0.3); print('oops', file=sys.stderr); sys.exit(3)"
+    result = run(f'{PYTHON} "{script}"', on_output=lambda stream, text: seen.append((stream, text, time.monotonic())))
+    assert result.stdout == "first\n" and result.stderr == "oops\n"
+    assert result.returncode == 3 and not result.ok and not result.timed_out
+    assert result.duration >= 0.3
+    assert "".join(text for stream, text, _ in seen if stream == "stdout") == "first\n"
+    assert seen[-1][2] - seen[0][2] >= 0.25  # streamed live, not all at exit
+
+
+def test_large_output_is_bounded():
+    result = run(f'{PYTHON} "print(\'x\' * 5_000_000)"')
+    assert len(result.stdout) < 1100 and "4999001 characters omitted" in result.stdout
+
+
+def test_input_and_cwd(tmp_path):
+    result = run(f'{PYTHON} "import os; print(input(), os.getcwd())"', cwd=str(tmp_path), input="yes\n")
+    assert result.stdout.strip() == f"yes {tmp_path}"
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="process groups")
+def test_timeout_kills_the_process_group(tmp_path):
+    marker = tmp_path / "survived"
+    start = time.monotonic()
+    result = run(f"sleep 2 && touch {marker} & sleep 30", timeout=0.5)
+    assert result.timed_out and not result.ok and time.monotonic() - start < 5
+    time.sleep(2.5)
+    assert not marker.exists()
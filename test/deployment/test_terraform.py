@@ -0,0 +1,130 @@
+import json
+import os
+import shutil
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from deployflow.core.deployment import terraform
+
+MAIN_TF = """
+terraform {
+  required_providers {
+    aws = {
+      source  = "hashicorp/aws"
+      version = "~> 5.0"
+    }
+    docker = { source = "kreuzwerker/docker", version = "3.0.2" }
+  }
+}
+
+# resource "google_compute_instance" "commented" {}
+resource "aws_instance" "app" {}
+resource "random_id" "suffix" {
+  byte_length = 4
+}
+"""
+
+
+def deploy_dir(path, main_tf=MAIN_TF):
+    os.makedirs(path)
+    with open(os.path.join(path, "main.tf"), "w") as f:
+        f.write(main_tf)
+    return str(path)
+
+
+def test_providers_and_fingerprint():
+    assert terraform.providers(MAIN_TF) == ["aws=hashicorp/aws@~> 5.0", "docker=kreuzwerker/docker@3.0.2",
+                                            "random=hashicorp/random@"]
+    reformatted = MAIN_TF.replace("  ", "    ").replace('resource "random_id"', 'resource "random_string"')
+    assert terraform.fingerprint(reformatted) == terraform.fingerprint(MAIN_TF)
+    assert terraform.fingerprint(MAIN_TF.replace("~> 5.0", "~> 4.0")) != terraform.fingerprint(MAIN_TF)
+
+
+def test_cli_config_uses_the_shared_cache_and_mirror(settings, tmp_path):
+    cache = tmp_path / "terraform"
+    environment = terraform.env()
+    with open(environment["TF_CLI_CONFIG_FILE"]) as f:
+        assert f.read() == f'plugin_cache_dir = "{cache.as_posix()}/plugins"\n' \
+                           'plugin_cache_may_break_dependency_lock_file = true\n'
+    settings["deployment", "terraform_mirror"] = str(tmp_path / "mirror")
+    with open(terraform.env()["TF_CLI_CONFIG_FILE"]) as f:
+        assert f'filesystem_mirror {{\n    path = "{(tmp_path / "mirror").as_posix()}"' in f.read()
+
+
+def test_same_provider_set_starts_warm(settings, tmp_path):
+    first = deploy_dir(tmp_path / "first")
+    assert not terraform.warm(first)
+    provider = os.path.join(first, ".terraform", "providers", "registry.terraform.io", "hashicorp", "aws", "5.1.0")
+    os.makedirs(provider)
+    with open(os.path.join(provider, "terraform-provider-aws"), "w") as f:
+        f.write("binary")
+    with open(os.path.join(first, terraform.LOCK_FILE), "w") as f:
+        f.write("lock")
+    assert str(terraform.save(first, 30.0, False)) == \
+           "terraform init took 30.0s, providers cached for the next deployments"
+
+    second = deploy_dir(tmp_path / "second")
+    assert terraform.warm(second)
+    with open(os.path.join(second, terraform.LOCK_FILE)) as f:
+        assert f.read() == "lock"
+    assert os.path.exists(os.path.join(second, ".terraform", "providers", "registry.terraform.io", "hashicorp", "aws",
+                                       "5.1.0", "terraform-provider-aws"))
+    report = terraform.save(second, 2.5, True)
+    assert report.saved == 27.5 and "27.5s saved" in str(report)
+
+    assert not terraform.warm(second)  # already initialized
+    assert not terraform.warm(deploy_dir(tmp_path / "other", MAIN_TF.replace("3.0.2", "3.0.1")))
+
+
+@pytest.mark.skipif(not shutil.which("terraform"), reason="needs terraform")
+def test_offline_init_from_a_filesystem_mirror(settings, tmp_path):
+    mirror = tmp_path / "mirror" / "registry.terraform.io" / "hashicorp" / "null" / "3.2.0"
+    version = subprocess.run(["terraform", "version", "-json"], capture_output=True, text=True, check=True).stdout
+    platform = json.loads(version)["platform"]
+    os.makedirs(mirror / platform)
+    with open(mirror / platform / "terraform-provider-null_v3.2.0", "w") as f:
+        f.write("not executed by init")
+    settings["deployment", "terraform_mirror"] = str(tmp_path / "mirror")
+    main_tf = 'terraform {\n  required_providers {\n    null = { source = "hashicorp/null", version = "3.2.0" }\n  }\n}\n'
+    for name in ("first", "second"):
+        target = deploy_dir(tmp_path / name, main_tf)
+        reused = terraform.warm(target)
+        assert reused == (name == "second")
+        result = subprocess.run(["terraform", "init", "-input=false"], cwd=target, env=terraform.env(),
+                                capture_output=True, text=True)
+        assert result.returncode == 0, result.stderr
+        terraform.save(target, 1.0, reused)
+    assert os.listdir(tmp_path / "terraform" / "plugins" / "registry.terraform.io" / "hashicorp" / "null")
+
+
+def test_concurrent_saves_of_one_provider_set(settings, tmp_path):
+    targets = []
+    for i in range(8):
+        target = deploy_dir(tmp_path / f"deploy{i}")
+        with open(os.path.join(target, terraform.LOCK_FILE), "w") as f:
+            f.write("lock")
+        targets.append(target)
+    with ThreadPoolExecutor(8) as pool:
+        reports = list(pool.map(lambda target: terraform.save(target, 1.0, False), targets))
+    assert len(reports) == 8
+    warm = tmp_path / "terraform" / "warm"
+    assert [name for name in os.listdir(warm) if name.endswith(".tmp")] == []
+    assert terraform.warm(deploy_dir(tmp_path / "next"))
+
+
+def test_locked_excludes_other_threads(settings):
+    inside, overlaps = [0], []
+
+    def hold(_):
+        with terraform.locked():
+            inside[0] += 1
+            overlaps.append(inside[0])
+            time.sleep(0.01)
+            inside[0] -= 1
+
+    with ThreadPoolExecutor(4) as pool:
+        list(pool.map(hold, range(8)))
+    assert overlaps == [1] * 8
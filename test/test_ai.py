@@ -0,0 +1,177 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from openai import RateLimitError
+
+from deployflow.core import trace
+from deployflow.core.ai import MODEL, AIClient, Cassette, CassetteMiss
+
+
+@contextmanager
+def stub(replies, delay=0.0):
+    """
+    Local OpenAI-compatible chat completions server.
+
+    `replies` are served in order, the last one repeats: a list of text pieces to stream, an HTTP status code to fail
+    with, or "hang" to never answer.
+    """
+    state = {"requests": [], "active": 0, "max_active": 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            with lock:
+                state["requests"].append(body)
+                reply = replies[min(len(state["requests"]), len(replies)) - 1]
+                state["active"] += 1
+                state["max_active"] = max(state["max_active"], state["active"])
+            try:
+                if reply == "hang":
+                    time.sleep(2)
+                    return
+                if isinstance(reply, int):
+                    payload = json.dumps({"error": {"message": "nope", "type": "error"}}).encode()
+                    self.send_response(reply)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                for piece in reply:
+                    chunk = {"id": "1", "object": "chat.completion.chunk", "created": 0, "model": body["model"],
+                             "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                    self.wfile.flush()
+                    time.sleep(delay)
+                if body.get("stream_options", {}).get("include_usage"):
+                    usage = {"prompt_tokens": 7, "completion_tokens": len(reply), "total_tokens": 7 + len(reply)}
+                    chunk = {"id": "1", "object": "chat.completion.chunk", "created": 0, "model": body["model"],
+                             "choices": [], "usage": usage}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.write(b"data: [DONE]\n\n")
+            finally:
+                with lock:
+                    state["active"] -= 1
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}/v1", state
+    finally:
+        server.shutdown()
+
+
+def test_streams_tokens():
+    with stub([["Hello", ", ", "world"]]) as (endpoint, state):
+        client = AIClient("key", endpoint, max_retries=0)
+        tokens = []
+        assert client.complete([{"role": "user", "content": "hi"}], on_token=tokens.append, max_tokens=5) \
+               == "Hello, world"
+        assert tokens == ["Hello", ", ", "world"]
+        assert state["requests"][0]["stream"] is True and state["requests"][0]["max_tokens"] == 5
+
+
+def test_retries_rate_limits_and_server_errors():
+    with stub([429, 503, ["ok"]]) as (endpoint, state):
+        client = AIClient("key", endpoint, max_retries=3, backoff=0.01)
+        assert client.complete([{"role": "user", "content": "hi"}]) == "ok"
+        assert len(state["requests"]) == 3
+
+
+def test_gives_up_after_max_retries():
+    with stub([429]) as (endpoint, state):
+        client = AIClient("key", endpoint, max_retries=2, backoff=0.01)
+        with pytest.raises(RateLimitError):
+            client.complete([{"role": "user", "content": "hi"}])
+        assert len(state["requests"]) == 3
+
+
+def test_timeout_is_retried():
+    with stub(["hang", ["ok"]]) as (endpoint, state):
+        client = AIClient("key", endpoint, timeout=0.5, max_retries=1, backoff=0.01)
+        assert client.complete([{"role": "user", "content": "hi"}]) == "ok"
+        assert len(state["requests"]) == 2
+
+
+def test_concurrency_is_bounded():
+    with stub([["a", "b", "c"]], delay=0.05) as (endpoint, state):
+        client = AIClient("key", endpoint, max_concurrency=2, max_retries=0)
+
+        async def run():
+            return await asyncio.gather(*(client.acomplete([{"role": "user", "content": str(i)}]) for i in range(6)))
+
+        assert asyncio.run(run()) == ["abc"] * 6
+        assert state["max_active"] == 2
+
+
+def test_cassette_record_then_replay_offline(tmp_path):
+    path = str(tmp_path / "cassette.json")
+    messages = [{"role": "system", "content": "sys"}, {"role": "user", "content": "hi"}]
+    with stub([["Hello", " there"]]) as (endpoint, state):
+        client = AIClient("key", endpoint, max_retries=0)
+        assert Cassette(path, "record", lambda: client).complete(messages) == "Hello there"
+        assert len(state["requests"]) == 1
+
+    def offline():
+        raise AssertionError("replay contacted the AI")
+
+    replay = Cassette(path, "replay", offline)
+    tokens = []
+    assert replay.complete([{"role": "system", "content": "sys\r\n"}, {"role": "user", "content": "hi  "}],
+                           on_token=tokens.append) == "Hello there"
+    assert tokens == ["Hello there"]
+    assert asyncio.run(Cassette(path, "replay", offline).acomplete(messages)) == "Hello there"
+
+
+def test_cassette_replay_falls_back_to_call_order(tmp_path, caplog):
+    path = str(tmp_path / "cassette.json")
+    with stub([["first"], ["second"]]) as (endpoint, state):
+        client = AIClient("key", endpoint, max_retries=0)
+        recorder = Cassette(path, "record", lambda: client)
+        recorder.complete([{"role": "user", "content": "terraform init took 1.2s"}])
+        recorder.complete([{"role": "user", "content": "next"}])
+    changed = [{"role": "user", "content": "terraform init took 3.4s"}]
+    with pytest.raises(CassetteMiss, match=Cassette.key(MODEL, changed)):
+        Cassette(path, "replay").complete(changed)
+    replay = Cassette(path, "replay", fallback=True)
+    assert replay.complete([{"role": "user", "content": "terraform init took 3.4s"}]) == "first"
+    assert replay.complete([{"role": "user", "content": "next"}]) == "second"
+    assert [record.levelname for record in caplog.records if "cassette" in record.getMessage()] == ["WARNING"]
+    with pytest.raises(CassetteMiss):
+        replay.complete([{"role": "user", "content": "one too many"}])
+
+
+def test_cassette_passthrough_does_not_record(tmp_path):
+    path = str(tmp_path / "cassette.json")
+    with stub([["live"]]) as (endpoint, state):
+        client = AIClient("key", endpoint, max_retries=0)
+        assert Cassette(path, "passthrough", lambda: client).complete([{"role": "user", "content": "hi"}]) == "live"
+    assert not os.path.exists(path)
+    with pytest.raises(ValueError):
+        Cassette(path, "rewind")
+
+
+def test_calls_are_traced(tmp_path, capsys):
+    with stub([429, ["a", "b"]]) as (endpoint, state):
+        client = AIClient("key", endpoint, max_retries=1, backoff=0.01)
+        with trace.run(str(tmp_path / "run.json")):
+            client.complete([{"role": "user", "content": "hi"}])
+    with open(tmp_path / "run.json") as f:
+        events = json.load(f)["traceEvents"]
+    assert [(event["name"], event["args"]["attempt"]) for event in events] == [("chat", 0), ("chat", 1)]
+    assert events[1]["args"]["prompt_tokens"] == 7 and events[1]["args"]["completion_tokens"] == 2
+    assert "first_token_ms" in events[1]["args"]
+    assert "llm tokens: 7 prompt, 2 completion" in capsys.readouterr().out
@@ -0,0 +1,193 @@
+import builtins
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from deployflow.core import ai, batch
+from deployflow.core.analysis import analyze
+from deployflow.core.deployment import ai_deployer
+from deployflow.logger import logger
+
+MANIFEST = """
+workers: 2
+llm_concurrency: 3
+defaults:
+  command: Deploy this app on AWS
+  target: aws
+jobs:
+  - repo: services/api
+    regions: [us-east-1, eu-west-1]
+  - id: web
+    repo: https://github.com/Arvo-AI/hello_world.git
+    command: Deploy the Flask app
+    evidence_file: web.json
+    analyze_only: true
+  - repo: https://github.com/Arvo-AI/hello_world.git
+"""
+
+
+@pytest.fixture
+def fake_ai(monkeypatch):
+    monkeypatch.setattr(ai, "get_ai", lambda: None)
+    monkeypatch.setattr(ai, "_max_concurrency", None)
+
+
+def write_manifest(tmp_path, jobs, **settings):
+    path = tmp_path / "fleet.json"
+    path.write_text(json.dumps({**settings, "jobs": jobs}))
+    return str(path)
+
+
+def test_manifest_expands_regions_and_defaults(tmp_path):
+    path = tmp_path / "fleet.yaml"
+    path.write_text(MANIFEST)
+    settings, jobs = batch.load_manifest(str(path))
+    assert settings == {"workers": 2, "llm_concurrency": 3, "output": str(tmp_path / "fleet_batch")}
+    assert [(job.id, job.region) for job in jobs] == [
+        ("api-us-east-1", "us-east-1"), ("api-eu-west-1", "eu-west-1"), ("web", None), ("hello_world", None)]
+    assert jobs[0].repo == str(tmp_path / "services" / "api") and jobs[0].command == "Deploy this app on AWS"
+    assert jobs[0].target == "aws"
+    assert jobs[2].command == "Deploy the Flask app" and jobs[2].evidence_file == str(tmp_path / "web.json")
+    assert jobs[2].analyze_only and jobs[3].repo == "https://github.com/Arvo-AI/hello_world.git"
+
+
+def test_manifest_rejects_duplicate_ids(tmp_path):
+    path = write_manifest(tmp_path, [{"repo": "a/api", "command": "x"}, {"repo": "b/api", "command": "y"}])
+    with pytest.raises(ValueError, match="Duplicate job id api"):
+        batch.load_manifest(path)
+
+
+def test_jobs_run_bounded_and_isolated(tmp_path, monkeypatch, fake_ai):
+    running, peak, lock = [0], [0], threading.Lock()
+
+    def analyze_repository(repo, command, use_cache):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        print(f"analyzing {repo}")
+        logger.info(f"logged by {repo}")
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+        if repo.endswith("broken"):
+            raise RuntimeError("no Dockerfile")
+        return {"target": "AWS"}
+
+    deployed = {}
+
+    def deploy_target(repo, task, evidences, target_dir=None, reuse=True):
+        print(f"deploying {repo} to {evidences['region']}")
+        deployed[os.path.basename(repo)] = target_dir
+        return True
+
+    monkeypatch.setattr(analyze, "analyze_repository", analyze_repository)
+    monkeypatch.setattr(ai_deployer, "deploy_target", deploy_target)
+    path = write_manifest(tmp_path, [{"id": repo, "repo": repo, "command": "deploy", "region": "us-east-1"}
+                                     for repo in ("one", "two", "broken", "four")], workers=2)
+    results = batch.run_batch(path)
+    assert peak[0] == 2
+    assert [(result.job.id, result.status) for result in results] == [
+        ("one", "deployed"), ("two", "deployed"), ("broken", "error"), ("four", "deployed")]
+    assert results[2].message == "RuntimeError: no Dockerfile"
+    root = tmp_path / "fleet_batch"
+    log = (root / "one" / "job.log").read_text()
+    assert "analyzing" in log and "logged by" in log and "deploying" in log
+    assert "two" not in log and "broken" not in log
+    assert "no Dockerfile" in (root / "broken" / "job.log").read_text()
+    assert deployed["one"] == str(root / "one" / "deploy")
+    assert json.loads((root / "one" / "evidences.json").read_text()) == {"target": "aws", "region": "us-east-1"}
+    report = json.loads((root / "report.json").read_text())
+    assert [job["status"] for job in report["jobs"]] == ["deployed", "deployed", "error", "deployed"]
+
+
+def test_fatal_error_fails_only_its_job(tmp_path, monkeypatch, fake_ai):
+    def deploy_target(repo, task, evidences, target_dir=None, reuse=True):
+        if repo.endswith("bad"):
+            print("\033[91mSSH key missing\033[0m")
+            raise SystemExit(1)
+        return not repo.endswith("gave-up")
+
+    monkeypatch.setattr(analyze, "analyze_repository", lambda repo, command, use_cache: {"target": "aws"})
+    monkeypatch.setattr(ai_deployer, "deploy_target", deploy_target)
+    path = write_manifest(tmp_path, [{"repo": repo, "command": "deploy"} for repo in ("bad", "gave-up", "good")])
+    results = batch.run_batch(path, workers=3)
+    assert [(result.status, result.message) for result in results] == [
+        ("failed", "SSH key missing"), ("failed", "the AI gave up, see the log"), ("deployed", "")]
+
+
+def test_questions_are_serialized_and_prefixed(tmp_path, monkeypatch, fake_ai, capsys):
+    asking, prompts = [0], []
+
+    def fake_input(prompt):
+        asking[0] += 1
+        assert asking[0] == 1
+        prompts.append(prompt)
+        time.sleep(0.02)
+        asking[0] -= 1
+        return "AWS"
+
+    monkeypatch.setattr(builtins, "input", fake_input)
+    monkeypatch.setattr(analyze, "analyze_repository", lambda repo, command, use_cache: {"target": None})
+    path = write_manifest(tmp_path, [{"repo": repo, "command": "deploy", "analyze_only": True}
+                                     for repo in ("a", "b", "c")])
+    results = batch.run_batch(path, workers=3)
+    assert all(result.status == "analyzed" for result in results)
+    assert sorted(prompts) == [f"[{job}] Enter deployment target (aws): " for job in ("a", "b", "c")]
+    assert "Enter deployment target (aws): AWS" in (tmp_path / "fleet_batch" / "a" / "job.log").read_text()
+    out = capsys.readouterr().out
+    assert "3 jobs: 3 analyzed" in out
+
+
+def test_limit_applies_to_existing_client(monkeypatch):
+    monkeypatch.setattr(ai, "_max_concurrency", None)
+    client = ai.AIClient("key", "http://127.0.0.1:1", max_concurrency=8)
+    monkeypatch.setattr(ai, "_client", client)
+    ai.limit(2)
+    assert client.max_concurrency == 2 and client._semaphore is None and ai._max_concurrency == 2
+
+
+def test_regions_share_one_analysis(tmp_path, monkeypatch, fake_ai):
+    calls = []
+
+    def analyze_repository(repo, command, use_cache):
+        calls.append(repo)
+        time.sleep(0.05)
+        return {"target": "aws", "ports": [5000]}
+
+    def deploy_target(repo, task, evidences, target_dir=None, reuse=True):
+        evidences["ports"].append(evidences.get("region"))
+        return True
+
+    monkeypatch.setattr(analyze, "analyze_repository", analyze_repository)
+    monkeypatch.setattr(ai_deployer, "deploy_target", deploy_target)
+    path = write_manifest(tmp_path, [{"repo": "api", "command": "deploy", "regions": ["us-east-1", "eu-west-1"]},
+                                     {"repo": "web", "command": "deploy"}])
+    results = batch.run_batch(path, workers=3)
+    assert all(result.ok for result in results)
+    assert sorted(calls) == [str(tmp_path / "api"), str(tmp_path / "web")]
+    root = tmp_path / "fleet_batch"
+    for region in ("us-east-1", "eu-west-1"):
+        evidences = json.loads((root / f"api-{region}" / "evidences.json").read_text())
+        assert evidences == {"target": "aws", "ports": [5000], "region": region}
+
+
+def test_command_stderr_goes_to_the_job_log(tmp_path, monkeypatch, fake_ai, capsys):
+    from deployflow.core import policy
+    from deployflow.core.deployment import actions
+
+    def deploy_target(repo, task, evidences, target_dir=None, reuse=True):
+        return actions.execute_command(str(tmp_path), f"echo out-{repo[-1]} && echo err-{repo[-1]} >&2").ok
+
+    monkeypatch.setattr(analyze, "analyze_repository", lambda repo, command, use_cache: {"target": "aws"})
+    monkeypatch.setattr(ai_deployer, "deploy_target", deploy_target)
+    monkeypatch.setattr(actions, "get_policy", lambda: policy.Policy(default=policy.ALLOW))
+    path = write_manifest(tmp_path, [{"repo": repo, "command": "deploy"} for repo in ("a", "b")])
+    batch.run_batch(path, workers=2)
+    for repo in ("a", "b"):
+        log = (tmp_path / "fleet_batch" / repo / "job.log").read_text()
+        assert f"out-{repo}" in log and f"err-{repo}" in log
+    captured = capsys.readouterr()
+    assert "err-" not in captured.err and "out-" not in captured.out
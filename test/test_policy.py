@@ -0,0 +1,112 @@
+import builtins
+
+import pytest
+
+from deployflow.core import console, policy
+from deployflow.core.deployment import actions
+from deployflow.core.policy import ALLOW, ASK, DENY, Policy
+
+POLICY = """
+commands:
+  allow:
+    - ssh-keygen *
+    - chmod 400 id_rsa
+    - terraform init*
+    - terraform apply -auto-approve*
+    - echo *
+  deny:
+    - terraform destroy*
+answers:
+  port: "5000"
+  "data(base)?": none
+deploy_dir: "{repo}_ci"
+target: aws
+"""
+
+
+@pytest.fixture
+def no_input(monkeypatch):
+    def fail(prompt):
+        raise AssertionError(f"blocked on input: {prompt}")
+
+    monkeypatch.setattr(builtins, "input", fail)
+    monkeypatch.setattr(console, "_interactive", False)
+    monkeypatch.setattr(policy, "_policy", None)
+
+
+def test_commands():
+    rules = Policy(["terraform init*", "terraform apply -auto-approve*", "cd *"], ["terraform destroy*"])
+    assert rules.check("terraform init -upgrade") == ALLOW
+    assert rules.check("  terraform   apply -auto-approve  ") == ALLOW
+    assert rules.check("cd infra && terraform init") == ALLOW
+    assert rules.check("terraform init && rm -rf ~") == ASK
+    assert rules.check("terraform init; terraform destroy -auto-approve") == DENY
+    assert rules.check("terraform plan") == ASK
+    assert Policy(default=DENY).check("ls") == DENY
+    with pytest.raises(ValueError):
+        Policy(default="maybe")
+
+
+@pytest.mark.parametrize("command", [
+    "terraform init & terraform destroy -auto-approve",
+    "terraform init $(rm -rf ~)",
+    "terraform init `rm -rf ~`",
+    "terraform apply -auto-approve > /etc/passwd",
+    "terraform apply -auto-approve < plan",
+])
+def test_unparsed_shell_syntax_is_never_allowed(command):
+    rules = Policy(["terraform init*", "terraform apply -auto-approve*"])
+    assert rules.check(command) == ASK
+    assert Policy(["terraform *"], default=DENY).check(command) == DENY
+    assert rules.check("terraform apply -auto-approve 2>&1") == ALLOW
+    assert rules.check("terraform init >/dev/null") == ALLOW
+
+
+@pytest.mark.parametrize("command", [
+    "terraform -chdir=. destroy",
+    "terraform -chdir=infra destroy -auto-approve",
+    "sudo terraform destroy",
+    "cd infra && env TF_LOG=1 terraform destroy",
+    "sh -c 'terraform init; terraform destroy'",
+])
+def test_deny_matches_sub_commands(command):
+    rules = Policy(["*"], ["terraform destroy*"])
+    assert rules.check(command) == DENY
+    assert rules.check("terraform plan -destroy") == ALLOW
+
+
+def test_load(tmp_path):
+    path = tmp_path / "policy.yaml"
+    path.write_text(POLICY)
+    rules = Policy.load(str(path))
+    assert rules.check("ssh-keygen -t rsa -b 4096 -C \"app\" -f id_rsa -N \"\"") == ALLOW
+    assert rules.answer("Which PORT does the app listen on?") == "5000"
+    assert rules.answer("Does it need a database?") == "none"
+    assert rules.answer("Which region?") is None
+    assert rules.directory("helloworld") == "helloworld_ci" and rules.target == "aws"
+    assert Policy().directory("helloworld") is None
+
+
+def test_non_interactive_ask_fails_fast(no_input):
+    with pytest.raises(SystemExit):
+        console.ask("Enter deployment target (aws): ")
+
+
+def test_non_interactive_ask_takes_the_default(no_input, capsys):
+    assert console.ask("Enter deployment target (aws): ", "aws") == "aws"
+    assert "Enter deployment target (aws): aws (non-interactive default)" in capsys.readouterr().out
+
+
+def test_allowed_command_runs_without_prompt(tmp_path, no_input, capsys):
+    policy._policy = Policy(["echo *"])
+    result = actions.execute_command(str(tmp_path), "echo hello")
+    assert result.ok and "hello" in capsys.readouterr().out
+
+
+def test_denied_and_unlisted_commands_fail_before_running(tmp_path, no_input):
+    policy._policy = Policy(["echo *"], ["touch *"])
+    with pytest.raises(SystemExit):
+        actions.execute_command(str(tmp_path), "touch denied")
+    with pytest.raises(SystemExit):
+        actions.execute_command(str(tmp_path), "echo ok && touch unlisted")
+    assert not list(tmp_path.iterdir())
@@ -0,0 +1,58 @@
+import os
+import subprocess
+import sys
+
+BUDGET_MS = 100  # deployflow modules imported by `deployflow --help`, typer included
+HEAVY = ["openai", "git", "requests", "httpx", "rich", "yaml", "sqlite3", "configparser", "zipfile", "tarfile",
+         "deployflow.config", "deployflow.logger", "deployflow.core.ai", "deployflow.core.analysis",
+         "deployflow.core.deployment"]
+
+
+def import_times(*args):
+    """Run python with `-X importtime`, returns the result and the cumulative microseconds of each top-level import."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    result = subprocess.run([sys.executable, "-X", "importtime", *args], capture_output=True, text=True, env=env)
+    imports = {}
+    for line in result.stderr.splitlines():
+        parts = line.split("|")
+        if not line.startswith("import time:") or len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2][1:]
+        imports[name.strip()] = (int(parts[1]), len(name) - len(name.lstrip()) == 0)
+    return result, imports
+
+
+def heavy(imports):
+    """Heavy modules imported, leaving out those the interpreter imports on its own (e.g. from .pth files)."""
+    _, baseline = import_times("-c", "pass")
+    return sorted(name for name in imports if name not in baseline for module in HEAVY
+                  if name == module or name.startswith(module + "."))
+
+
+def test_help_within_budget():
+    times = []
+    for _ in range(3):  # the first run may compile the modules
+        result, imports = import_times("-m", "deployflow", "--help")
+        assert result.returncode == 0, result.stderr
+        assert "deploy" in result.stdout and "evidence" in result.stdout
+        assert heavy(imports) == []
+        times.append(sum(cumulative for name, (cumulative, top) in imports.items()
+                         if top and name.startswith("deployflow")))
+    assert min(times) / 1000 < BUDGET_MS, f"deployflow --help imports took {min(times) / 1000:.0f} ms"
+
+
+def test_submodules_do_not_import_the_cli():
+    result, imports = import_times("-c", "import deployflow.core.batch, deployflow.core.analysis.fs as fs; "
+                                         "assert fs.identify_target('app.zip') == ('zip', 'app')")
+    assert result.returncode == 0, result.stderr
+    assert [name for name in heavy(imports) if not name.startswith("deployflow")] == []
+    assert "typer" not in imports
+
+
+def test_config_is_read_on_first_use(tmp_path):
+    (tmp_path / ".deployflow.ini").write_text("[ai]\nendpoint = https://example.com\n")
+    code = ("import deployflow.config as c; assert c.config is None; "
+            "assert c.get_val('ai', 'endpoint') == 'https://example.com'; assert c.config is not None")
+    env = dict(os.environ, HOME=str(tmp_path), USERPROFILE=str(tmp_path), PYTHONPATH=os.pathsep.join(sys.path))
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env)
+    assert result.returncode == 0, result.stderr
@@ -0,0 +1,56 @@
+import json
+import threading
+import time
+
+from deployflow.core import trace
+from deployflow.core.analysis.fs import init_target
+from test.analysis.test_fs import make_hello_world
+
+
+def test_spans_are_no_ops_when_not_tracing():
+    def fn(x):
+        return x
+
+    assert trace.traced(fn, "fn") is fn
+    with trace.span("idle", "phase", a=1) as args:
+        args["b"] = 2
+    assert not trace.enabled()
+
+
+def test_run_writes_chrome_trace_and_lines(tmp_path, capsys):
+    path = str(tmp_path / "run.json")
+    with trace.run(path):
+        with trace.span("analysis", "phase") as args:
+            args["hits"] = 3
+            def command():
+                with trace.span("command", "subprocess", command="sleep"):
+                    time.sleep(0.01)
+
+            worker = threading.Thread(target=command)
+            worker.start()
+            worker.join()
+    with open(path) as f:
+        events = json.load(f)["traceEvents"]
+    with open(str(tmp_path / "run.jsonl")) as f:
+        lines = [json.loads(line) for line in f]
+    assert events == lines
+    assert [event["name"] for event in events] == ["command", "analysis"]
+    assert events[1]["args"] == {"hits": 3} and events[1]["ph"] == "X"
+    assert events[0]["dur"] >= 10_000 and events[0]["ts"] >= events[1]["ts"]
+    assert events[0]["tid"] != events[1]["tid"]
+    out = capsys.readouterr().out
+    assert "subprocess" in out and "% wall" in out and "Trace written to" in out
+    assert not trace.enabled()
+
+
+def test_fs_operations_are_traced(tmp_path):
+    root = make_hello_world(str(tmp_path / "hello_world"))
+    with trace.run(str(tmp_path / "run.json")):
+        ls, cat, close = init_target(root)
+        ls("app/")
+        cat("app/app.py")
+        close()
+    with open(tmp_path / "run.json") as f:
+        events = json.load(f)["traceEvents"]
+    assert [(event["cat"], event["name"], event["args"]["target"]) for event in events] == [
+        ("fs", "open", root), ("fs", "ls", "app/"), ("fs", "cat", "app/app.py")]